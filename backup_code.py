@@ -1,21 +1,19 @@
 import streamlit as st
-import pandas as pd
 import snowflake.connector
 import duckdb
 
-def compare_tables(source_table, target_table, sf_config, duckdb_path):
+from keyed_diff import keyed_diff
+
+def compare_tables(source_table, target_table, sf_config, duckdb_path, key_columns):
     try:
         # --- Load Snowflake data ---
         sf_conn = snowflake.connector.connect(**sf_config)
         sf_cursor = sf_conn.cursor()
         sf_cursor.execute(f"SELECT * FROM {source_table}")
-        sf_data = sf_cursor.fetchall()
-        sf_columns = [col[0] for col in sf_cursor.description]
+        df_sf = sf_cursor.fetch_pandas_all()
         sf_cursor.close()
         sf_conn.close()
 
-        df_sf = pd.DataFrame(sf_data, columns=sf_columns)
-
         # --- Load DuckDB data ---
         duck = duckdb.connect(duckdb_path)
         df_duck = duck.execute(f"SELECT * FROM {target_table}").fetchdf()
@@ -24,47 +22,38 @@ def compare_tables(source_table, target_table, sf_config, duckdb_path):
         # --- Normalize column names ---
         df_sf.columns = [col.lower() for col in df_sf.columns]
         df_duck.columns = [col.lower() for col in df_duck.columns]
+        key_columns = [col.lower() for col in key_columns]
 
         # --- Align by common columns ---
         common_cols = sorted(set(df_sf.columns).intersection(set(df_duck.columns)))
-        df_sf = df_sf[common_cols].reset_index(drop=True)
-        df_duck = df_duck[common_cols].reset_index(drop=True)
-
-        # --- Trim to smallest row count ---
-        min_len = min(len(df_sf), len(df_duck))
-        df_sf = df_sf.iloc[:min_len]
-        df_duck = df_duck.iloc[:min_len]
+        missing_keys = [col for col in key_columns if col not in common_cols]
+        if missing_keys:
+            st.error(f"❌ Key column(s) not present on both sides: {', '.join(missing_keys)}")
+            return
 
-        # --- Compare row by row ---
-        has_mismatch = False
-        for i in range(min_len):
-            mismatched_cols = [col for col in common_cols if df_sf.at[i, col] != df_duck.at[i, col]]
-            if mismatched_cols:
-                has_mismatch = True
-                st.markdown(f"### 🔎 Row {i+1} Mismatch")
+        # --- Join on the key columns and compare all columns vectorized ---
+        differences, removed, added, counts = keyed_diff(df_sf[common_cols], df_duck[common_cols], key_columns)
 
-                source_row = pd.DataFrame({
-                    "Source Table": [f"Row {i+1}"] * len(mismatched_cols),
-                    "Column": mismatched_cols,
-                    "Value": [df_sf.at[i, col] for col in mismatched_cols]
-                })
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Changed rows", f"{counts['changed']:,}")
+        m2.metric("Only in Snowflake (removed)", f"{counts['removed']:,}")
+        m3.metric("Only in DuckDB (added)", f"{counts['added']:,}")
 
-                target_row = pd.DataFrame({
-                    "Target Table": [f"Row {i+1}"] * len(mismatched_cols),
-                    "Column": mismatched_cols,
-                    "Value": [df_duck.at[i, col] for col in mismatched_cols]
-                })
+        if not any(counts.values()):
+            st.success("✅ No mismatches found between Snowflake and DuckDB.")
+            return
 
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.markdown("🟦 **Snowflake (Source)**")
-                    st.dataframe(source_row, use_container_width=True)
-                with col2:
-                    st.markdown("🟨 **DuckDB (Target)**")
-                    st.dataframe(target_row, use_container_width=True)
+        if not differences.empty:
+            st.markdown("### 🔎 Column Mismatches")
+            st.dataframe(differences, use_container_width=True)
 
-        if not has_mismatch:
-            st.success("✅ No mismatches found between Snowflake and DuckDB.")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("🟦 **Only in Snowflake (Source)**")
+            st.dataframe(removed, use_container_width=True)
+        with col2:
+            st.markdown("🟨 **Only in DuckDB (Target)**")
+            st.dataframe(added, use_container_width=True)
 
     except Exception as e:
         st.error(f"❌ Error during comparison: {e}")
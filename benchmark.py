@@ -0,0 +1,290 @@
+"""Synthetic benchmark for the compare pipeline.
+
+    python benchmark.py --rows 1e3 1e5 1e7 --columns 8 --diff-rate 0.01 --duplicate-rate 0.001
+
+For every row count a source and a target table are generated in a scratch DuckDB file
+and pushed through the same stages as the Streamlit pages: fetch (reading the source as
+Arrow batches, with a local DuckDB table standing in for Snowflake), stage (appending
+those batches to a temp table), normalize, diff, store (copy into the result viewer's
+store) and render (first page of HTML). Each case runs in a fresh process so its peak
+RSS is its own. One JSON line per case is appended to the results file and compared
+with the previous run of the same case to flag regressions.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import duckdb
+
+from compare_engine import checksum_compare, hashed_compare, normalize_columns, streaming_compare
+from connections import duckdb_connection
+from result_viewer import fetch_page, render_page_html, save_arrow_result, save_relation_result, save_rows_result
+from run_profile import peak_rss_mb
+from sql_diff import ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, diff_relations, fetch_columns, quote_ident
+from streaming_diff import DEFAULT_MEMORY_BUDGET_MB
+from transfer import stream_arrow_batches_to_duckdb
+
+# ---------- Configuration ----------
+RESULTS_FILE = "benchmark_results.jsonl"
+DEFAULT_ROWS = [1_000, 10_000, 100_000, 1_000_000]
+SOURCE_TABLE = "bench_source"
+TARGET_TABLE = "bench_target"
+STAGED_TABLE = "bench_staged"
+SOURCE_BATCH_ROWS = 50_000     # roughly the size of a Snowflake Arrow result chunk
+RENDER_PAGE_SIZE = 100
+MIN_REGRESSION_SECONDS = 0.1   # ignore slowdowns smaller than this; tiny cases are mostly noise
+MODES = ["full", "checksum", "streaming", "hashed"]
+
+# Deterministic column values from hash(row id, column seed)
+COLUMN_TYPES = {
+    "int": "(hash(id, {seed}) % 1000000)::BIGINT",
+    "float": "(hash(id, {seed}) % 1000000) / 100.0",
+    "varchar": "'v' || (hash(id, {seed}) % 1000000)::VARCHAR",
+    "date": "DATE '2000-01-01' + (hash(id, {seed}) % 10000)::INTEGER",
+    "decimal": "((hash(id, {seed}) % 100000000) / 100)::DECIMAL(18, 2)",
+}
+CHANGED_SEED = -1
+DUPLICATE_SEED = -2
+
+# ---------- Functions ----------
+def _fraction_filter(seed, fraction):
+    return f"hash(id, {seed}) % 1000000 < {int(fraction * 1_000_000)}"
+
+def generate_sql(table_name, rows, column_types, diff_rate, duplicate_rate, changed):
+    """CREATE TABLE statement for one side; with changed=True, `diff_rate` of the rows get a new c1 value."""
+    cols = []
+    for i, col_type in enumerate(column_types, start=1):
+        expr = COLUMN_TYPES[col_type].format(seed=i)
+        if changed and i == 1:
+            expr = f"CASE WHEN {_fraction_filter(CHANGED_SEED, diff_rate)} " \
+                   f"THEN {COLUMN_TYPES[col_type].format(seed=i + 1000)} ELSE {expr} END"
+        cols.append(f"{expr} AS c{i}")
+    base = f"SELECT id, {', '.join(cols)} FROM (SELECT range AS id FROM range({int(rows)}))"
+    return (
+        f"CREATE OR REPLACE TABLE {quote_ident(table_name)} AS "
+        f"WITH base AS ({base}) "
+        f"SELECT * FROM base UNION ALL SELECT * FROM base WHERE {_fraction_filter(DUPLICATE_SEED, duplicate_rate)}"
+    )
+
+def generate_tables(db_file, case):
+    column_types = [case["types"][i % len(case["types"])] for i in range(case["columns"])]
+    with duckdb.connect(db_file) as con:
+        for table_name, changed in ((SOURCE_TABLE, False), (TARGET_TABLE, True)):
+            con.execute(generate_sql(table_name, case["rows"], column_types, case["diff_rate"],
+                                     case["duplicate_rate"], changed))
+        return [con.execute(f"SELECT count(*) FROM {quote_ident(t)}").fetchone()[0] for t in (SOURCE_TABLE, TARGET_TABLE)]
+
+def _timed_batches(batches, timing):
+    """Pass batches through, adding the time spent waiting for each one to timing["seconds"]."""
+    batches = iter(batches)
+    while True:
+        start = time.perf_counter()
+        batch = next(batches, None)
+        timing["seconds"] += time.perf_counter() - start
+        if batch is None:
+            return
+        yield batch
+
+def _record(stages, name, seconds):
+    stages[name] = {"seconds": round(seconds, 4), "peak_rss_mb": peak_rss_mb()}
+
+def _run_full(db_file, stages, source_rows, target_rows):
+    with duckdb_connection(db_file) as con, duckdb_connection(db_file) as source_cur:
+        # Snowflake stand-in: the source table read on another cursor as Arrow batches
+        fetch_timing = {"seconds": 0.0}
+        start = time.perf_counter()
+        reader = source_cur.execute(f"SELECT * FROM {quote_ident(SOURCE_TABLE)}").fetch_record_batch(SOURCE_BATCH_ROWS)
+        batches = _timed_batches(reader, fetch_timing)
+        stream_arrow_batches_to_duckdb(batches, con, STAGED_TABLE, temporary=True)
+        transfer_seconds = time.perf_counter() - start
+        _record(stages, "fetch", fetch_timing["seconds"])
+        _record(stages, "stage", transfer_seconds - fetch_timing["seconds"])
+
+        start = time.perf_counter()
+        source_cols = fetch_columns(con, quote_ident(STAGED_TABLE))
+        columns_match = normalize_columns(source_cols) == normalize_columns(fetch_columns(con, quote_ident(TARGET_TABLE)))
+        _record(stages, "normalize", time.perf_counter() - start)
+        if not columns_match:
+            raise RuntimeError("Generated tables have different columns")
+
+        start = time.perf_counter()
+        counts = diff_relations(con, quote_ident(STAGED_TABLE), quote_ident(TARGET_TABLE), (source_rows, target_rows))
+        _record(stages, "diff", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        save_relation_result(con, source_cols, ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, counts)
+        _record(stages, "store", time.perf_counter() - start)
+    return source_cols, counts
+
+def _run_streaming(db_file, stages, memory_budget_mb):
+    with duckdb_connection(db_file) as con:
+        start = time.perf_counter()
+        result = streaming_compare(con, "DuckDB", SOURCE_TABLE, TARGET_TABLE, None, db_file, memory_budget_mb)
+        _record(stages, "diff", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        save_relation_result(con, result["columns"], ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, result["counts"])
+        _record(stages, "store", time.perf_counter() - start)
+    return result["columns"], result["counts"]
+
+def _run_rows_mode(db_file, stages, mode):
+    start = time.perf_counter()
+    if mode == "checksum":
+        result = checksum_compare("DuckDB", SOURCE_TABLE, TARGET_TABLE, ["id"], None, db_file)
+        save_result = save_rows_result
+    else:
+        result = hashed_compare("DuckDB", SOURCE_TABLE, TARGET_TABLE, None, db_file)
+        save_result = save_arrow_result
+    _record(stages, "diff", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    save_result(result["columns"], result["only_in_source"], result["only_in_target"])
+    _record(stages, "store", time.perf_counter() - start)
+    return result["columns"], result["counts"]
+
+def run_case(case, work_dir):
+    """Generate the tables for one case and time every pipeline stage; returns the result record."""
+    db_file = os.path.join(work_dir, f"bench_{os.getpid()}_{case['rows']}.duckdb")
+    stages = {}
+    try:
+        start = time.perf_counter()
+        source_rows, target_rows = generate_tables(db_file, case)
+        _record(stages, "generate", time.perf_counter() - start)
+
+        if case["mode"] == "full":
+            columns, counts = _run_full(db_file, stages, source_rows, target_rows)
+        elif case["mode"] == "streaming":
+            columns, counts = _run_streaming(db_file, stages, case["memory_budget_mb"])
+        else:
+            columns, counts = _run_rows_mode(db_file, stages, case["mode"])
+
+        start = time.perf_counter()
+        render_page_html(columns, fetch_page(0, RENDER_PAGE_SIZE))
+        _record(stages, "render", time.perf_counter() - start)
+    finally:
+        for path in (db_file, db_file + ".wal"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    total = sum(stage["seconds"] for name, stage in stages.items() if name != "generate")
+    return {
+        "case": case,
+        "source_rows": source_rows,
+        "target_rows": target_rows,
+        "only_in_source": counts["only_in_source"],
+        "only_in_target": counts["only_in_target"],
+        "stages": stages,
+        "total_seconds": round(total, 4),
+        "rows_per_second": round(source_rows / total) if total else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_case_isolated(case, work_dir):
+    """run_case in a freshly spawned process, so peak RSS and caches don't carry over between cases."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_case, case, work_dir).result()
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def load_previous(results_file):
+    """Most recent earlier record per case, keyed by its JSON-encoded case dict."""
+    previous = {}
+    if os.path.exists(results_file):
+        with open(results_file) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    previous[json.dumps(record["case"], sort_keys=True)] = record
+    return previous
+
+def check_regression(record, previous):
+    """(relative slowdown, seconds slower) against the previous run of the same case, or (None, None)."""
+    before = previous.get(json.dumps(record["case"], sort_keys=True))
+    if not before or not before["total_seconds"]:
+        return None, None
+    return record["total_seconds"] / before["total_seconds"] - 1, record["total_seconds"] - before["total_seconds"]
+
+def format_record(record, slowdown):
+    stages = " · ".join(f"{name} {stage['seconds']:.3f}s" for name, stage in record["stages"].items())
+    line = (f"{record['case']['rows']:>12,} rows  {record['total_seconds']:8.3f}s  "
+            f"peak {record['peak_rss_mb']} MB  ({stages})")
+    if slowdown is not None:
+        line += f"  {slowdown:+.0%} vs previous"
+    return line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compare pipeline on synthetic DuckDB tables.")
+    parser.add_argument("--rows", nargs="+", type=lambda v: int(float(v)), default=DEFAULT_ROWS,
+                        help="row counts to benchmark, e.g. 1e3 1e6 1e8")
+    parser.add_argument("--columns", type=int, default=5, help="non-key columns per table")
+    parser.add_argument("--types", default="int,varchar,float,date,decimal",
+                        help=f"comma-separated column types, cycled over the columns ({', '.join(COLUMN_TYPES)})")
+    parser.add_argument("--diff-rate", type=float, default=0.01, help="fraction of target rows with a changed value")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="fraction of rows duplicated on both sides")
+    parser.add_argument("--mode", choices=MODES, default="full", help="compare mode to benchmark")
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET_MB, help="streaming mode budget")
+    parser.add_argument("--output", default=RESULTS_FILE, help=f"JSON Lines file to append to (default: {RESULTS_FILE})")
+    parser.add_argument("--work-dir", help="directory for the scratch DuckDB files (default: a temp dir)")
+    parser.add_argument("--regression-threshold", type=float, default=0.2,
+                        help="flag cases this much slower than their previous run (default: 0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 if any case regressed")
+    args = parser.parse_args(argv)
+
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    unknown = [t for t in types if t not in COLUMN_TYPES]
+    if unknown or not types:
+        parser.error(f"unknown column type(s): {', '.join(unknown) or '(none given)'}")
+
+    env = environment()
+    previous = load_previous(args.output)
+    regressed = []
+    with tempfile.TemporaryDirectory(prefix="compare_bench_", dir=args.work_dir) as work_dir:
+        for rows in args.rows:
+            case = {
+                "rows": rows,
+                "columns": args.columns,
+                "types": types,
+                "diff_rate": args.diff_rate,
+                "duplicate_rate": args.duplicate_rate,
+                "mode": args.mode,
+                "memory_budget_mb": args.memory_budget_mb,
+            }
+            record = run_case_isolated(case, work_dir)
+            record.update(timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"), **env)
+            with open(args.output, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+            slowdown, seconds_slower = check_regression(record, previous)
+            print(format_record(record, slowdown))
+            if slowdown is not None and slowdown > args.regression_threshold and seconds_slower > MIN_REGRESSION_SECONDS:
+                regressed.append(rows)
+
+    if regressed:
+        print(f"Regression: {', '.join(f'{rows:,}' for rows in regressed)} rows ran more than "
+              f"{args.regression_threshold:.0%} slower than the previous run", file=sys.stderr)
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
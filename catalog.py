@@ -0,0 +1,76 @@
+import os
+import time
+
+import streamlit as st
+
+from connections import duckdb_connection, duckdb_file_version, snowflake_connection, snowflake_identity
+
+# ---------- Configuration ----------
+CATALOG_TTL_SECONDS = int(os.environ.get("CATALOG_TTL_SECONDS", "300"))
+
+# ---------- Functions ----------
+@st.cache_data(ttl=CATALOG_TTL_SECONDS, show_spinner="Loading Snowflake catalog...")
+def _load_snowflake_catalog(cache_key, _conn_params):
+    with snowflake_connection(_conn_params) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SHOW TABLES")
+            fields = [desc[0].lower() for desc in cur.description]
+            tables = {}
+            for row in cur.fetchall():
+                info = dict(zip(fields, row))
+                tables[info["name"]] = {"rows": info.get("rows"), "bytes": info.get("bytes"), "columns": []}
+
+            cur.execute(
+                "SELECT table_name, column_name, data_type FROM information_schema.columns "
+                "WHERE table_schema = CURRENT_SCHEMA() ORDER BY table_name, ordinal_position"
+            )
+            for table, column, data_type in cur.fetchall():
+                if table in tables:
+                    tables[table]["columns"].append((column, data_type))
+    return {"tables": tables, "loaded_at": time.time()}
+
+@st.cache_data(ttl=CATALOG_TTL_SECONDS, show_spinner=False)
+def _load_duckdb_catalog(db_file, file_version):
+    with duckdb_connection(db_file) as con:
+        tables = {
+            name: {"rows": rows, "bytes": None, "columns": []}
+            for name, rows in con.execute(
+                "SELECT table_name, estimated_size FROM duckdb_tables() "
+                "WHERE database_name = current_database() AND schema_name = current_schema() "
+                "ORDER BY table_name"
+            ).fetchall()
+        }
+        for table, column, data_type in con.execute(
+            "SELECT table_name, column_name, data_type FROM duckdb_columns() "
+            "WHERE database_name = current_database() AND schema_name = current_schema() "
+            "ORDER BY table_name, column_index"
+        ).fetchall():
+            if table in tables:
+                tables[table]["columns"].append((column, data_type))
+    return {"tables": tables, "loaded_at": time.time()}
+
+def snowflake_catalog(conn_params):
+    """Cached {table: {"rows", "bytes", "columns"}} for the configured Snowflake schema (one entry per connection)."""
+    return _load_snowflake_catalog(snowflake_identity(conn_params), conn_params)
+
+def duckdb_catalog(db_file):
+    """Cached {table: {"rows", "bytes", "columns"}} for a DuckDB file; refreshed automatically when the file changes."""
+    return _load_duckdb_catalog(db_file, duckdb_file_version(db_file))
+
+def clear_catalog_cache():
+    _load_snowflake_catalog.clear()
+    _load_duckdb_catalog.clear()
+
+def format_table_option(catalog, table):
+    """Selectbox label with the cached row count, e.g. "orders (1,204,331 rows)"."""
+    info = catalog["tables"].get(table) if catalog else None
+    if not info or info["rows"] is None:
+        return table
+    return f"{table} ({info['rows']:,} rows)"
+
+def render_catalog_controls():
+    """Sidebar refresh button; call before any catalog lookup so a refresh takes effect this run."""
+    with st.sidebar:
+        st.caption(f"Table lists are cached for {CATALOG_TTL_SECONDS}s.")
+        if st.button("🔄 Refresh table lists"):
+            clear_catalog_cache()
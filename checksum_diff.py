@@ -0,0 +1,252 @@
+from normalize_rules import tolerance_bound
+from sql_diff import quote_ident, sql_literal
+
+# ---------- Configuration ----------
+BUCKETS = 256          # fan-out per level of the checksum tree
+LEAF_ROWS = 2000       # buckets at or below this size are compared row-by-row (key + row hash)
+MAX_DEPTH = 4          # BUCKETS ** MAX_DEPTH must stay well below 2 ** 60
+NULL_MARKER = "<NULL>"
+DUPLICATE_KEYS_SHOWN = 5
+NUMBER_SCALE = 9       # every number hashes as DECIMAL(38, NUMBER_SCALE) text, so it must stay below 1e29
+DUCKDB_NUMBER_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER",
+                       "UBIGINT", "UHUGEINT", "FLOAT", "REAL", "DOUBLE"}
+SNOWFLAKE_TYPE_KINDS = {0: "number", 1: "number", 3: "date", 4: "timestamp", 6: "timestamp_tz", 7: "timestamp_tz",
+                        8: "timestamp", 12: "time"}    # cursor.description type codes
+
+# Values are hashed as text, and the two engines render the same value differently
+# (1.0 vs 1, timestamp precision, time zones), so numbers, dates, times and timestamps
+# are first put in one canonical form per kind: fixed-scale decimals and ISO text
+# with microseconds, time zone aware timestamps in UTC. Other types use the engine's
+# own text.
+DUCKDB_TEXT = {
+    None: "CAST({} AS VARCHAR)",
+    "number": f"CAST(CAST({{}} AS DECIMAL(38, {NUMBER_SCALE})) AS VARCHAR)",
+    "date": "strftime({}, '%Y-%m-%d')",
+    "time": "strftime(DATE '2000-01-01' + {}, '%H:%M:%S.%f')",
+    "timestamp": "strftime({}, '%Y-%m-%d %H:%M:%S.%f')",
+    "timestamp_tz": "strftime(timezone('UTC', {}), '%Y-%m-%d %H:%M:%S.%f')",
+}
+SNOWFLAKE_TEXT = {
+    None: "TO_VARCHAR({})",
+    "number": f"TO_VARCHAR(CAST({{}} AS NUMBER(38, {NUMBER_SCALE})))",
+    "date": "TO_VARCHAR({}, 'YYYY-MM-DD')",
+    "time": "TO_VARCHAR({}, 'HH24:MI:SS.FF6')",
+    "timestamp": "TO_VARCHAR({}, 'YYYY-MM-DD HH24:MI:SS.FF6')",
+    "timestamp_tz": "TO_VARCHAR(CONVERT_TIMEZONE('UTC', {})::TIMESTAMP_NTZ, 'YYYY-MM-DD HH24:MI:SS.FF6')",
+}
+
+# Both engines hash the same text with MD5 and keep the first 15 hex digits (60 bits),
+# so bucket numbers and checksums agree across DuckDB and Snowflake.
+DIALECTS = {
+    "duckdb": {
+        "to_text": lambda expr, kind=None: f"coalesce({DUCKDB_TEXT[kind].format(expr)}, '{NULL_MARKER}')",
+        "hash60": lambda expr: f"CAST(('0x' || substr(md5({expr}), 1, 15)) AS BIGINT)",
+    },
+    "snowflake": {
+        "to_text": lambda expr, kind=None: f"COALESCE({SNOWFLAKE_TEXT[kind].format(expr)}, '{NULL_MARKER}')",
+        "hash60": lambda expr: f"TO_NUMBER(SUBSTR(MD5({expr}), 1, 15), 'XXXXXXXXXXXXXXX')",
+    },
+}
+
+# ---------- Functions ----------
+def type_kind(dialect, data_type):
+    """Canonical text kind (see DUCKDB_TEXT) of a DuckDB type name or a Snowflake
+    cursor.description type code; None for types hashed as the engine renders them."""
+    if dialect == "snowflake":
+        return SNOWFLAKE_TYPE_KINDS.get(data_type)
+    name = str(data_type).upper()
+    if name in DUCKDB_NUMBER_TYPES or name.startswith("DECIMAL"):
+        return "number"
+    if name in ("TIMESTAMP WITH TIME ZONE", "TIMESTAMPTZ"):
+        return "timestamp_tz"
+    if name.startswith("TIMESTAMP") or name == "DATETIME":
+        return "timestamp"
+    return {"DATE": "date", "TIME": "time"}.get(name)
+
+def column_kinds(dialect, column_types):
+    """{column: kind} from (column, type) pairs, for hash_columns_sql and friends."""
+    return {col: type_kind(dialect, data_type) for col, data_type in column_types}
+
+def make_side(execute, relation, columns, key_columns, dialect="duckdb", kinds=None):
+    """Describe one side of a checksum compare.
+
+    `execute` runs a SQL string on that side and returns a list of tuples, e.g.
+    lambda sql: con.execute(sql).fetchall() for DuckDB or a Snowflake cursor wrapper.
+    `columns` and `key_columns` are the side's own (un-quoted) column names, in the
+    same order on both sides; `kinds` maps them to their text kind (see column_kinds).
+    """
+    return {
+        "execute": execute,
+        "relation": relation,
+        "columns": list(columns),
+        "key_columns": list(key_columns),
+        "dialect": dialect,
+        "kinds": kinds or {},
+        "queries": 0,
+        "rows_transferred": 0,
+    }
+
+def duckdb_executor(con):
+    return lambda sql: con.execute(sql).fetchall()
+
+def snowflake_executor(cur):
+    def execute(sql):
+        cur.execute(sql)
+        return cur.fetchall()
+    return execute
+
+def hash_columns_sql(dialect, columns, kinds=None):
+    """SQL for the 60-bit hash of some columns' canonical text, identical in DuckDB and
+    Snowflake for equal values when `kinds` (see column_kinds) is given."""
+    to_text = DIALECTS[dialect]["to_text"]
+    parts = ", ".join(to_text(quote_ident(col), (kinds or {}).get(col)) for col in columns)
+    return DIALECTS[dialect]["hash60"](f"concat_ws('|', {parts})")
+
+def _base_query(side):
+    """Project each row to its key columns, a 60-bit key hash (_kh) and a 60-bit row hash (_rh)."""
+    keys = ", ".join(quote_ident(col) for col in side["key_columns"])
+    return (
+        f"SELECT {keys}, "
+        f"{hash_columns_sql(side['dialect'], side['key_columns'], side['kinds'])} AS _kh, "
+        f"{hash_columns_sql(side['dialect'], side['columns'], side['kinds'])} AS _rh "
+        f"FROM {side['relation']}"
+    )
+
+def _run(side, sql):
+    rows = side["execute"](sql)
+    side["queries"] += 1
+    side["rows_transferred"] += len(rows)
+    return rows
+
+def _prefix_filter(depth, prefixes):
+    if depth == 0:
+        return ""
+    values = ", ".join(str(p) for p in sorted(prefixes))
+    return f"WHERE _kh % {BUCKETS ** depth} IN ({values})"
+
+def bucket_checksums(side, depth, prefixes=None):
+    """Per-bucket (count, hash-sum) one level below the given prefixes, as {bucket: (count, checksum)}.
+
+    A bucket at depth d is identified by _kh % BUCKETS ** (d + 1), so its parent is
+    simply bucket % BUCKETS ** d and drilling down never needs a join.
+    """
+    sql = (
+        f"SELECT _kh % {BUCKETS ** (depth + 1)} AS bucket, count(*) AS cnt, sum(_rh) AS checksum "
+        f"FROM ({_base_query(side)}) {_prefix_filter(depth, prefixes)} GROUP BY 1"
+    )
+    return {int(bucket): (int(cnt), int(checksum)) for bucket, cnt, checksum in _run(side, sql)}
+
+def bucket_rows(side, depth, buckets):
+    """Key hash -> [(key tuple, row hash)] for every row inside the given buckets at `depth`."""
+    sql = (
+        f"SELECT * FROM ({_base_query(side)}) "
+        f"{_prefix_filter(depth + 1, buckets)}"
+    )
+    nkeys = len(side["key_columns"])
+    rows = {}
+    for row in _run(side, sql):
+        rows.setdefault(int(row[nkeys]), []).append((tuple(row[:nkeys]), int(row[nkeys + 1])))
+    return rows
+
+def checksum_diff(source, target):
+    """Find differing keys by recursively comparing bucket checksums on both sides.
+
+    Only buckets whose (count, hash-sum) disagree are drilled into, and only leaf
+    buckets are ever read row-by-row, so the data transferred grows with the number
+    of differences rather than with the table size. Returns a dict with the keys
+    only in source, only in target and present on both sides with different values.
+
+    The key columns must identify a row: a key found more than once on either side
+    in a differing bucket raises ValueError. Duplicates inside buckets that match
+    are identical on both sides and go unnoticed.
+    """
+    result = {"only_in_source": [], "only_in_target": [], "changed": [], "levels": []}
+    prefixes = None
+    depth = 0
+
+    while True:
+        src = bucket_checksums(source, depth, prefixes)
+        tgt = bucket_checksums(target, depth, prefixes)
+        mismatched = {b for b in src.keys() | tgt.keys() if src.get(b) != tgt.get(b)}
+        result["levels"].append({"depth": depth, "buckets": len(src.keys() | tgt.keys()), "mismatched": len(mismatched)})
+        if not mismatched:
+            break
+
+        leaves = {
+            b for b in mismatched
+            if depth + 1 >= MAX_DEPTH
+            or max(src.get(b, (0, 0))[0], tgt.get(b, (0, 0))[0]) <= LEAF_ROWS
+        }
+        if leaves:
+            _compare_leaf_rows(source, target, depth, leaves, result)
+
+        prefixes = mismatched - leaves
+        if not prefixes:
+            break
+        depth += 1
+
+    result["queries"] = source["queries"] + target["queries"]
+    result["rows_transferred"] = source["rows_transferred"] + target["rows_transferred"]
+    return result
+
+def _check_unique_keys(rows, side):
+    """Raise ValueError listing a few keys that occur more than once in one side's leaf rows."""
+    duplicated = [entries[0][0] for entries in rows.values() if len(entries) > 1]
+    if duplicated:
+        shown = ", ".join(str(key) for key in duplicated[:DUPLICATE_KEYS_SHOWN])
+        raise ValueError(f"{len(duplicated):,} key(s) occur more than once in the {side} (e.g. {shown}); "
+                         "the key columns must identify a row")
+
+def _compare_leaf_rows(source, target, depth, leaves, result):
+    src_rows = bucket_rows(source, depth, leaves)
+    tgt_rows = bucket_rows(target, depth, leaves)
+    _check_unique_keys(src_rows, "source")
+    _check_unique_keys(tgt_rows, "target")
+    for kh, [(key, rh)] in src_rows.items():
+        if kh not in tgt_rows:
+            result["only_in_source"].append(key)
+        elif tgt_rows[kh][0][1] != rh:
+            result["changed"].append(key)
+    for kh, [(key, _)] in tgt_rows.items():
+        if kh not in src_rows:
+            result["only_in_target"].append(key)
+
+def fetch_rows_by_key(side, keys):
+    """Fetch the full rows for a (small) list of key tuples from one side, with the
+    values in side["columns"] order."""
+    if not keys:
+        return []
+    key_cols = ", ".join(quote_ident(col) for col in side["key_columns"])
+    placeholders = ", ".join(
+        "(" + ", ".join(sql_literal(v) for v in key) + ")" for key in keys
+    )
+    columns = ", ".join(quote_ident(col) for col in side["columns"])
+    sql = f"SELECT {columns} FROM {side['relation']} WHERE ({key_cols}) IN ({placeholders})"
+    return _run(side, sql)
+
+def _within_tolerance(source_value, target_value, tolerance):
+    if source_value == target_value:
+        return True
+    if tolerance is None or source_value is None or target_value is None:
+        return False
+    try:
+        return abs(float(source_value) - float(target_value)) <= tolerance_bound(tolerance)
+    except (TypeError, ValueError):
+        return False
+
+def drop_within_tolerance(side, source_rows, target_rows, tolerances):
+    """Drop the rows of keys found on both sides whose values only differ within
+    `tolerances` ({column: tolerance}); rows line up with side["columns"] as returned
+    by fetch_rows_by_key. Returns (source rows, target rows, number of keys dropped)."""
+    positions = [side["columns"].index(col) for col in side["key_columns"]]
+    row_tolerances = [tolerances.get(col) for col in side["columns"]]
+    key_of = lambda row: tuple(row[i] for i in positions)
+    target_by_key = {key_of(row): row for row in target_rows}
+    tolerated = set()
+    for row in source_rows:
+        other = target_by_key.get(key_of(row))
+        if other is not None and all(_within_tolerance(a, b, tol) for a, b, tol in zip(row, other, row_tolerances)):
+            tolerated.add(key_of(row))
+    return ([row for row in source_rows if key_of(row) not in tolerated],
+            [row for row in target_rows if key_of(row) not in tolerated],
+            len(tolerated))
@@ -0,0 +1,72 @@
+from checksum_diff import DIALECTS
+from sql_diff import quote_ident
+
+# ---------- Configuration ----------
+PROFILE_STATS = ["count", "nulls", "distinct", "min", "max", "hash_sum"]
+APPROX_DISTINCT = {"duckdb": "approx_count_distinct", "snowflake": "APPROX_COUNT_DISTINCT"}
+DISTINCT_TOLERANCE = 0.05    # HyperLogLog estimates differ between engines even on identical data
+
+# ---------- Functions ----------
+def _column_aggregates(dialect, col, kind=None):
+    """count, nulls, approx distinct, min, max and the sum of 60-bit value hashes of one
+    column; `kind` is its checksum_diff text kind."""
+    ident = quote_ident(col)
+    hash60, to_text = DIALECTS[dialect]["hash60"], DIALECTS[dialect]["to_text"]
+    return [
+        f"count({ident})",
+        f"count(*) - count({ident})",
+        f"{APPROX_DISTINCT[dialect]}({ident})",
+        f"min({ident})",
+        f"max({ident})",
+        f"sum({hash60(to_text(ident, kind))})",
+    ]
+
+def profile_query(dialect, relation, columns, kinds=None):
+    """One aggregate query profiling every column of `relation`; the first value is the row count.
+    `kinds` is checksum_diff.column_kinds of the columns."""
+    parts = ["count(*)"]
+    for col in columns:
+        parts.extend(_column_aggregates(dialect, col, (kinds or {}).get(col)))
+    return f"SELECT {', '.join(parts)} FROM {relation}"
+
+def profile_relation(execute, dialect, relation, columns, kinds=None):
+    """Run profile_query with `execute` (see checksum_diff.make_side) and return
+    {"rows": row count, "columns": {column: {stat: value}}}."""
+    values = list(execute(profile_query(dialect, relation, columns, kinds))[0])
+    rows, values = values[0], values[1:]
+    width = len(PROFILE_STATS)
+    return {
+        "rows": rows,
+        "columns": {
+            col: dict(zip(PROFILE_STATS, values[i * width:(i + 1) * width]))
+            for i, col in enumerate(columns)
+        },
+    }
+
+def stat_matches(stat, source_value, target_value):
+    if stat == "distinct" and source_value is not None and target_value is not None:
+        return abs(source_value - target_value) <= DISTINCT_TOLERANCE * max(source_value, target_value)
+    return source_value == target_value
+
+def compare_profiles(source_profile, target_profile, column_pairs):
+    """Side-by-side rows {"column", "statistic", "source", "target", "match"} for each
+    (source column, target column) pair, starting with the table row counts."""
+    rows = [{
+        "column": "(table)",
+        "statistic": "rows",
+        "source": source_profile["rows"],
+        "target": target_profile["rows"],
+        "match": source_profile["rows"] == target_profile["rows"],
+    }]
+    for source_col, target_col in column_pairs:
+        source_stats = source_profile["columns"][source_col]
+        target_stats = target_profile["columns"][target_col]
+        for stat in PROFILE_STATS:
+            rows.append({
+                "column": target_col,
+                "statistic": stat,
+                "source": source_stats[stat],
+                "target": target_stats[stat],
+                "match": stat_matches(stat, source_stats[stat], target_stats[stat]),
+            })
+    return rows
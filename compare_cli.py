@@ -0,0 +1,110 @@
+"""Batch compare many table pairs from the command line, e.g. from cron or CI.
+
+    python compare_cli.py manifest.json --jobs 4 --output results.jsonl --snowflake-config sf.json
+    python compare_cli.py manifest.json --export parquet --export-dir exports/
+
+The manifest is a JSON list (or {"pairs": [...]}) of entries like
+{"source": "EMPLOYEE", "target": "employee2", "key": ["id"], "source_type": "Snowflake"};
+see compare_engine.run_compare for the optional fields (incremental mode excepted: it
+stores state next to the DuckDB file). Each pair runs in its own worker process, which
+opens the DuckDB file read-only, and one JSON line per pair is written as soon as it
+finishes. The exit status is 0 when every pair matches, 1 when any pair differs and 2
+when any pair failed.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import connections
+from compare_engine import DUCKDB_FILE, INCREMENTAL_MODE, run_compare
+from result_export import EXPORT_DIR, EXPORT_FORMATS
+
+# ---------- Functions ----------
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    pairs = manifest["pairs"] if isinstance(manifest, dict) else manifest
+    for i, pair in enumerate(pairs):
+        if not pair.get("source") or not pair.get("target"):
+            raise ValueError(f"Manifest entry {i} needs both 'source' and 'target'")
+        if isinstance(pair.get("key"), str):
+            pair["key"] = [pair["key"]]
+    return pairs
+
+def load_snowflake_config(path):
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _init_worker():
+    # Every worker opens the DuckDB file; only read-only handles can be shared across processes
+    connections.DUCKDB_READ_ONLY = True
+
+def _run_pair(index, pair, conn_params, db_file, max_rows, export_format, export_dir):
+    summary = run_compare(pair, conn_params, db_file, max_rows, export_format, export_dir)
+    summary["index"] = index
+    return summary
+
+def run_manifest(pairs, conn_params=None, db_file=DUCKDB_FILE, jobs=None, max_rows=100, export_format=None,
+                 export_dir=None):
+    """Yield one summary per pair, in completion order, from a pool of `jobs` processes."""
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(_run_pair, i, pair, conn_params, db_file, max_rows, export_format, export_dir)
+            for i, pair in enumerate(pairs)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+def exit_status(summaries):
+    statuses = {summary["status"] for summary in summaries}
+    if "error" in statuses:
+        return 2
+    if statuses - {"match"}:
+        return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare table pairs listed in a manifest.")
+    parser.add_argument("manifest", help="JSON manifest of {source, target, key, ...} entries")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--db", default=DUCKDB_FILE, help=f"DuckDB file holding the targets (default: {DUCKDB_FILE})")
+    parser.add_argument("--snowflake-config", help="JSON file with Snowflake connection parameters")
+    parser.add_argument("--source-type", choices=["Snowflake", "DuckDB"], default="Snowflake",
+                        help="source type for entries that don't set one")
+    parser.add_argument("--max-rows", type=int, default=100, help="differing rows per side kept in the output")
+    parser.add_argument("--export", choices=list(EXPORT_FORMATS), help="also write every differing row to a file per pair")
+    parser.add_argument("--export-dir", default=EXPORT_DIR, help=f"directory for --export files (default: {EXPORT_DIR})")
+    args = parser.parse_args(argv)
+
+    pairs = load_manifest(args.manifest)
+    for pair in pairs:
+        pair.setdefault("source_type", args.source_type)
+    if any(pair.get("mode") == INCREMENTAL_MODE for pair in pairs):
+        # Workers open the DuckDB files read-only, so the partition fingerprints could never be stored
+        parser.error("incremental mode is not supported here: run it from the app or reconcile_scheduler.py")
+    conn_params = load_snowflake_config(args.snowflake_config)
+    if conn_params is None and any(pair["source_type"] == "Snowflake" for pair in pairs):
+        parser.error("--snowflake-config is required when a pair has a Snowflake source")
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    summaries = []
+    try:
+        for summary in run_manifest(pairs, conn_params, args.db, args.jobs, args.max_rows, args.export,
+                                    args.export_dir):
+            summaries.append(summary)
+            out.write(json.dumps(summary, default=str) + "\n")
+            out.flush()
+            print(f"[{len(summaries)}/{len(pairs)}] {summary['source']} -> {summary['target']}: "
+                  f"{summary['status']} ({summary['seconds']:.2f}s)", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return exit_status(summaries)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,900 @@
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from checksum_diff import (checksum_diff, column_kinds, drop_within_tolerance, duckdb_executor, fetch_rows_by_key, make_side,
+                           snowflake_executor)
+from column_profile import compare_profiles, profile_relation
+from connections import duckdb_connection, snowflake_connection
+from first_diff import DEFAULT_LIMIT as DEFAULT_FIRST_LIMIT, key_bounds, range_predicate, scan_ranges
+from incremental_diff import (attach_state, fingerprint_query, load_state, pair_id, partition_query, plan_partitions,
+                              read_fingerprints, save_partitions, state_settings, validate_partition)
+from normalize_rules import column_tolerances, normalized_relation, uses_tolerance, validate_rules
+from pushdown import column_map, projected_relation, validate_conditions
+from query_cache import lookup, parquet_relation, snowflake_query_key, store_relation
+from result_export import export_differences, export_path, export_rows, export_tables
+from result_history import rows_to_arrow
+from row_hash import HASH_BYTES, hash_batches, missing_rows, table_rows, take_rows
+from run_profile import bind_run, span
+from sample_diff import DEFAULT_SAMPLE_RATE, mismatch_stats, sample_query
+from sql_diff import (ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, diff_relations, except_all_sql, fetch_columns,
+                      fetch_diff_rows, quote_ident)
+from staging_mirror import mirror_relation
+from streaming_diff import DEFAULT_MEMORY_BUDGET_MB, iter_cursor_rows, merge_diff, side_budget_bytes, sort_side
+from transfer import stream_arrow_batches_to_duckdb, stream_snowflake_cursor_to_duckdb
+
+# ---------- Configuration ----------
+DUCKDB_FILE = "mydata.duckdb"
+STAGED_SOURCE_TABLE = "intermediate_source"
+FULL_MODE = "full"
+CHECKSUM_MODE = "checksum"
+STREAMING_MODE = "streaming"
+SAMPLE_MODE = "sample"
+PROFILE_MODE = "profile"
+INCREMENTAL_MODE = "incremental"
+FIRST_N_MODE = "first_n"
+HASHED_MODE = "hashed"
+MODES = (FULL_MODE, CHECKSUM_MODE, STREAMING_MODE, SAMPLE_MODE, PROFILE_MODE, INCREMENTAL_MODE, FIRST_N_MODE,
+         HASHED_MODE)
+SAMPLE_SOURCE_TABLE = "sample_source"
+SAMPLE_TARGET_TABLE = "sample_target"
+CHANGED_SOURCE_TABLE = "changed_source"
+CHANGED_TARGET_TABLE = "changed_target"
+RANGE_SOURCE_TABLE = "range_source"
+DIFF_BATCH_VIEW = "_diff_batch"
+PROGRESS_EVERY_ROWS = 1000
+
+# Nothing in this module calls Streamlit: errors are raised, progress goes through
+# callbacks, and the pages / compare_cli.py decide how to present the results.
+
+# ---------- Functions ----------
+def normalize_columns(cols):
+    return [col.strip().lower() for col in cols]
+
+def fetch_sides(source_fetch, target_fetch):
+    """Run the source and target fetch callables on two threads and return both results.
+
+    The Streamlit pages pass concurrent_fetch.fetch_sides_concurrently instead, which
+    does the same with a status box per side.
+    """
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="compare-fetch") as pool:
+        source_future = pool.submit(bind_run(source_fetch))
+        target_future = pool.submit(bind_run(target_fetch))
+        return source_future.result(), target_future.result()
+
+def stage_snowflake_query(sql_query, conn_params, con, target_table_name=STAGED_SOURCE_TABLE):
+    """Stage a Snowflake query result into a TEMP table on `con`; returns (columns, transfer stats)."""
+    with snowflake_connection(conn_params) as conn:
+        with conn.cursor() as cur:
+            with span("snowflake_query"):
+                cur.execute(sql_query)
+            # Arrow batches are pulled from Snowflake while they are appended, so this covers both
+            with span("fetch_and_stage") as stage:
+                columns, stats = stream_snowflake_cursor_to_duckdb(cur, con, target_table_name, temporary=True)
+                stage.update(rows=stats["rows"], bytes=stats["bytes"])
+            return columns, stats
+
+def describe_relation(con, relation, preview_rows=0):
+    """{"columns", "rows", "preview"} of a DuckDB relation; the preview holds the first `preview_rows` rows."""
+    with span("describe") as describe:
+        preview = []
+        if preview_rows:
+            res = con.execute(f"SELECT * FROM {relation} LIMIT {int(preview_rows)}")
+            columns = [desc[0] for desc in res.description]
+            preview = res.fetchall()
+        else:
+            columns = fetch_columns(con, relation)
+        rows = con.execute(f"SELECT count(*) FROM {relation}").fetchone()[0]
+        describe["rows"] = rows
+    return {"columns": columns, "rows": rows, "preview": preview}
+
+def describe_duckdb_relation(relation, db_file=DUCKDB_FILE, preview_rows=0):
+    """describe_relation on its own pooled cursor, so it can run on a fetch worker thread."""
+    with duckdb_connection(db_file) as con:
+        return describe_relation(con, relation, preview_rows)
+
+def _snowflake_side(con, relation, conn_params, preview_rows=0, cache=False):
+    """Stage a Snowflake relation on `con` (or read it from the query cache) and describe it."""
+    sql_query = f"SELECT * FROM {relation}"
+    key = None
+    if cache:
+        with span("cache_lookup"):
+            key = snowflake_query_key(sql_query, conn_params)
+            path = key and lookup(key)
+        if path:
+            cached = parquet_relation(path)
+            return dict(describe_relation(con, cached, preview_rows), relation=cached, cache="hit")
+    _, stats = stage_snowflake_query(sql_query, conn_params, con)
+    staged = quote_ident(STAGED_SOURCE_TABLE)
+    side = dict(describe_relation(con, staged, preview_rows), relation=staged, transfer=stats)
+    if key:
+        with span("cache_store", rows=side["rows"]):
+            store_relation(con, staged, key)
+        side["cache"] = "miss"
+    return side
+
+def _duckdb_side(relation, db_file, preview_rows=0):
+    """Describe a DuckDB relation; it is local, so re-reading it is cheaper than caching it."""
+    return dict(describe_duckdb_relation(relation, db_file, preview_rows), relation=relation)
+
+def fetch_full_sides(con, source_type, source_relation, target_relation, conn_params=None, db_file=DUCKDB_FILE,
+                     fetch=fetch_sides, preview_rows=0, cache=False):
+    """First half of a full compare: stage / describe both sides concurrently.
+
+    `source_relation` and `target_relation` are quoted table names or parenthesised
+    queries. A Snowflake source is staged into a temp table on `con` while the target
+    is described on another cursor. The returned dict carries both sides' columns,
+    row counts and optional previews, plus the relations to diff. With `cache` a
+    Snowflake source query's result goes through query_cache, and the source's
+    "cache" is "hit" or "miss" (absent when the query is not cacheable).
+    """
+    if source_type == "Snowflake":
+        fetch_source = lambda: _snowflake_side(con, source_relation, conn_params, preview_rows, cache)
+    else:
+        fetch_source = lambda: _duckdb_side(source_relation, db_file, preview_rows)
+
+    source, target = fetch(fetch_source, lambda: _duckdb_side(target_relation, db_file, preview_rows))
+    return {
+        "mode": FULL_MODE,
+        "source": source,
+        "target": target,
+        "source_relation": source.pop("relation"),
+        "target_relation": target.pop("relation"),
+        "columns": source["columns"],
+        "columns_match": bool(source["columns"])
+                         and normalize_columns(source["columns"]) == normalize_columns(target["columns"]),
+        "counts": None,
+    }
+
+def _normalized_relations(result, rules):
+    """The result's source / target relations with the normalization rules applied (see normalize_rules)."""
+    return (normalized_relation(result["source_relation"], result["source"]["columns"], rules or {}),
+            normalized_relation(result["target_relation"], result["target"]["columns"], rules or {}))
+
+def diff_full_sides(con, result, rules=None):
+    """Second half: EXCEPT ALL the relations, leaving the differing rows in the
+    ONLY_IN_SOURCE_TABLE / ONLY_IN_TARGET_TABLE temp tables on `con`. With `rules`
+    both sides are normalized in the same query, so the differing rows hold the
+    normalized values."""
+    with span("diff") as diff:
+        result["counts"] = diff_relations(con, *_normalized_relations(result, rules),
+                                          (result["source"]["rows"], result["target"]["rows"]))
+        diff["rows"] = result["counts"]["only_in_source"] + result["counts"]["only_in_target"]
+    return result
+
+def full_compare(con, source_type, source_relation, target_relation, conn_params=None, db_file=DUCKDB_FILE,
+                 fetch=fetch_sides, preview_rows=0, rules=None):
+    """fetch_full_sides then, when the columns line up, diff_full_sides."""
+    result = fetch_full_sides(con, source_type, source_relation, target_relation, conn_params, db_file,
+                              fetch, preview_rows)
+    return diff_full_sides(con, result, rules) if result["columns_match"] else result
+
+def _align_source(source_cols, target_cols, key_columns):
+    """Line the source columns up with the target columns by normalized name (e.g. Snowflake upper-case).
+
+    Returns the source (columns, key columns) in target order, or None when the names differ.
+    """
+    by_name = dict(zip(normalize_columns(source_cols), source_cols))
+    if sorted(by_name) != sorted(normalize_columns(target_cols)):
+        return None
+    columns = [by_name[col] for col in normalize_columns(target_cols)]
+    keys = [by_name[col] for col in normalize_columns([c for c in target_cols if c in key_columns])]
+    return columns, keys
+
+def _checksum_source(execute, source_table, source_cols, target_cols, key_columns, dialect, kinds):
+    aligned = _align_source(source_cols, target_cols, key_columns)
+    return None if aligned is None else make_side(execute, quote_ident(source_table), *aligned, dialect, kinds)
+
+def _run_checksum(source, target, result, tolerances):
+    with span("checksum_tree") as tree:
+        stats = checksum_diff(source, target)
+        tree["rows"] = stats["rows_transferred"]
+    with span("fetch_diff_rows") as fetch:
+        only_in_source = fetch_rows_by_key(source, stats["only_in_source"] + stats["changed"])
+        only_in_target = fetch_rows_by_key(target, stats["only_in_target"] + stats["changed"])
+        fetch["rows"] = len(only_in_source) + len(only_in_target)
+    tolerated = 0
+    if tolerances and stats["changed"]:
+        # Hashes only tell equal from different, so changed keys are re-checked on their rows
+        only_in_source, only_in_target, tolerated = drop_within_tolerance(target, only_in_source, only_in_target,
+                                                                          tolerances)
+    result.update(
+        columns=source["columns"],
+        columns_match=True,
+        only_in_source=only_in_source,
+        only_in_target=only_in_target,
+        counts={"only_in_source": len(only_in_source), "only_in_target": len(only_in_target)},
+        checksum={
+            "levels": len(stats["levels"]),
+            "queries": stats["queries"],
+            "rows_transferred": stats["rows_transferred"],
+            "keys_only_in_source": len(stats["only_in_source"]),
+            "keys_only_in_target": len(stats["only_in_target"]),
+            "keys_changed": len(stats["changed"]) - tolerated,
+            "keys_within_tolerance": tolerated,
+        },
+    )
+    return result
+
+def checksum_compare(source_type, source_table, target_table, key_columns, conn_params=None, db_file=DUCKDB_FILE,
+                     rules=None):
+    """Bucketed checksum compare: both sides hash their rows in place and only differing keys are fetched.
+
+    Rows whose key exists on both sides with different values appear on both
+    only_in_* lists, unless every differing value is within a tolerance rule of
+    `rules` (see normalize_rules; the other rules do not apply here). "columns_match"
+    is False (and no rows are fetched) when the columns do not line up.
+    """
+    with duckdb_connection(db_file) as con:
+        target_types = _column_types(con, "DuckDB", target_table, conn_params)
+        target_cols = [col for col, _ in target_types]
+        target = make_side(duckdb_executor(con), quote_ident(target_table), target_cols,
+                           [col for col in target_cols if col in key_columns], "duckdb",
+                           _column_kinds("DuckDB", target_types))
+        tolerances = column_tolerances(rules or {}, target_cols)
+        result = {"mode": CHECKSUM_MODE, "target": {"columns": target_cols}, "columns_match": False, "counts": None}
+
+        if source_type == "Snowflake":
+            with snowflake_connection(conn_params) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"SELECT * FROM {quote_ident(source_table)} LIMIT 0")
+                    source_cols = [desc[0] for desc in cur.description]
+                    kinds = column_kinds("snowflake", [(desc[0], desc[1]) for desc in cur.description])
+                    result["source"] = {"columns": source_cols}
+                    source = _checksum_source(snowflake_executor(cur), source_table, source_cols,
+                                              target_cols, key_columns, "snowflake", kinds)
+                    return result if source is None else _run_checksum(source, target, result, tolerances)
+
+        source_types = _column_types(con, "DuckDB", source_table, conn_params)
+        source_cols = [col for col, _ in source_types]
+        result["source"] = {"columns": source_cols}
+        source = _checksum_source(duckdb_executor(con), source_table, source_cols, target_cols, key_columns, "duckdb",
+                                  _column_kinds("DuckDB", source_types))
+        return result if source is None else _run_checksum(source, target, result, tolerances)
+
+def _fetch_duckdb_arrow(name, sql, db_file):
+    """Run a query on its own pooled cursor and return the result as one Arrow table."""
+    with span(name) as fetch:
+        with duckdb_connection(db_file) as cur:
+            table = cur.execute(sql).fetch_record_batch().read_all()
+        fetch.update(rows=table.num_rows, bytes=table.nbytes)
+        return table
+
+def _stage_arrow(con, table, table_name):
+    with span("stage", table=table_name) as stage:
+        stats = stream_arrow_batches_to_duckdb(table.to_batches(), con, table_name, table.column_names, temporary=True)
+        stage.update(rows=stats["rows"], bytes=stats["bytes"])
+        return stats
+
+def _column_types(con, source_type, table, conn_params):
+    """(column, type) of a table: DuckDB type names, or Snowflake (type code, precision, scale)."""
+    if source_type == "Snowflake":
+        with snowflake_connection(conn_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {quote_ident(table)} LIMIT 0")
+                return [(desc[0], [desc[1], desc[4], desc[5]]) for desc in cur.description]
+    return [(col, data_type) for col, data_type, *_ in con.execute(f"DESCRIBE {quote_ident(table)}").fetchall()]
+
+def _column_kinds(source_type, column_types):
+    """checksum_diff.column_kinds of _column_types output, for hashing values the same way on both engines."""
+    if source_type == "Snowflake":
+        return column_kinds("snowflake", [(col, data_type[0]) for col, data_type in column_types])
+    return column_kinds("duckdb", column_types)
+
+def _source_columns(con, source_type, source_table, conn_params):
+    if source_type == "Snowflake":
+        with snowflake_connection(conn_params) as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM {quote_ident(source_table)} LIMIT 0")
+                return [desc[0] for desc in cur.description]
+    return fetch_columns(con, quote_ident(source_table))
+
+def sample_compare(con, source_type, source_table, target_table, key_columns, sample_rate=DEFAULT_SAMPLE_RATE,
+                   conn_params=None, db_file=DUCKDB_FILE, fetch=fetch_sides, rules=None):
+    """Approximate compare of the rows whose key hash falls in a `sample_rate` fraction of keys.
+
+    The sample filter is a WHERE clause run by each engine, so only the sampled rows
+    are transferred; both sides pick the same keys because the hash is computed the
+    same way in Snowflake and DuckDB. The samples are staged as temp tables on `con`
+    and diffed like a full compare, leaving the differing sampled rows in the
+    ONLY_IN_SOURCE_TABLE / ONLY_IN_TARGET_TABLE temp tables. "sample" holds the
+    key-level mismatch rate and its confidence interval (see sample_diff.mismatch_stats).
+    `rules` normalize the sampled rows before the diff, as in diff_full_sides.
+    """
+    target_types = _column_types(con, "DuckDB", target_table, conn_params)
+    target_cols = [col for col, _ in target_types]
+    target_keys = [col for col in target_cols if col in key_columns]
+    if not target_keys:
+        raise ValueError(f"None of the key columns {', '.join(key_columns)} is in {target_table}")
+    source_types = _column_types(con, source_type, source_table, conn_params)
+    source_cols = [col for col, _ in source_types]
+    result = {
+        "mode": SAMPLE_MODE,
+        "source": {"columns": source_cols},
+        "target": {"columns": target_cols},
+        "source_relation": quote_ident(SAMPLE_SOURCE_TABLE),
+        "target_relation": quote_ident(SAMPLE_TARGET_TABLE),
+        "columns": target_cols,
+        "columns_match": False,
+        "counts": None,
+    }
+    aligned = _align_source(source_cols, target_cols, key_columns)
+    if aligned is None:
+        return result
+
+    # Source columns are renamed to the target's names so the staged samples line up
+    target_sql = sample_query("duckdb", quote_ident(target_table), target_cols, target_keys, sample_rate,
+                              kinds=_column_kinds("DuckDB", target_types))
+    source_kinds = _column_kinds(source_type, source_types)
+    if source_type == "Snowflake":
+        source_sql = sample_query("snowflake", quote_ident(source_table), *aligned, sample_rate, aliases=target_cols,
+                                  kinds=source_kinds)
+        fetch_source = lambda: stage_snowflake_query(source_sql, conn_params, con, SAMPLE_SOURCE_TABLE)[1]
+    else:
+        source_sql = sample_query("duckdb", quote_ident(source_table), *aligned, sample_rate, aliases=target_cols,
+                                  kinds=source_kinds)
+        fetch_source = lambda: _fetch_duckdb_arrow("sample_source", source_sql, db_file)
+    source, target = fetch(fetch_source, lambda: _fetch_duckdb_arrow("sample_target", target_sql, db_file))
+    if source_type != "Snowflake":
+        source = _stage_arrow(con, source, SAMPLE_SOURCE_TABLE)
+    target = _stage_arrow(con, target, SAMPLE_TARGET_TABLE)
+
+    # Both staged samples carry the target's column names
+    result["source"].update(columns=target_cols, rows=source["rows"], transfer=source)
+    result["target"]["rows"] = target["rows"]
+    result["columns_match"] = True
+    diff_full_sides(con, result, rules)
+    with span("sample_stats"):
+        result["sample"] = mismatch_stats(con, *_normalized_relations(result, rules), target_keys, sample_rate)
+    return result
+
+def _fingerprint_side(name, source_type, table, columns, column, by, kinds, conn_params, db_file):
+    """{partition: (rows, row-hash sum)} of one table, grouped where the table lives."""
+    with span(name, table=table) as fingerprints:
+        if source_type == "Snowflake":
+            with snowflake_connection(conn_params) as conn:
+                with conn.cursor() as cur:
+                    rows = snowflake_executor(cur)(fingerprint_query("snowflake", quote_ident(table), columns, column,
+                                                                     by, kinds))
+        else:
+            with duckdb_connection(db_file) as cur:
+                rows = duckdb_executor(cur)(fingerprint_query("duckdb", quote_ident(table), columns, column, by, kinds))
+        fingerprints["rows"] = len(rows)
+        return read_fingerprints(rows)
+
+def incremental_compare(con, source_type, source_table, target_table, partition, conn_params=None,
+                        db_file=DUCKDB_FILE, fetch=fetch_sides, rules=None):
+    """Full compare that only fetches and diffs the partitions changed since the pair's last run.
+
+    `partition` is {"column": <target column>, "by": "day" | "week" | "month" | "year" |
+    <key range size>}. Both engines compute per-partition fingerprints in place; see
+    incremental_diff for which partitions are re-diffed. A change of `rules` or of
+    either side's column types re-diffs every partition. The stored and new differing
+    rows end up in the ONLY_IN_SOURCE_TABLE / ONLY_IN_TARGET_TABLE temp tables on `con`,
+    and "incremental" counts the partitions per outcome and the rows fetched.
+    """
+    column, by = validate_partition(partition)
+    target_types = _column_types(con, "DuckDB", target_table, conn_params)
+    target_cols = [col for col, _ in target_types]
+    if column not in target_cols:
+        raise ValueError(f"Partition column {column} is not in {target_table}")
+    source_types = _column_types(con, source_type, source_table, conn_params)
+    source_cols = [col for col, _ in source_types]
+    result = {
+        "mode": INCREMENTAL_MODE,
+        "source": {"columns": source_cols},
+        "target": {"columns": target_cols},
+        "source_relation": quote_ident(CHANGED_SOURCE_TABLE),
+        "target_relation": quote_ident(CHANGED_TARGET_TABLE),
+        "columns": target_cols,
+        "columns_match": False,
+        "counts": None,
+    }
+    aligned = _align_source(source_cols, target_cols, [column])
+    if aligned is None:
+        return result
+    aligned_cols, (source_column,) = aligned
+
+    source_fps, target_fps = fetch(
+        lambda: _fingerprint_side("fingerprint_source", source_type, source_table, aligned_cols, source_column, by,
+                                  _column_kinds(source_type, source_types), conn_params, db_file),
+        lambda: _fingerprint_side("fingerprint_target", "DuckDB", target_table, target_cols, column, by,
+                                  _column_kinds("DuckDB", target_types), conn_params, db_file)
+    )
+    attach_state(con, db_file)
+    pid = pair_id(source_type, source_table, target_table, target_cols, column, by)
+    settings = state_settings(source_types, target_types, rules)
+    plan = plan_partitions(source_fps, target_fps, load_state(con, pid, settings))
+    changed = plan["changed"]
+
+    rows_fetched = 0
+    if changed:
+        # Only the changed partitions are read; source columns take the target's names
+        target_sql = partition_query("duckdb", quote_ident(target_table), target_cols, column, by, changed)
+        if source_type == "Snowflake":
+            source_sql = partition_query("snowflake", quote_ident(source_table), aligned_cols, source_column, by,
+                                         changed, aliases=target_cols)
+            fetch_source = lambda: stage_snowflake_query(source_sql, conn_params, con, CHANGED_SOURCE_TABLE)[1]
+        else:
+            source_sql = partition_query("duckdb", quote_ident(source_table), aligned_cols, source_column, by,
+                                         changed, aliases=target_cols)
+            fetch_source = lambda: _fetch_duckdb_arrow("changed_source", source_sql, db_file)
+        source, target = fetch(fetch_source, lambda: _fetch_duckdb_arrow("changed_target", target_sql, db_file))
+        if source_type != "Snowflake":
+            source = _stage_arrow(con, source, CHANGED_SOURCE_TABLE)
+        target = _stage_arrow(con, target, CHANGED_TARGET_TABLE)
+        rows_fetched = source["rows"] + target["rows"]
+        result["source"].update(columns=target_cols, rows=source["rows"], transfer=source)
+        result["target"]["rows"] = target["rows"]
+        diff_full_sides(con, result, rules)
+
+    with span("store_partitions"):
+        if not save_partitions(con, pid, settings, plan, source_fps, target_fps, column, by, bool(changed)):
+            # Nothing stored or diffed yet: every partition is equal
+            for table in (ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE):
+                con.execute(f"CREATE OR REPLACE TEMP TABLE {table} AS SELECT * FROM {quote_ident(target_table)} LIMIT 0")
+
+    result["columns_match"] = True
+    result["source"]["rows"] = sum(count for count, _ in source_fps.values())
+    result["target"]["rows"] = sum(count for count, _ in target_fps.values())
+    result["counts"] = {
+        "source_rows": result["source"]["rows"],
+        "target_rows": result["target"]["rows"],
+        "only_in_source": con.execute(f"SELECT count(*) FROM {ONLY_IN_SOURCE_TABLE}").fetchone()[0],
+        "only_in_target": con.execute(f"SELECT count(*) FROM {ONLY_IN_TARGET_TABLE}").fetchone()[0],
+    }
+    result["incremental"] = {
+        "partitions": len(plan["equal"]) + len(plan["reused"]) + len(changed),
+        "equal": len(plan["equal"]),
+        "reused": len(plan["reused"]),
+        "rediffed": len(changed),
+        "rows_fetched": rows_fetched,
+    }
+    return result
+
+def _profile_side(name, source_type, table, conn_params, db_file):
+    """(columns, profile) of one table from a single aggregate query on its own connection."""
+    with span(name, table=table) as profile_span:
+        if source_type == "Snowflake":
+            with snowflake_connection(conn_params) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"SELECT * FROM {quote_ident(table)} LIMIT 0")
+                    columns = [desc[0] for desc in cur.description]
+                    kinds = column_kinds("snowflake", [(desc[0], desc[1]) for desc in cur.description])
+                    profile = profile_relation(snowflake_executor(cur), "snowflake", quote_ident(table), columns, kinds)
+        else:
+            with duckdb_connection(db_file) as con:
+                column_types = _column_types(con, "DuckDB", table, conn_params)
+                columns = [col for col, _ in column_types]
+                profile = profile_relation(duckdb_executor(con), "duckdb", quote_ident(table), columns,
+                                           _column_kinds("DuckDB", column_types))
+        profile_span["rows"] = profile["rows"]
+        return columns, profile
+
+def profile_compare(source_type, source_table, target_table, conn_params=None, db_file=DUCKDB_FILE, fetch=fetch_sides):
+    """Column-profile pre-diff: one aggregate query per side and no rows transferred.
+
+    Columns are paired by normalized name. "profile" holds one row per paired column
+    and statistic (see column_profile.compare_profiles) and "mismatches" the number
+    of rows that differ; "columns_match" is False when some column has no partner.
+    """
+    (source_cols, source_profile), (target_cols, target_profile) = fetch(
+        lambda: _profile_side("profile_source", source_type, source_table, conn_params, db_file),
+        lambda: _profile_side("profile_target", "DuckDB", target_table, conn_params, db_file)
+    )
+    by_name = dict(zip(normalize_columns(source_cols), source_cols))
+    column_pairs = [(by_name[name], col) for name, col in zip(normalize_columns(target_cols), target_cols)
+                    if name in by_name]
+    profile = compare_profiles(source_profile, target_profile, column_pairs)
+    return {
+        "mode": PROFILE_MODE,
+        "source": {"columns": source_cols, "rows": source_profile["rows"]},
+        "target": {"columns": target_cols, "rows": target_profile["rows"]},
+        "columns": target_cols,
+        "columns_match": sorted(by_name) == sorted(normalize_columns(target_cols)),
+        "counts": None,
+        "profile": profile,
+        "mismatches": sum(not row["match"] for row in profile),
+    }
+
+def _create_diff_table(con, table_name, schema_relation, columns):
+    """Empty temp table with the column types of `schema_relation`, under `columns`' names."""
+    aliases = ", ".join(quote_ident(col) for col in columns)
+    con.execute(f"CREATE OR REPLACE TEMP TABLE {table_name} AS "
+                f"SELECT * FROM (SELECT * FROM {schema_relation} LIMIT 0) AS _schema({aliases})")
+
+def _append_diff_rows(con, table_name, columns, rows):
+    if not rows:
+        return
+    con.register(DIFF_BATCH_VIEW, rows_to_arrow(columns, rows))
+    try:
+        con.execute(f"INSERT INTO {table_name} SELECT * FROM {DIFF_BATCH_VIEW}")
+    finally:
+        con.unregister(DIFF_BATCH_VIEW)
+
+def streaming_compare(con, source_type, source_table, target_table, conn_params=None, db_file=DUCKDB_FILE,
+                      memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, fetch=fetch_sides, on_progress=None):
+    """Bounded-memory compare: both sides are read with fetchmany, externally sorted and merge-joined.
+
+    Differing rows are written to the ONLY_IN_SOURCE_TABLE / ONLY_IN_TARGET_TABLE temp
+    tables on `con` every PROGRESS_EVERY_ROWS differences, so memory stays bounded
+    however many rows differ. `on_progress(only_in_source, only_in_target)` is called
+    with the running counts after each write, when the rows so far can be read from
+    the tables (e.g. with fetch_diff_rows).
+    """
+    with ExitStack() as stack:
+        target_cur = stack.enter_context(duckdb_connection(db_file))
+        target_cur.execute(f"SELECT * FROM {quote_ident(target_table)}")
+        if source_type == "Snowflake":
+            conn = stack.enter_context(snowflake_connection(conn_params))
+            source_cur = stack.enter_context(conn.cursor())
+        else:
+            source_cur = stack.enter_context(duckdb_connection(db_file))
+        source_cur.execute(f"SELECT * FROM {quote_ident(source_table)}")
+
+        source_cols = [desc[0] for desc in source_cur.description]
+        target_cols = [desc[0] for desc in target_cur.description]
+        result = {
+            "mode": STREAMING_MODE,
+            "source": {"columns": source_cols},
+            "target": {"columns": target_cols},
+            "columns": source_cols,
+            "columns_match": normalize_columns(source_cols) == normalize_columns(target_cols),
+            "counts": None,
+            "memory_budget_mb": memory_budget_mb,
+        }
+        if not result["columns_match"]:
+            return result
+
+        # A Snowflake source has no local schema; its rows take the target's column types
+        source_schema = quote_ident(source_table if source_type == "DuckDB" else target_table)
+        _create_diff_table(con, ONLY_IN_SOURCE_TABLE, source_schema, source_cols)
+        _create_diff_table(con, ONLY_IN_TARGET_TABLE, quote_ident(target_table), target_cols)
+
+        # Read and sort both sides at the same time, then merge-join them
+        budget = side_budget_bytes(memory_budget_mb)
+        tmp_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="stream_diff_"))
+        sorted_source, sorted_target = fetch(
+            lambda: _sort_cursor("sort_source", source_cur, budget, tmp_dir),
+            lambda: _sort_cursor("sort_target", target_cur, budget, tmp_dir)
+        )
+
+        counts = {"only_in_source": 0, "only_in_target": 0}
+        batch = {"Source": [], "Target": []}
+
+        def write_batch():
+            _append_diff_rows(con, ONLY_IN_SOURCE_TABLE, source_cols, batch["Source"])
+            _append_diff_rows(con, ONLY_IN_TARGET_TABLE, target_cols, batch["Target"])
+            counts["only_in_source"] += len(batch["Source"])
+            counts["only_in_target"] += len(batch["Target"])
+            batch["Source"], batch["Target"] = [], []
+            if on_progress:
+                on_progress(counts["only_in_source"], counts["only_in_target"])
+
+        with span("merge") as merge:
+            for side, row in merge_diff(sorted_source, sorted_target):
+                batch[side].append(row)
+                if len(batch["Source"]) + len(batch["Target"]) >= PROGRESS_EVERY_ROWS:
+                    write_batch()
+            write_batch()
+            merge["rows"] = counts["only_in_source"] + counts["only_in_target"]
+        result["counts"] = counts
+        return result
+
+def _sort_cursor(name, cur, budget, tmp_dir):
+    with span(name):
+        return sort_side(iter_cursor_rows(cur), budget, tmp_dir)
+
+def _key_min_max(execute, column, relation):
+    return execute(f"SELECT min({quote_ident(column)}), max({quote_ident(column)}) FROM {relation}")[0]
+
+def _range_relation(relation, column, start, end, scan_all):
+    return relation if scan_all else f"(SELECT * FROM {relation} WHERE {range_predicate(column, start, end)})"
+
+def first_differences_compare(con, source_type, source_relation, target_relation, key_column=None,
+                              limit=DEFAULT_FIRST_LIMIT, conn_params=None, rules=None, on_rows=None):
+    """Early-exit compare: stop as soon as `limit` differing rows have been found.
+
+    `source_relation` and `target_relation` are quoted table names or parenthesised
+    queries, compared positionally as in a full compare. With a numeric `key_column`
+    (a target column) both sides are read key range by key range, small ranges
+    first (see first_diff), and each range is diffed with EXCEPT ALL with the
+    still-missing row count pushed down as a LIMIT; a Snowflake source range is
+    filtered in Snowflake and staged on `con`. Without one, or for a non-numeric key,
+    the whole relations are diffed in one LIMITed query.
+
+    `on_rows(only_in_source, only_in_target, scanned)` is called after every range
+    with the rows found so far and the share of the key span scanned. In "first_n",
+    "complete" is True when the scan ended below the limit, i.e. the rows returned
+    are all the differences.
+    """
+    start_time = time.perf_counter()
+    with ExitStack() as stack:
+        target_cols = fetch_columns(con, target_relation)
+        if source_type == "Snowflake":
+            conn = stack.enter_context(snowflake_connection(conn_params))
+            source_cur = stack.enter_context(conn.cursor())
+            source_cur.execute(f"SELECT * FROM {source_relation} LIMIT 0")
+            source_cols = [desc[0] for desc in source_cur.description]
+        else:
+            source_cols = fetch_columns(con, source_relation)
+        result = {
+            "mode": FIRST_N_MODE,
+            "source": {"columns": source_cols},
+            "target": {"columns": target_cols},
+            "columns": source_cols,
+            "columns_match": bool(source_cols) and normalize_columns(source_cols) == normalize_columns(target_cols),
+            "counts": None,
+        }
+        if not result["columns_match"]:
+            return result
+
+        source_key, bounds = None, None
+        if key_column:
+            if key_column not in target_cols:
+                raise ValueError(f"Key column {key_column} is not in the target")
+            source_key = source_cols[target_cols.index(key_column)]
+            execute_source = snowflake_executor(source_cur) if source_type == "Snowflake" else duckdb_executor(con)
+            with span("key_bounds"):
+                bounds = key_bounds(_key_min_max(execute_source, source_key, source_relation),
+                                    _key_min_max(duckdb_executor(con), key_column, target_relation))
+        ranges = scan_ranges(bounds) if bounds else [(None, None, 1.0)]
+
+        only_in_source, only_in_target = [], []
+        first_seconds, scanned, range_count = None, 0.0, 0
+        for start, end, share in ranges:
+            remaining = limit - len(only_in_source) - len(only_in_target)
+            if remaining <= 0:
+                break
+            with span("scan_range", start=start, end=end) as scan:
+                target_range = _range_relation(target_relation, key_column, start, end, bounds is None)
+                if source_type == "Snowflake":
+                    source_sql = _range_relation(source_relation, source_key, start, end, bounds is None)
+                    source_cur.execute(f"SELECT * FROM {source_sql}")
+                    _, stats = stream_snowflake_cursor_to_duckdb(source_cur, con, RANGE_SOURCE_TABLE, temporary=True)
+                    scan.update(bytes=stats["bytes"])
+                    source_range = quote_ident(RANGE_SOURCE_TABLE)
+                else:
+                    source_range = _range_relation(source_relation, source_key, start, end, bounds is None)
+                source_range = normalized_relation(source_range, source_cols, rules or {})
+                target_range = normalized_relation(target_range, target_cols, rules or {})
+                rows = con.execute(f"{except_all_sql(source_range, target_range)} LIMIT {remaining}").fetchall()
+                only_in_source.extend(rows)
+                if remaining > len(rows):
+                    only_in_target.extend(con.execute(
+                        f"{except_all_sql(target_range, source_range)} LIMIT {remaining - len(rows)}"
+                    ).fetchall())
+                scan["rows"] = len(only_in_source) + len(only_in_target)
+            range_count += 1
+            scanned = share
+            if first_seconds is None and (only_in_source or only_in_target):
+                first_seconds = time.perf_counter() - start_time
+            if on_rows:
+                on_rows(only_in_source, only_in_target, scanned)
+        if source_type == "Snowflake":
+            con.execute(f"DROP TABLE IF EXISTS {quote_ident(RANGE_SOURCE_TABLE)}")
+
+    found = len(only_in_source) + len(only_in_target)
+    result.update(
+        only_in_source=only_in_source,
+        only_in_target=only_in_target,
+        counts={"only_in_source": len(only_in_source), "only_in_target": len(only_in_target)},
+    )
+    result["first_n"] = {
+        "limit": limit,
+        "key_column": key_column if bounds else None,
+        "complete": found < limit,
+        "ranges": range_count,
+        "scanned": scanned,
+        "first_difference_seconds": first_seconds,
+        "seconds": time.perf_counter() - start_time,
+    }
+    return result
+
+def _hash_order(columns):
+    return sorted(columns, key=lambda col: col.strip().lower())
+
+def _hashed_side(name, source_type, table, conn_params, db_file):
+    """(columns, Arrow table, row hashes) of one table, hashed batch by batch while it is read.
+
+    Columns are hashed in lower-cased name order, so column order and case don't matter.
+    """
+    with span(name, table=table) as side:
+        if source_type == "Snowflake":
+            with snowflake_connection(conn_params) as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"SELECT * FROM {quote_ident(table)}")
+                    columns = [desc[0] for desc in cur.description]
+                    rows, hashes = hash_batches(cur.fetch_arrow_batches(), _hash_order(columns))
+        else:
+            with duckdb_connection(db_file) as cur:
+                reader = cur.execute(f"SELECT * FROM {quote_ident(table)}").fetch_record_batch()
+                columns = reader.schema.names
+                rows, hashes = hash_batches(reader, _hash_order(columns))
+        side.update(rows=len(hashes), bytes=0 if rows is None else rows.nbytes)
+        return columns, rows, hashes
+
+def hashed_compare(source_type, source_table, target_table, conn_params=None, db_file=DUCKDB_FILE, fetch=fetch_sides):
+    """In-process compare over 64-bit row hashes (see row_hash), with columns matched by
+    name regardless of order and case.
+
+    Both tables are read as Arrow batches and hashed as they arrive; only the rows
+    missing on the other side are taken, as Arrow tables with the target's column
+    names and order. Rows are matched one-for-one, so surplus copies of a repeated
+    row are reported as in the full compare.
+    """
+    (source_cols, source_rows, source_hashes), (target_cols, target_rows, target_hashes) = fetch(
+        lambda: _hashed_side("hash_source", source_type, source_table, conn_params, db_file),
+        lambda: _hashed_side("hash_target", "DuckDB", target_table, conn_params, db_file)
+    )
+    result = {
+        "mode": HASHED_MODE,
+        "source": {"columns": source_cols, "rows": len(source_hashes)},
+        "target": {"columns": target_cols, "rows": len(target_hashes)},
+        "columns": target_cols,
+        "columns_match": False,
+        "counts": None,
+    }
+    aligned = _align_source(source_cols, target_cols, [])
+    if aligned is None:
+        return result
+
+    with span("hash_diff") as diff:
+        source_missing = missing_rows(source_hashes, target_hashes)
+        target_missing = missing_rows(target_hashes, source_hashes)
+        diff["rows"] = len(source_missing) + len(target_missing)
+    with span("take_rows"):
+        result["only_in_source"] = take_rows(source_rows, source_missing, aligned[0], target_cols)
+        result["only_in_target"] = take_rows(target_rows, target_missing, target_cols)
+    result["columns_match"] = True
+    result["counts"] = {
+        "source_rows": len(source_hashes),
+        "target_rows": len(target_hashes),
+        "only_in_source": len(source_missing),
+        "only_in_target": len(target_missing),
+    }
+    result["hashed"] = {
+        "hash_bytes": (len(source_hashes) + len(target_hashes)) * HASH_BYTES,
+        "arrow_bytes": sum(rows.nbytes for rows in (source_rows, target_rows) if rows is not None),
+    }
+    return result
+
+def _pushed_down_pair(con, pair, source_type, source_relation, target_relation, conn_params):
+    """Source and target relations narrowed to the pair's "columns" and "filter" (see pushdown)."""
+    if not pair.get("columns") and not pair.get("filter"):
+        return source_relation, target_relation
+    target_columns = fetch_columns(con, target_relation)
+    conditions = validate_conditions([tuple(c) for c in pair.get("filter") or []], target_columns)
+    if source_type == "Snowflake":
+        source_columns = _source_columns(con, source_type, pair["source"], conn_params)
+    else:
+        # A DuckDB source or the local mirror of a Snowflake one: no Snowflake round trip
+        source_columns = fetch_columns(con, source_relation)
+    names = column_map(source_columns, target_columns)
+    return (projected_relation(source_relation, pair.get("columns"), conditions, names),
+            projected_relation(target_relation, pair.get("columns"), conditions))
+
+def run_compare(pair, conn_params=None, db_file=DUCKDB_FILE, max_rows=100, export_format=None, export_dir=None):
+    """Run one manifest entry end to end and return a JSON-serialisable summary.
+
+    `pair` holds "source", "target" and optionally "key" (list of column names),
+    "source_type" ("Snowflake" / "DuckDB"), "mode", "memory_budget_mb", "sample_rate" and
+    "rules" (normalization rules, see normalize_rules; full, sample, incremental and first_n modes,
+    and only tolerance rules in checksum mode),
+    "mirror" (full mode: compare the local mirror of a Snowflake source, see staging_mirror),
+    "partition" (incremental mode, see incremental_compare) and "limit" (first_n mode: stop
+    after this many differences, scanning by the first key column; see first_differences_compare).
+    "columns" and "filter" ([column, operator, value] conditions) narrow both sides in the
+    full and first_n modes (see pushdown).
+    The mode defaults to checksum when a key is given and to full otherwise. Up to
+    `max_rows` differing rows per side are included; profile mode returns the column
+    profiles instead. With `export_format` ("parquet" / "csv") all differing rows are
+    also written to a file in `export_dir` (see result_export), straight from the
+    diff temp tables in the SQL and streaming modes, and "export" gives its path and size.
+    """
+    key_columns = pair.get("key") or []
+    mode = pair.get("mode") or (CHECKSUM_MODE if key_columns else FULL_MODE)
+    source_type = pair.get("source_type", "Snowflake")
+    summary = {
+        "source": pair["source"],
+        "target": pair["target"],
+        "source_type": source_type,
+        "mode": mode,
+        "key": key_columns,
+    }
+    start = time.perf_counter()
+    try:
+        if mode not in MODES:
+            raise ValueError(f"Unknown compare mode {mode!r}; expected one of {', '.join(MODES)}")
+        if mode in (CHECKSUM_MODE, SAMPLE_MODE) and not key_columns:
+            raise ValueError(f"{mode.capitalize()} mode needs at least one key column")
+        rules = validate_rules(pair["rules"]) if pair.get("rules") else None
+        if rules and uses_tolerance(rules) and mode != CHECKSUM_MODE:
+            raise ValueError("Tolerance rules need checksum mode, where rows are matched by key; use round_to instead")
+        if mode == INCREMENTAL_MODE and not pair.get("partition"):
+            raise ValueError('Incremental mode needs a "partition" ({"column": ..., "by": ...})')
+        if pair.get("mirror") and mode != FULL_MODE:
+            raise ValueError("Only full mode can compare against the local mirror")
+        if (pair.get("columns") or pair.get("filter")) and mode not in (FULL_MODE, FIRST_N_MODE):
+            raise ValueError("Only full and first_n modes can narrow the columns or filter the rows")
+        if mode == CHECKSUM_MODE:
+            result = checksum_compare(source_type, pair["source"], pair["target"], key_columns, conn_params, db_file,
+                                      rules)
+        elif mode == PROFILE_MODE:
+            result = profile_compare(source_type, pair["source"], pair["target"], conn_params, db_file)
+        elif mode == HASHED_MODE:
+            result = hashed_compare(source_type, pair["source"], pair["target"], conn_params, db_file)
+            if result["columns_match"]:
+                if export_format:
+                    summary["export"] = export_tables(
+                        result["columns"], result["only_in_source"], result["only_in_target"], export_format,
+                        export_path(f"{pair['source']}_vs_{pair['target']}", export_format, export_dir)
+                    )
+                result["only_in_source"] = table_rows(result["only_in_source"], max_rows)
+                result["only_in_target"] = table_rows(result["only_in_target"], max_rows)
+        else:
+            with duckdb_connection(db_file) as con:
+                if mode == FIRST_N_MODE:
+                    result = first_differences_compare(
+                        con, source_type,
+                        *_pushed_down_pair(con, pair, source_type, quote_ident(pair["source"]),
+                                           quote_ident(pair["target"]), conn_params),
+                        key_columns[0] if key_columns else None, pair.get("limit", DEFAULT_FIRST_LIMIT),
+                        conn_params, rules
+                    )
+                elif mode == INCREMENTAL_MODE:
+                    result = incremental_compare(con, source_type, pair["source"], pair["target"], pair["partition"],
+                                                 conn_params, db_file, rules=rules)
+                elif mode == STREAMING_MODE:
+                    result = streaming_compare(con, source_type, pair["source"], pair["target"], conn_params, db_file,
+                                               pair.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB))
+                elif mode == SAMPLE_MODE:
+                    result = sample_compare(con, source_type, pair["source"], pair["target"], key_columns,
+                                            pair.get("sample_rate", DEFAULT_SAMPLE_RATE), conn_params, db_file,
+                                            rules=rules)
+                else:
+                    source_relation = quote_ident(pair["source"])
+                    if pair.get("mirror") and source_type == "Snowflake":
+                        source_type, source_relation = "DuckDB", mirror_relation(pair["source"])
+                    result = full_compare(con, source_type,
+                                          *_pushed_down_pair(con, pair, source_type, source_relation,
+                                                             quote_ident(pair["target"]), conn_params),
+                                          conn_params, db_file, rules=rules)
+                if result["columns_match"] and mode != FIRST_N_MODE:
+                    if export_format:
+                        summary["export"] = export_differences(
+                            con, result["columns"], ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, export_format,
+                            export_path(f"{pair['source']}_vs_{pair['target']}", export_format, export_dir)
+                        )
+                    result["only_in_source"], result["only_in_target"] = fetch_diff_rows(con, limit=max_rows)
+                    con.execute(f"DROP TABLE IF EXISTS {ONLY_IN_SOURCE_TABLE}")
+                    con.execute(f"DROP TABLE IF EXISTS {ONLY_IN_TARGET_TABLE}")
+
+        if export_format and result["columns_match"] and mode != PROFILE_MODE and "export" not in summary:
+            summary["export"] = export_rows(
+                result["columns"], result["only_in_source"], result["only_in_target"], export_format,
+                export_path(f"{pair['source']}_vs_{pair['target']}", export_format, export_dir)
+            )
+        summary["source_columns"] = result["source"]["columns"]
+        summary["target_columns"] = result["target"]["columns"]
+        summary["counts"] = result["counts"]
+        if not result["columns_match"]:
+            summary["status"] = "column_mismatch"
+        elif mode == PROFILE_MODE:
+            summary["status"] = "different" if result["mismatches"] else "match"
+        else:
+            differences = result["counts"]["only_in_source"] + result["counts"]["only_in_target"]
+            summary["status"] = "different" if differences else "match"
+            summary["only_in_source"] = [list(row) for row in result["only_in_source"][:max_rows]]
+            summary["only_in_target"] = [list(row) for row in result["only_in_target"][:max_rows]]
+        for stats_key in ("checksum", "sample", "profile", "incremental", "first_n", "hashed"):
+            if stats_key in result:
+                summary[stats_key] = result[stats_key]
+        if result["source"].get("transfer"):
+            summary["transfer"] = result["source"]["transfer"]
+    except Exception as e:
+        summary["status"] = "error"
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from compare_engine import DUCKDB_FILE, run_compare
+from connections import duckdb_connection, snowflake_identity
+from run_profile import profile_run
+
+# ---------- Configuration ----------
+JOB_DB_FILE = os.environ.get("COMPARE_JOB_DB", "compare_jobs.duckdb")
+JOB_WORKERS = int(os.environ.get("COMPARE_JOB_WORKERS", "2"))            # compares running at the same time
+JOB_RESULT_DIR = os.environ.get("COMPARE_JOB_RESULT_DIR", "job_results")
+JOB_RETENTION = int(os.environ.get("COMPARE_JOB_RETENTION", "200"))      # finished jobs kept, with their result files
+SCHEDULE_RETENTION_DAYS = int(os.environ.get("COMPARE_SCHEDULE_RETENTION_DAYS", "90"))   # scheduled runs kept for trends
+SCHEDULE_RESULT_FILES = int(os.environ.get("COMPARE_SCHEDULE_RESULT_FILES", "5"))      # newest runs per schedule keeping all rows
+JOB_PREVIEW_ROWS = 100
+PROGRESS_WRITE_SECONDS = 1.0                                             # progress within a stage is written at most this often
+JOB_TABLE = "compare_jobs"
+JOB_COLUMNS = ["job_id", "job_key", "pair", "status", "stage", "stage_rows", "submitted_at", "started_at",
+               "updated_at", "finished_at", "cancel_requested", "summary", "error", "schedule", "owner"]
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"                         # Linux; changes on every boot
+
+# Jobs run on a thread pool of the app server process, shared by every session; worker
+# processes could not open the DuckDB file the server already holds read-write. Each
+# job is one run_compare call whose summary, plus a Parquet file of all its differing
+# rows, is kept in the job store, so any session can pick the result up. Submitting
+# a compare that is already queued or running (same pair, file, Snowflake identity and
+# schedule) attaches to that job instead of starting another. Progress and cancelling go through
+# the run_profile hook: it fires as each stage (span) starts and at checkpoints within
+# long fetches, so a cancelled job stops at the next one; a single long query, e.g. the
+# DuckDB diff itself, still runs to completion first. Each job records its owner,
+# host:boot id:pid of the server process running it; a job left queued or running by
+# a process that is gone (same host, other boot or dead pid) is marked failed, while
+# jobs of other live processes or other hosts are left alone.
+
+_lock = threading.Lock()        # serializes job store access and the in-process job bookkeeping
+_pool = None
+_cancel_events = {}             # job_id -> threading.Event, for the jobs queued or running in this process
+_futures = {}
+_store_ready = False
+_owner = None
+
+# ---------- Functions ----------
+def _now():
+    return datetime.now(timezone.utc)
+
+def _boot_id():
+    try:
+        with open(BOOT_ID_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def job_owner():
+    """host:boot id:pid of this process, stored on the jobs it runs."""
+    global _owner
+    if _owner is None:
+        _owner = f"{socket.gethostname()}:{_boot_id()}:{os.getpid()}"
+    return _owner
+
+def _process_alive(pid):
+    if os.name == "nt":
+        return True     # os.kill would terminate the process there
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _orphaned(owner):
+    """True when the process that owned an active job has stopped; jobs from before
+    owners were recorded count as orphaned, other hosts' jobs never do."""
+    if not owner:
+        return True
+    host, boot_id, pid = owner.rsplit(":", 2)
+    if host != socket.gethostname():
+        return False
+    return boot_id != _boot_id() or (int(pid) != os.getpid() and not _process_alive(int(pid)))
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="compare-job")
+    return _pool
+
+def _execute(sql, params=None):
+    """Run one statement on the job store; the caller holds _lock."""
+    global _store_ready
+    with duckdb_connection(JOB_DB_FILE) as con:
+        if not _store_ready:
+            con.execute(
+                f"CREATE TABLE IF NOT EXISTS {JOB_TABLE} (job_id VARCHAR, job_key VARCHAR, pair VARCHAR, "
+                "status VARCHAR, stage VARCHAR, stage_rows BIGINT, submitted_at TIMESTAMPTZ, started_at TIMESTAMPTZ, "
+                "updated_at TIMESTAMPTZ, finished_at TIMESTAMPTZ, cancel_requested BOOLEAN, summary VARCHAR, "
+                "error VARCHAR)"
+            )
+            con.execute(f"ALTER TABLE {JOB_TABLE} ADD COLUMN IF NOT EXISTS schedule VARCHAR")
+            con.execute(f"ALTER TABLE {JOB_TABLE} ADD COLUMN IF NOT EXISTS owner VARCHAR")
+            # Jobs a stopped server process left behind will never finish
+            active = con.execute(f"SELECT job_id, owner FROM {JOB_TABLE} WHERE status IN (?, ?)",
+                                 list(ACTIVE_STATUSES)).fetchall()
+            for job_id, owner in active:
+                if _orphaned(owner):
+                    con.execute(
+                        f"UPDATE {JOB_TABLE} SET status = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                        [FAILED, "The app server stopped before the job finished", _now(), job_id]
+                    )
+            _store_ready = True
+        return con.execute(sql, params or []).fetchall()
+
+def _job(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job["pair"] = json.loads(job["pair"])
+    job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+    return job
+
+def job_key(pair, conn_params=None, db_file=DUCKDB_FILE, schedule=None):
+    """Identity of a compare: the same pair against the same DuckDB file and Snowflake account and role.
+
+    A scheduled run also carries its schedule name, so it never attaches to an ad-hoc
+    job or to another schedule's run and each schedule records its own result.
+    """
+    payload = json.dumps([pair, db_file, snowflake_identity(conn_params) if conn_params else None, schedule],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def _finish(job_id, status, summary=None, error=None):
+    with _lock:
+        _execute(
+            f"UPDATE {JOB_TABLE} SET status = ?, summary = ?, error = ?, finished_at = ? WHERE job_id = ?",
+            [status, json.dumps(summary, default=str) if summary is not None else None, error, _now(), job_id]
+        )
+        _cancel_events.pop(job_id, None)
+        _futures.pop(job_id, None)
+
+def _run_job(job_id, pair, conn_params, db_file):
+    cancelled = _cancel_events[job_id]
+    with _lock:
+        _execute(f"UPDATE {JOB_TABLE} SET status = ?, started_at = ? WHERE job_id = ?", [RUNNING, _now(), job_id])
+    last_write = {"stage": None, "at": 0.0}
+
+    def on_progress(name, rows=None):
+        # Called on the job thread and on the fetch threads it starts
+        if cancelled.is_set():
+            raise RuntimeError("Cancelled")
+        with _lock:
+            if name == last_write["stage"] and time.monotonic() - last_write["at"] < PROGRESS_WRITE_SECONDS:
+                return
+            last_write.update(stage=name, at=time.monotonic())
+            _execute(f"UPDATE {JOB_TABLE} SET stage = ?, stage_rows = ?, updated_at = ? WHERE job_id = ?",
+                     [name, rows, _now(), job_id])
+
+    try:
+        with profile_run("compare_jobs.py", dict(pair, job_id=job_id), on_progress=on_progress):
+            summary = run_compare(pair, conn_params, db_file, JOB_PREVIEW_ROWS, "parquet", JOB_RESULT_DIR)
+    except Exception as e:
+        _finish(job_id, FAILED, error=f"{type(e).__name__}: {e}")
+        return
+    if summary["status"] != "error":
+        _finish(job_id, DONE, summary)
+    elif cancelled.is_set():
+        _finish(job_id, CANCELLED, summary)
+    else:
+        _finish(job_id, FAILED, summary, summary["error"])
+
+def submit_job(pair, conn_params=None, db_file=DUCKDB_FILE, schedule=None):
+    """Queue a compare of one pair (see run_compare) and return (job_id, attached).
+
+    `attached` is True when the same compare was already queued or running and its
+    job is returned instead of starting another one. `schedule` names the scheduled
+    reconciliation the job is a run of (see reconcile_scheduler).
+    """
+    key = job_key(pair, conn_params, db_file, schedule)
+    with _lock:
+        running = _execute(
+            f"SELECT job_id FROM {JOB_TABLE} WHERE job_key = ? AND status IN (?, ?) ORDER BY submitted_at DESC LIMIT 1",
+            [key, *ACTIVE_STATUSES]
+        )
+        if running:
+            return running[0][0], True
+        _prune_jobs()
+        job_id = uuid.uuid4().hex[:12]
+        _execute(
+            f"INSERT INTO {JOB_TABLE} (job_id, job_key, pair, status, submitted_at, cancel_requested, schedule, "
+            "owner) VALUES (?, ?, ?, ?, ?, false, ?, ?)",
+            [job_id, key, json.dumps(pair, default=str), QUEUED, _now(), schedule, job_owner()]
+        )
+        _cancel_events[job_id] = threading.Event()
+        _futures[job_id] = _executor().submit(_run_job, job_id, pair, conn_params, db_file)
+    return job_id, False
+
+def cancel_job(job_id):
+    """Ask a queued or running job to stop; returns False when it is no longer running here."""
+    with _lock:
+        event = _cancel_events.get(job_id)
+        if event is None:
+            return False
+        event.set()
+        _execute(f"UPDATE {JOB_TABLE} SET cancel_requested = true WHERE job_id = ?", [job_id])
+        if _futures[job_id].cancel():
+            # Never started: no thread will record the outcome
+            _execute(f"UPDATE {JOB_TABLE} SET status = ?, finished_at = ? WHERE job_id = ?", [CANCELLED, _now(), job_id])
+            _cancel_events.pop(job_id)
+            _futures.pop(job_id)
+    return True
+
+def get_job(job_id):
+    """The job's row as a dict ("pair" and "summary" decoded), or None for an unknown id."""
+    with _lock:
+        rows = _execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM {JOB_TABLE} WHERE job_id = ?", [job_id])
+    return _job(rows[0]) if rows else None
+
+def list_jobs(limit=20):
+    """The most recently submitted jobs, newest first."""
+    with _lock:
+        rows = _execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM {JOB_TABLE} ORDER BY submitted_at DESC LIMIT ?", [limit])
+    return [_job(row) for row in rows]
+
+def latest_scheduled_jobs():
+    """The newest finished run of every schedule, by schedule name."""
+    with _lock:
+        rows = _execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM {JOB_TABLE} WHERE schedule IS NOT NULL AND status NOT IN (?, ?) "
+            "QUALIFY row_number() OVER (PARTITION BY schedule ORDER BY submitted_at DESC) = 1",
+            list(ACTIVE_STATUSES)
+        )
+    return {job["schedule"]: job for job in map(_job, rows)}
+
+def last_scheduled_runs():
+    """Submission time of the newest run of every schedule, finished or not, by schedule name."""
+    with _lock:
+        return dict(_execute(
+            f"SELECT schedule, max(submitted_at) FROM {JOB_TABLE} WHERE schedule IS NOT NULL GROUP BY schedule"
+        ))
+
+def schedule_trend(schedule):
+    """(finished_at, only_in_source, only_in_target) of a schedule's completed runs, oldest first."""
+    with _lock:
+        return _execute(
+            "SELECT finished_at, CAST(json_extract(summary, '$.counts.only_in_source') AS BIGINT), "
+            f"CAST(json_extract(summary, '$.counts.only_in_target') AS BIGINT) FROM {JOB_TABLE} "
+            "WHERE schedule = ? AND status = ? AND json_extract_string(summary, '$.status') IN ('match', 'different') "
+            "ORDER BY finished_at",
+            [schedule, DONE]
+        )
+
+def _remove_result_file(summary):
+    path = (json.loads(summary).get("export") or {}).get("path") if summary else None
+    if path and os.path.exists(path):
+        os.remove(path)
+        try:
+            os.rmdir(os.path.dirname(path))   # the export's own directory (see result_export.export_path)
+        except OSError:
+            pass
+
+def _prune_jobs(keep=JOB_RETENTION):
+    """Drop finished jobs beyond the newest `keep`, with their result files; the caller holds _lock.
+
+    Scheduled runs are kept for SCHEDULE_RETENTION_DAYS instead, as their counts make
+    the trend lines, but only the newest SCHEDULE_RESULT_FILES runs of a schedule keep
+    their rows file; older ones fall back to the preview rows of their summary.
+    """
+    old = _execute(
+        f"SELECT job_id, summary FROM {JOB_TABLE} WHERE status NOT IN (?, ?) AND schedule IS NULL "
+        f"ORDER BY submitted_at DESC OFFSET ?", [*ACTIVE_STATUSES, keep]
+    )
+    old += _execute(
+        f"SELECT job_id, summary FROM {JOB_TABLE} WHERE status NOT IN (?, ?) AND schedule IS NOT NULL "
+        "AND submitted_at < ?", [*ACTIVE_STATUSES, _now() - timedelta(days=SCHEDULE_RETENTION_DAYS)]
+    )
+    for job_id, summary in old:
+        _remove_result_file(summary)
+        _execute(f"DELETE FROM {JOB_TABLE} WHERE job_id = ?", [job_id])
+    superseded = _execute(
+        f"SELECT summary FROM {JOB_TABLE} WHERE schedule IS NOT NULL AND status = ? "
+        "QUALIFY row_number() OVER (PARTITION BY schedule ORDER BY submitted_at DESC) > ?",
+        [DONE, SCHEDULE_RESULT_FILES]
+    )
+    for (summary,) in superseded:
+        _remove_result_file(summary)
@@ -0,0 +1,41 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from run_profile import bind_run
+
+# ---------- Functions ----------
+def fetch_sides_concurrently(source_fetch, target_fetch, labels=("Source", "Target")):
+    """Run the source and target fetch callables at the same time, with a status box per side.
+
+    The callables run on worker threads, so they must not call Streamlit themselves:
+    they return their result or raise. Wall-clock time is the slower of the two sides.
+    If either side fails, both errors are shown and the script run stops.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="compare-fetch") as pool:
+        futures = {
+            pool.submit(bind_run(source_fetch)): labels[0],
+            pool.submit(bind_run(target_fetch)): labels[1],
+        }
+        statuses = {label: st.status(f"Fetching {label.lower()}...", state="running") for label in labels}
+        results, errors = {}, {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                label = futures[future]
+                elapsed = time.perf_counter() - start
+                try:
+                    results[label] = future.result()
+                    statuses[label].update(label=f"{label} fetched in {elapsed:.2f}s", state="complete")
+                except Exception as e:
+                    errors[label] = e
+                    statuses[label].update(label=f"{label} fetch failed after {elapsed:.2f}s", state="error")
+
+    for label, e in errors.items():
+        st.error(f"Error fetching {label.lower()}: {e}")
+    if errors:
+        st.stop()
+    return results[labels[0]], results[labels[1]]
@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+import snowflake.connector
+
+# ---------- Configuration ----------
+SNOWFLAKE_MAX_IDLE = int(os.environ.get("SNOWFLAKE_POOL_MAX_IDLE", "4"))        # idle sessions kept per connection key
+IDLE_TIMEOUT_SECONDS = int(os.environ.get("POOL_IDLE_TIMEOUT_SECONDS", "900"))   # idle sessions older than this are closed
+HEALTH_CHECK_AFTER_SECONDS = 60                                                   # ping sessions idle for longer than this
+DUCKDB_READ_ONLY = os.environ.get("DUCKDB_READ_ONLY", "0") == "1"                 # lets several processes share one file
+DUCKDB_IDLE_TIMEOUT_SECONDS = int(os.environ.get("DUCKDB_IDLE_TIMEOUT_SECONDS", "10"))   # unused DuckDB files are closed after this
+
+_lock = threading.Lock()
+_snowflake_idle = {}   # key -> [(connection, last_used)]
+_duckdb_connections = {}   # db_file -> long-lived connection; callers get per-thread cursors
+_duckdb_in_use = {}        # db_file -> cursors currently open
+_duckdb_last_used = {}     # db_file -> time its last cursor was closed
+_reaper = None
+_metrics = {
+    "snowflake_created": 0,
+    "snowflake_reused": 0,
+    "snowflake_health_check_failures": 0,
+    "snowflake_closed_idle": 0,
+    "snowflake_in_use": 0,
+    "duckdb_created": 0,
+    "duckdb_cursors": 0,
+    "duckdb_closed_idle": 0,
+}
+
+# An open DuckDB connection holds the file's lock, so no other process (compare_cli,
+# benchmark.py, a standalone scheduler, ...) can open the file, not even read-only.
+# Connections with no open cursor are closed after DUCKDB_IDLE_TIMEOUT_SECONDS, which
+# frees the file while the app is idle; the next cursor reopens it. The same reaper
+# thread closes pooled Snowflake sessions idle for IDLE_TIMEOUT_SECONDS, so they do not
+# stay logged in (and hold a Snowflake session) while no one runs a compare.
+
+# ---------- Functions ----------
+def _snowflake_key(conn_params):
+    return tuple(sorted((k, str(v)) for k, v in conn_params.items()))
+
+def snowflake_identity(conn_params):
+    """The parts of the Snowflake connection settings that decide what a query sees (no password)."""
+    return tuple(conn_params.get(k) for k in ("account", "user", "role", "warehouse", "database", "schema"))
+
+def duckdb_file_version(db_file):
+    """Modification time of a DuckDB file (or its WAL); it changes whenever the file's data does."""
+    if db_file == ":memory:":
+        return 0.0
+    paths = [path for path in (db_file, db_file + ".wal") if os.path.exists(path)]
+    return max((os.path.getmtime(path) for path in paths), default=0.0)
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+def _is_healthy(conn, last_used):
+    if conn.is_closed():
+        return False
+    if time.time() - last_used < HEALTH_CHECK_AFTER_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+def close_idle(max_idle_seconds=IDLE_TIMEOUT_SECONDS):
+    """Close pooled Snowflake sessions that have been idle longer than `max_idle_seconds`."""
+    now = time.time()
+    expired = []
+    with _lock:
+        for key, idle in _snowflake_idle.items():
+            keep = []
+            for conn, last_used in idle:
+                if now - last_used > max_idle_seconds:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            _snowflake_idle[key] = keep
+        _metrics["snowflake_closed_idle"] += len(expired)
+    for conn in expired:
+        _close_quietly(conn)
+
+def _acquire_snowflake(conn_params):
+    key = _snowflake_key(conn_params)
+    while True:
+        with _lock:
+            idle = _snowflake_idle.get(key)
+            if not idle:
+                break
+            conn, last_used = idle.pop()
+        if _is_healthy(conn, last_used):
+            with _lock:
+                _metrics["snowflake_reused"] += 1
+            return key, conn
+        with _lock:
+            _metrics["snowflake_health_check_failures"] += 1
+        _close_quietly(conn)
+
+    conn = snowflake.connector.connect(**conn_params)
+    with _lock:
+        _metrics["snowflake_created"] += 1
+    return key, conn
+
+def _release_snowflake(key, conn, broken):
+    if broken or conn.is_closed():
+        _close_quietly(conn)
+        return
+    with _lock:
+        idle = _snowflake_idle.setdefault(key, [])
+        if len(idle) < SNOWFLAKE_MAX_IDLE:
+            idle.append((conn, time.time()))
+            conn = None
+            _start_reaper()
+    if conn is not None:
+        _close_quietly(conn)
+
+@contextmanager
+def snowflake_connection(conn_params):
+    """Borrow an authenticated Snowflake session from the pool, returning it afterwards.
+
+    A session whose use raised a Snowflake error is closed instead of being returned.
+    """
+    close_idle()
+    key, conn = _acquire_snowflake(conn_params)
+    with _lock:
+        _metrics["snowflake_in_use"] += 1
+    broken = False
+    try:
+        yield conn
+    except snowflake.connector.errors.Error:
+        broken = True
+        raise
+    finally:
+        with _lock:
+            _metrics["snowflake_in_use"] -= 1
+        _release_snowflake(key, conn, broken)
+
+def _duckdb_root(db_file):
+    """The shared connection for `db_file`, opened if needed; the caller holds _lock."""
+    con = _duckdb_connections.get(db_file)
+    if con is None:
+        con = duckdb.connect(database=db_file, read_only=DUCKDB_READ_ONLY)
+        _duckdb_connections[db_file] = con
+        _metrics["duckdb_created"] += 1
+        _start_reaper()
+    return con
+
+def _duckdb_cursor(db_file):
+    # Under the lock, so an idle connection can't be closed between lookup and cursor()
+    with _lock:
+        try:
+            cur = _duckdb_root(db_file).cursor()
+        except duckdb.Error:
+            # The shared connection was closed or invalidated: reopen it once
+            if _duckdb_connections.pop(db_file, None) is None:
+                raise
+            cur = _duckdb_root(db_file).cursor()
+        _duckdb_in_use[db_file] = _duckdb_in_use.get(db_file, 0) + 1
+        _metrics["duckdb_cursors"] += 1
+        return cur
+
+def _release_duckdb(db_file, cur):
+    cur.close()
+    with _lock:
+        _duckdb_in_use[db_file] -= 1
+        _duckdb_last_used[db_file] = time.time()
+
+def close_idle_duckdb(max_idle_seconds=DUCKDB_IDLE_TIMEOUT_SECONDS):
+    """Close shared DuckDB connections without open cursors that have been unused for `max_idle_seconds`."""
+    now = time.time()
+    expired = []
+    with _lock:
+        for db_file in list(_duckdb_connections):
+            if not _duckdb_in_use.get(db_file) and now - _duckdb_last_used.get(db_file, now) >= max_idle_seconds:
+                expired.append(_duckdb_connections.pop(db_file))
+        _metrics["duckdb_closed_idle"] += len(expired)
+    for conn in expired:
+        _close_quietly(conn)
+
+def _reap_idle():
+    while True:
+        time.sleep(max(1, min(DUCKDB_IDLE_TIMEOUT_SECONDS, IDLE_TIMEOUT_SECONDS) / 2))
+        close_idle_duckdb()
+        close_idle()
+
+def _start_reaper():
+    """Start the thread closing idle DuckDB connections and Snowflake sessions; the caller holds _lock."""
+    global _reaper
+    if _reaper is None:
+        _reaper = threading.Thread(target=_reap_idle, name="pool-idle-close", daemon=True)
+        _reaper.start()
+
+@contextmanager
+def duckdb_connection(db_file):
+    """Per-thread cursor on a shared DuckDB connection for `db_file`.
+
+    Cursors share the database instance (and its caches) but have their own
+    transaction and temp tables, so concurrent Streamlit sessions stay isolated.
+    The shared connection is closed once it has been idle for a while (see above).
+    """
+    cur = _duckdb_cursor(db_file)
+    try:
+        yield cur
+    finally:
+        _release_duckdb(db_file, cur)
+
+def close_all():
+    with _lock:
+        idle = [conn for conns in _snowflake_idle.values() for conn, _ in conns]
+        _snowflake_idle.clear()
+        duck = list(_duckdb_connections.values())
+        _duckdb_connections.clear()
+    for conn in idle + duck:
+        _close_quietly(conn)
+
+def pool_metrics():
+    """Counters plus derived reuse rate, e.g. for a sidebar panel."""
+    with _lock:
+        metrics = dict(_metrics)
+        metrics["snowflake_idle"] = sum(len(idle) for idle in _snowflake_idle.values())
+        metrics["duckdb_open"] = len(_duckdb_connections)
+    checkouts = metrics["snowflake_created"] + metrics["snowflake_reused"]
+    metrics["snowflake_reuse_rate"] = metrics["snowflake_reused"] / checkouts if checkouts else 0.0
+    return metrics
@@ -1,10 +1,21 @@
+import html
+
 import streamlit as st
-import snowflake.connector
-import duckdb
+
+from compare_engine import diff_full_sides, fetch_full_sides, first_differences_compare
+from concurrent_fetch import fetch_sides_concurrently
+from connections import duckdb_connection
+from first_diff import DEFAULT_LIMIT as DEFAULT_FIRST_LIMIT, format_first_n_stats
+from profile_panel import profiled_run, render_profiler_option
+from query_cache import CACHE_DIR, cache_stats, clear_cache
+from result_viewer import clear_result, render_live_rows, render_result_viewer, save_relation_result, save_rows_result
+from run_profile import span
+from sql_diff import ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, fetch_columns, subquery
+from transfer import format_transfer_stats
 
 # ---------- Configuration ----------
 DUCKDB_FILE = "mydata.duckdb"
-INTERMEDIATE_DB = ":memory:"
+RAW_PREVIEW_ROWS = 100
 
 def get_snowflake_config():
     return {
@@ -18,73 +29,84 @@ def get_snowflake_config():
     }
 
 # ---------- Functions ----------
-def fetch_query_snowflake_to_duckdb(sql_query, conn_params, intermediate_db, target_table_name):
-    try:
-        with snowflake.connector.connect(**conn_params) as conn:
-            with conn.cursor() as cur:
-                cur.execute(sql_query)
-                data = cur.fetchall()
-                columns = [desc[0] for desc in cur.description]
-
-        if not data:
-            st.warning("Source query returned no data!")
-            return columns, []
-
-        with duckdb.connect(intermediate_db) as con:
-            con.execute(f'DROP TABLE IF EXISTS "{target_table_name}"')
-            col_defs = ", ".join([f'"{col}" TEXT' for col in columns])
-            con.execute(f'CREATE TABLE "{target_table_name}" ({col_defs})')
-
-            placeholders = ", ".join(["?"] * len(columns))
-            con.executemany(
-                f'INSERT INTO "{target_table_name}" VALUES ({placeholders})',
-                data
-            )
-
-        return columns, data
-    except Exception as e:
-        st.error(f"Error fetching data from Snowflake: {e}")
-        return [], []
-
-def fetch_data_from_duckdb_query(sql_query, db_file):
-    try:
-        with duckdb.connect(database=db_file) as con:
-            res = con.execute(sql_query)
-            cols = [desc[0] for desc in res.description]
-            rows = res.fetchall()
-        return cols, rows
-    except Exception as e:
-        st.error(f"Error fetching data from DuckDB: {e}")
-        return [], []
-
-def compare_data(source_data, target_data):
-    source_set = set(map(lambda r: (r,) if not isinstance(r, (list, tuple)) else tuple(r), source_data))
-    target_set = set(map(lambda r: (r,) if not isinstance(r, (list, tuple)) else tuple(r), target_data))
-    in_source_not_target = list(source_set - target_set)
-    in_target_not_source = list(target_set - source_set)
-    return in_source_not_target, in_target_not_source
-
-def normalize_columns(cols):
-    return [col.strip().lower() for col in cols]
-
-def flatten_rows(rows):
-    """Flatten rows of one-column data: [(1,), (2,), ...] -> [1, 2, ...]."""
-    if rows and len(rows[0]) == 1:
-        return [r[0] for r in rows]
-    return rows
-
-def render_table(columns, data, title):
+def render_table(columns, data, title, total):
     st.write(f"#### {title}")
-    html = "<table style='border-collapse: collapse; width: 100%;'>"
-    html += "<tr>" + "".join([f"<th style='border:1px solid #999; padding:4px;'>{col}</th>" for col in columns]) + "</tr>"
+    if total > len(data):
+        st.caption(f"Showing the first {len(data):,} of {total:,} rows")
+    with span("render_preview") as render:
+        table_html = build_table_html(columns, data)
+        render.update(rows=len(data), bytes=len(table_html))
+    st.markdown(table_html, unsafe_allow_html=True)
+
+def render_cache_controls():
+    """Sidebar switch for the shared query cache, with its size and a button to empty it."""
+    use_cache = st.sidebar.checkbox(
+        "Reuse cached query results",
+        value=True,
+        help="Snowflake query results are kept as Parquet, shared by all sessions, and reused until the tables "
+             "they read change. Only queries over base tables of the current schema, without CURRENT_DATE, "
+             "RANDOM, SAMPLE and the like, are cached."
+    )
+    with st.sidebar.expander("Query cache"):
+        stats = cache_stats()
+        st.caption(f"{stats['entries']} entries · {stats['mb']} of {stats['max_mb']} MB in {CACHE_DIR}/")
+        if st.button("Clear query cache"):
+            clear_cache()
+            st.rerun()
+    return use_cache
+
+def render_first_n_options():
+    """Early-exit settings: (N, scan key column or None), or None for a full compare."""
+    if not st.checkbox("Stop after the first N differences",
+                       help="For triage: rows show up as they are found and the scan stops at N. "
+                            "The query previews and the query cache are skipped."):
+        return None
+    col1, col2 = st.columns(2)
+    first_limit = int(col1.number_input("N", min_value=1, value=DEFAULT_FIRST_LIMIT, step=10))
+    scan_column = col2.text_input(
+        "Scan key column (optional)",
+        help="A numeric column of the target query, e.g. an id. Both queries are diffed range by range, "
+             "smallest ranges first, so the first differences show up without running them to the end."
+    )
+    return first_limit, scan_column.strip() or None
+
+def run_first_differences(con, source_type, source_query, target_query, first_limit, scan_column):
+    live = st.empty()
+    target_relation = subquery(target_query)
+    columns = fetch_columns(con, target_relation)
+    result = first_differences_compare(
+        con, source_type, subquery(source_query), target_relation, scan_column, first_limit,
+        get_snowflake_config() if source_type == "Snowflake" else None,
+        on_rows=lambda only_in_source, only_in_target, scanned: render_live_rows(
+            live, columns, only_in_source, only_in_target,
+            f"Differences found so far: {len(only_in_source) + len(only_in_target):,} of {first_limit:,}"
+        )
+    )
+    live.empty()
+    if not result["columns_match"]:
+        st.warning("⚠️ Column mismatch detected!")
+        st.write("Source columns:", result["source"]["columns"])
+        st.write("Target columns:", result["target"]["columns"])
+        return
+    st.caption(format_first_n_stats(result["first_n"]))
+    save_rows_result(result["columns"], result["only_in_source"], result["only_in_target"])
+
+def build_table_html(columns, data):
+    parts = ["<table style='border-collapse: collapse; width: 100%;'>", "<tr>"]
+    parts.extend(f"<th style='border:1px solid #999; padding:4px;'>{html.escape(str(col))}</th>" for col in columns)
+    parts.append("</tr>")
     for row in data:
-        html += "<tr>" + "".join([f"<td style='border:1px solid #999; padding:4px;'>{val}</td>" for val in row]) + "</tr>"
-    html += "</table>"
-    st.markdown(html, unsafe_allow_html=True)
+        parts.append("<tr>")
+        parts.extend(f"<td style='border:1px solid #999; padding:4px;'>{html.escape(str(val))}</td>" for val in row)
+        parts.append("</tr>")
+    parts.append("</table>")
+    return "".join(parts)
 
 # ---------- UI ----------
 st.set_page_config(page_title="Data Comparison Tool - Differences Only", layout="wide")
 st.title("🔍 Data Comparison Tool - Query-based Differences")
+profiler = render_profiler_option()
+use_cache = render_cache_controls()
 
 col1, col2 = st.columns(2)
 
@@ -103,72 +125,61 @@ with col2:
         "SELECT * FROM my_table LIMIT 10"
     )
 
-if st.button("Show Differences Only"):
-    st.write("---")
-
-    # Fetch Source data
-    if source_type == "Snowflake":
-        sf_config = get_snowflake_config()
-        sf_cols, sf_data = fetch_query_snowflake_to_duckdb(
-            source_query,
-            sf_config,
-            INTERMEDIATE_DB,
-            "intermediate_source"
-        )
-    else:
-        sf_cols, sf_data = fetch_data_from_duckdb_query(source_query, DUCKDB_FILE)
-
-    # Fetch Target data
-    duckdb_cols, duckdb_data = fetch_data_from_duckdb_query(target_query, DUCKDB_FILE)
-
-    # Display raw data (no tuples)
-    if sf_cols and sf_data:
-        sf_data = [list(row) if isinstance(row, (list, tuple)) else [row] for row in sf_data]
-        render_table(sf_cols, sf_data, "🔹 Source Query Results")
-    else:
-        st.warning("No data in Source Query results.")
-
-    if duckdb_cols and duckdb_data:
-        duckdb_data = [list(row) if isinstance(row, (list, tuple)) else [row] for row in duckdb_data]
-        render_table(duckdb_cols, duckdb_data, "🔸 Target Query Results")
-    else:
-        st.warning("No data in Target Query results.")
-
-    # Normalize and flatten for comparison
-    sf_cols_normalized = normalize_columns(sf_cols)
-    duckdb_cols_normalized = normalize_columns(duckdb_cols)
-
-    if sf_cols_normalized != duckdb_cols_normalized:
-        st.warning("⚠️ Column mismatch detected! (but data differences will still be shown)")
-        st.write("Source columns:", sf_cols)
-        st.write("Target columns:", duckdb_cols)
-
-    sf_data_flat = flatten_rows(sf_data)
-    duckdb_data_flat = flatten_rows(duckdb_data)
-
-    only_in_source, only_in_target = compare_data(sf_data_flat, duckdb_data_flat)
-
-    if only_in_source or only_in_target:
-        st.write("### 🟢🔴 Data Differences Interleaved")
-        max_rows = max(len(only_in_source), len(only_in_target))
-        html = "<table style='border-collapse: collapse; width: 100%;'>"
-        html += "<tr><th>Data Source</th>" + "".join([f"<th>{col}</th>" for col in sf_cols]) + "</tr>"
-
-        for i in range(max_rows):
-            if i < len(only_in_source):
-                row = only_in_source[i]
-                color = "#00FF00"
-                row_data = list(row) if isinstance(row, (list, tuple)) else [row]
-                html += "<tr><td style='color:{}; font-weight:bold;'>Source</td>".format(color)
-                html += "".join([f"<td style='color:{color};'>{val}</td>" for val in row_data]) + "</tr>"
-            if i < len(only_in_target):
-                row = only_in_target[i]
-                color = "#FF0000"
-                row_data = list(row) if isinstance(row, (list, tuple)) else [row]
-                html += "<tr><td style='color:{}; font-weight:bold;'>Target</td>".format(color)
-                html += "".join([f"<td style='color:{color};'>{val}</td>" for val in row_data]) + "</tr>"
-
-        html += "</table>"
-        st.markdown(html, unsafe_allow_html=True)
-    else:
-        st.success("🎉 No differences found! Source and Target data are identical.")
+first_n = render_first_n_options()
+compare_clicked = st.button("Show Differences Only")
+run_params = {"source_type": source_type, "source_query": source_query, "target_query": target_query,
+              "cache": use_cache, "first_n": first_n}
+with profiled_run("diff.py", run_params, compare_clicked, profiler):
+    if compare_clicked:
+        st.write("---")
+        clear_result()
+
+        if first_n:
+            with duckdb_connection(DUCKDB_FILE) as con:
+                try:
+                    run_first_differences(con, source_type, source_query, target_query, *first_n)
+                except Exception as e:
+                    st.error(f"Error comparing data in DuckDB: {e}")
+        else:
+            with duckdb_connection(DUCKDB_FILE) as con:
+                # Stage / resolve Source data while the Target query is previewed
+                result = fetch_full_sides(
+                    con,
+                    source_type,
+                    subquery(source_query),
+                    subquery(target_query),
+                    get_snowflake_config() if source_type == "Snowflake" else None,
+                    DUCKDB_FILE,
+                    fetch_sides_concurrently,
+                    RAW_PREVIEW_ROWS,
+                    use_cache
+                )
+                source, target = result["source"], result["target"]
+                if source.get("transfer"):
+                    st.caption(format_transfer_stats(source["transfer"]))
+                if use_cache and source_type == "Snowflake":
+                    st.caption(f"Query cache · source: {source.get('cache') or 'not cacheable'}")
+
+                # Display a preview of the raw data
+                if source["columns"] and source["preview"]:
+                    render_table(source["columns"], source["preview"], "🔹 Source Query Results", source["rows"])
+                else:
+                    st.warning("No data in Source Query results.")
+
+                if target["columns"] and target["preview"]:
+                    render_table(target["columns"], target["preview"], "🔸 Target Query Results", target["rows"])
+                else:
+                    st.warning("No data in Target Query results.")
+
+                if not result["columns_match"]:
+                    st.warning("⚠️ Column mismatch detected! (but data differences will still be shown)")
+                    st.write("Source columns:", source["columns"])
+                    st.write("Target columns:", target["columns"])
+
+                try:
+                    diff_full_sides(con, result)
+                    save_relation_result(con, result["columns"], ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, result["counts"])
+                except Exception as e:
+                    st.error(f"Error comparing data in DuckDB: {e}")
+
+    render_result_viewer("### 🟢🔴 Data Differences Interleaved")
@@ -1,6 +1,12 @@
 import streamlit as st
-import snowflake.connector
-import duckdb
+
+from catalog import duckdb_catalog, render_catalog_controls, snowflake_catalog
+from compare_engine import hashed_compare
+from concurrent_fetch import fetch_sides_concurrently
+from profile_panel import profiled_run, render_profiler_option
+from result_history import RUN_INDEX_TABLE, SOURCE_HISTORY_TABLE, TARGET_HISTORY_TABLE, save_diff_run
+from result_viewer import clear_result, render_result_viewer, save_arrow_result
+from run_profile import span
 
 # ---------- Configuration ----------
 DUCKDB_FILE = "mydata.duckdb"
@@ -19,75 +25,24 @@ def get_snowflake_config():
 # ---------- Functions ----------
 def get_snowflake_tables(conn_params):
     try:
-        conn = snowflake.connector.connect(**conn_params)
-        cur = conn.cursor()
-        cur.execute("SHOW TABLES")
-        tables = [row[1] for row in cur.fetchall()]
-        cur.close()
-        conn.close()
-        return tables
+        return list(snowflake_catalog(conn_params)["tables"])
     except Exception as e:
         st.error(f"Error fetching Snowflake tables: {e}")
         return []
 
 def get_duckdb_tables(db_file):
     try:
-        con = duckdb.connect(database=db_file)
-        res = con.execute("SHOW TABLES").fetchall()
-        con.close()
-        return [row[0] for row in res]
+        return list(duckdb_catalog(db_file)["tables"])
     except Exception as e:
         st.error(f"Error fetching DuckDB tables: {e}")
         return []
 
-def fetch_data_from_snowflake(table, conn_params):
-    conn = snowflake.connector.connect(**conn_params)
-    cur = conn.cursor()
-    cur.execute(f'SELECT * FROM {table}')
-    cols = [desc[0] for desc in cur.description]
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return cols, rows
-
-def fetch_data_from_duckdb(table, db_file):
-    con = duckdb.connect(database=db_file)
-    res = con.execute(f'SELECT * FROM {table}')
-    cols = [desc[0] for desc in res.description]
-    rows = res.fetchall()
-    con.close()
-    return cols, rows
-
-def store_non_matching_rows(table_name, cols, rows, db_file):
-    if not rows:
-        return
-    con = duckdb.connect(database=db_file)
-    col_defs = ", ".join([f"{col} TEXT" for col in cols])
-    con.execute(f'CREATE TABLE IF NOT EXISTS {table_name} ({col_defs})')
-    placeholders = ", ".join(["?" for _ in cols])
-    con.executemany(
-        f'INSERT INTO {table_name} VALUES ({placeholders})',
-        [tuple(str(item) for item in row) for row in rows]
-    )
-    con.close()
-
-def compare_data(source_data, target_data):
-    source_set = set(source_data)
-    target_set = set(target_data)
-
-    in_source_not_target = list(source_set - target_set)
-    in_target_not_source = list(target_set - source_set)
-
-    return in_source_not_target, in_target_not_source
-
-def map_rows_to_dicts(cols, rows):
-    """Helper to map rows to dicts using lowercase column names."""
-    cols_lower = [col.lower() for col in cols]
-    return [dict(zip(cols_lower, row)) for row in rows]
-
 # ---------- Streamlit UI ----------
 st.title("Data Comparison Tool with Column-Insensitive Row-wise Differences")
 
+render_catalog_controls()
+profiler = render_profiler_option()
+
 # Layout
 col1, col2 = st.columns(2)
 
@@ -115,55 +70,44 @@ with col2:
     target_table = st.selectbox("Select Target Table", duckdb_tables)
 
 # ---------- Compare Button ----------
-if st.button("Do Diff and Store Differences"):
-    # Fetch data
-    if source_type == "Snowflake":
-        sf_cols, sf_data = fetch_data_from_snowflake(sf_table, sf_config)
-    else:
-        sf_cols, sf_data = fetch_data_from_duckdb(sf_table, DUCKDB_FILE)
-
-    duckdb_cols, duckdb_data = fetch_data_from_duckdb(target_table, DUCKDB_FILE)
-
-    # Convert rows to dicts with lowercase column names
-    sf_dict_data = map_rows_to_dicts(sf_cols, sf_data)
-    duckdb_dict_data = map_rows_to_dicts(duckdb_cols, duckdb_data)
-
-    # Convert dicts to sorted tuples of (key, value) pairs to make them hashable and comparable
-    sf_tuples = [tuple(sorted(d.items())) for d in sf_dict_data]
-    duckdb_tuples = [tuple(sorted(d.items())) for d in duckdb_dict_data]
-
-    # Compare
-    only_in_source, only_in_target = compare_data(sf_tuples, duckdb_tuples)
-
-    st.write("---")
-    st.subheader("Comparison Results (Row-wise Differences)")
-
-    # Show and store differences
-    if only_in_source:
-        st.markdown("**Rows in Source but not in Target:**")
-        in_source_dicts = [dict(row) for row in only_in_source]
-        st.table(in_source_dicts)
-        # Extract columns from the first row
-        store_non_matching_rows("only_in_source", [k for k, _ in only_in_source[0]], [tuple(v for _, v in row) for row in only_in_source], DUCKDB_FILE)
-        st.success(f"Stored {len(only_in_source)} rows as 'only_in_source' in DuckDB.")
-    else:
-        st.success("No extra rows in Source.")
-
-    if only_in_target:
-        st.markdown("**Rows in Target but not in Source:**")
-        in_target_dicts = [dict(row) for row in only_in_target]
-        st.table(in_target_dicts)
-        store_non_matching_rows("only_in_target", [k for k, _ in only_in_target[0]], [tuple(v for _, v in row) for row in only_in_target], DUCKDB_FILE)
-        st.success(f"Stored {len(only_in_target)} rows as 'only_in_target' in DuckDB.")
-    else:
-        st.success("No extra rows in Target.")
-
-# Style
-st.markdown(
-    """
-    <style>
-    .stTable { background-color: #151515; color: #DDDDDD; }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+compare_clicked = st.button("Do Diff and Store Differences")
+run_params = {"source_type": source_type, "source_table": sf_table, "target_table": target_table}
+with profiled_run("employee_compare.py", run_params, compare_clicked, profiler) as profile:
+    if compare_clicked:
+        clear_result()
+        # Fetch both sides as row hashes and diff them by lower-cased column name
+        try:
+            result = hashed_compare(source_type, sf_table, target_table, sf_config, DUCKDB_FILE,
+                                    fetch_sides_concurrently)
+        except Exception as e:
+            st.error(f"Error fetching data: {e}")
+            st.stop()
+        if not result["columns_match"]:
+            st.error("⚠️ Column mismatch detected!")
+            st.write("Source columns:", result["source"]["columns"])
+            st.write("Target columns:", result["target"]["columns"])
+            st.stop()
+        only_in_source, only_in_target = result["only_in_source"], result["only_in_target"]
+
+        # Differences are paged from the result store, so only one page is ever rendered
+        st.write("---")
+        save_arrow_result(result["columns"], only_in_source, only_in_target, result["counts"])
+
+        # Store both sides' Arrow tables under this run's id (typed, in one transaction)
+        try:
+            with span("store_rows", rows=only_in_source.num_rows + only_in_target.num_rows):
+                save_diff_run(
+                    DUCKDB_FILE,
+                    profile["run_id"],
+                    dict(run_params, page="employee_compare.py"),
+                    only_in_source,
+                    only_in_target
+                )
+            st.success(
+                f"Stored {only_in_source.num_rows} rows in '{SOURCE_HISTORY_TABLE}' and {only_in_target.num_rows} rows in "
+                f"'{TARGET_HISTORY_TABLE}' as run {profile['run_id']} (see '{RUN_INDEX_TABLE}')."
+            )
+        except Exception as e:
+            st.error(f"Error storing differences: {e}")
+
+    render_result_viewer("### Comparison Results (Row-wise Differences)")
@@ -0,0 +1,66 @@
+from decimal import Decimal
+from numbers import Number
+
+from sql_diff import quote_ident, sql_literal
+
+# ---------- Configuration ----------
+DEFAULT_LIMIT = 100
+FIRST_RANGES = 1024    # the first range covers 1/1024 of the key span, each next one twice the previous
+
+# An anti-join over whole tables has to build its hash table from the entire right
+# side before the first row comes out. Scanning both sides key range by key range
+# (DuckDB and Snowflake prune the scans with min/max metadata) keeps the first scans
+# small, and diffing the same range on both sides finds exactly the rows a full
+# compare would find in that range.
+
+# ---------- Functions ----------
+def _as_number(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+def key_bounds(*min_max):
+    """(low, high) over the (min, max) pairs of both sides; None when the key is not numeric or all NULL."""
+    values = [_as_number(v) for pair in min_max for v in pair if v is not None]
+    if not values or not all(isinstance(v, Number) and not isinstance(v, bool) for v in values):
+        return None
+    return min(values), max(values)
+
+def key_ranges(low, high, first_ranges=FIRST_RANGES):
+    """Contiguous (start, end) ranges from `low` up, doubling in width; the last has end None (open)."""
+    if isinstance(low, int) and isinstance(high, int):
+        width = max(1, -(-(high - low) // first_ranges))
+    else:
+        width = (high - low) / first_ranges or 1.0
+    start = low
+    while start + width <= high:
+        yield start, start + width
+        start, width = start + width, width * 2
+    yield start, None
+
+def range_predicate(column, start, end):
+    """WHERE clause of one key range; start None selects the rows whose key is NULL."""
+    col = quote_ident(column)
+    if start is None:
+        return f"{col} IS NULL"
+    predicate = f"{col} >= {sql_literal(start)}"
+    return predicate if end is None else f"{predicate} AND {col} < {sql_literal(end)}"
+
+def scan_ranges(bounds):
+    """(start, end, share of the key span scanned once done) per range, ending with the NULL keys."""
+    low, high = bounds
+    for start, end in key_ranges(low, high):
+        yield start, end, 1.0 if end is None or high == low else (end - low) / (high - low)
+    yield None, None, 1.0
+
+def format_first_n_stats(stats):
+    ranges = f"{stats['ranges']} key range{'s' if stats['ranges'] != 1 else ''}"
+    first = stats["first_difference_seconds"]
+    parts = [f"First difference after {first:.2f}s" if first is not None else "No differences"]
+    key = f" of the {stats['key_column']} range" if stats["key_column"] else ""
+    if stats["complete"]:
+        parts.append(f"scan complete: these are all the differences ({ranges}, {stats['seconds']:.2f}s)")
+    else:
+        parts.append(f"stopped at {stats['limit']:,} differences after scanning {stats['scanned']:.1%}{key} "
+                     f"({ranges}, {stats['seconds']:.2f}s)")
+    return " · ".join(parts)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from checksum_diff import NULL_MARKER, hash_columns_sql
+from sql_diff import ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, quote_ident, sql_literal
+
+# ---------- Configuration ----------
+DATE_UNITS = ("day", "week", "month", "year")
+FINGERPRINT_DB_SUFFIX = ".fingerprints.duckdb"
+STATE_ALIAS = "partition_fingerprints"
+STATE_TABLE = "partition_state"
+
+# Each run stores, per table pair and partition, the (row count, row-hash sum) of both
+# sides plus the differing rows it found. The next run recomputes the fingerprints in
+# place on both engines and only fetches and diffs partitions that differ now and
+# whose fingerprints moved since the stored run; the rest reuse the stored rows.
+# Stored state only counts for a run with the same settings (column types and
+# normalization rules): a row that differed under the old rules may not under the new.
+
+# ---------- Functions ----------
+def validate_partition(partition):
+    """(column, by) from {"column": ..., "by": "day" | "week" | "month" | "year" | <key range size>}."""
+    if not isinstance(partition, dict) or not partition.get("column"):
+        raise ValueError('The partition needs a "column"')
+    by = partition.get("by", "day")
+    if by not in DATE_UNITS and not (isinstance(by, int) and not isinstance(by, bool) and by > 0):
+        raise ValueError(f"Partition by must be one of {', '.join(DATE_UNITS)} or a positive key range size")
+    return partition["column"], by
+
+def partition_expr(dialect, column, by):
+    """Text partition label of a row: the truncated date (YYYY-MM-DD) or the key range number."""
+    col = quote_ident(column)
+    if dialect == "snowflake":
+        label = (f"TO_VARCHAR(DATE_TRUNC('{by}', {col})::DATE, 'YYYY-MM-DD')" if by in DATE_UNITS
+                 else f"TO_VARCHAR(FLOOR({col} / {int(by)}))")
+        return f"COALESCE({label}, '{NULL_MARKER}')"
+    label = (f"CAST(CAST(date_trunc('{by}', {col}) AS DATE) AS VARCHAR)" if by in DATE_UNITS
+             else f"CAST(CAST(floor({col} / {int(by)}) AS BIGINT) AS VARCHAR)")
+    return f"coalesce({label}, '{NULL_MARKER}')"
+
+def fingerprint_query(dialect, relation, columns, column, by, kinds=None):
+    """Per-partition row count and sum of 60-bit row hashes, grouped in the engine.
+    `kinds` is checksum_diff.column_kinds of the columns."""
+    return (
+        f"SELECT {partition_expr(dialect, column, by)} AS _partition, count(*), "
+        f"sum({hash_columns_sql(dialect, columns, kinds)}) FROM {relation} GROUP BY 1"
+    )
+
+def read_fingerprints(rows):
+    return {partition: (int(count), int(hash_sum)) for partition, count, hash_sum in rows}
+
+def partition_query(dialect, relation, columns, column, by, partitions, aliases=None):
+    """SELECT the rows of the given partitions, optionally renaming the columns."""
+    aliases = aliases or columns
+    select = ", ".join(f"{quote_ident(col)} AS {quote_ident(alias)}" for col, alias in zip(columns, aliases))
+    values = ", ".join(sql_literal(p) for p in sorted(partitions))
+    return f"SELECT {select} FROM {relation} WHERE {partition_expr(dialect, column, by)} IN ({values})"
+
+def fingerprint_db(db_file):
+    """The fingerprint store kept next to a DuckDB file, e.g. mydata.fingerprints.duckdb."""
+    return os.path.splitext(db_file)[0] + FINGERPRINT_DB_SUFFIX
+
+def pair_id(source_type, source_table, target_table, columns, column, by):
+    payload = json.dumps([source_type, source_table, target_table, list(columns), column, by])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def state_settings(source_types, target_types, rules):
+    """Fingerprint of what the stored rows depend on besides the data: both sides'
+    (column, type) lists and the normalization rules."""
+    payload = json.dumps([source_types, target_types, rules or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def attach_state(con, db_file):
+    con.execute(f"ATTACH IF NOT EXISTS {sql_literal(fingerprint_db(db_file))} AS {STATE_ALIAS}")
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {STATE_ALIAS}.{STATE_TABLE} (pair_id VARCHAR, partition VARCHAR, "
+        "source_count BIGINT, source_hash VARCHAR, target_count BIGINT, target_hash VARCHAR, checked_at TIMESTAMPTZ, "
+        "settings VARCHAR)"
+    )
+    con.execute(f"ALTER TABLE {STATE_ALIAS}.{STATE_TABLE} ADD COLUMN IF NOT EXISTS settings VARCHAR")
+
+def _rows_table(pid):
+    return f"{STATE_ALIAS}.{quote_ident('rows_' + pid)}"
+
+def load_state(con, pid, settings):
+    """{partition: (source fingerprint, target fingerprint)} stored by the previous run of a pair,
+    or {} when that run had other settings (see state_settings)."""
+    rows = con.execute(
+        f"SELECT partition, source_count, source_hash, target_count, target_hash "
+        f"FROM {STATE_ALIAS}.{STATE_TABLE} WHERE pair_id = ? AND settings = ?", [pid, settings]
+    ).fetchall()
+    return {p: ((sc, int(sh)), (tc, int(th))) for p, sc, sh, tc, th in rows}
+
+def plan_partitions(source_fps, target_fps, previous):
+    """Split partitions into "equal" (same fingerprint on both sides), "reused" (differ, but
+    neither side changed since the stored run) and "changed" (must be fetched and diffed)."""
+    plan = {"equal": [], "reused": [], "changed": []}
+    for partition in sorted(set(source_fps) | set(target_fps)):
+        current = (source_fps.get(partition, (0, 0)), target_fps.get(partition, (0, 0)))
+        if current[0] == current[1]:
+            plan["equal"].append(partition)
+        elif previous.get(partition) == current:
+            plan["reused"].append(partition)
+        else:
+            plan["changed"].append(partition)
+    return plan
+
+def save_partitions(con, pid, settings, plan, source_fps, target_fps, column, by, diffed):
+    """Store this run's fingerprints and differing rows, then rebuild the ONLY_IN_* temp tables
+    from the stored rows so they hold the reused partitions' rows as well.
+
+    `diffed` is True when the ONLY_IN_* tables hold the diff of the changed partitions.
+    The old state is dropped first, so an interrupted run makes the next one re-diff
+    everything rather than reuse rows that were already replaced. With nothing reused
+    the rows table is recreated, so it takes this run's column types.
+    """
+    con.execute(f"DELETE FROM {STATE_ALIAS}.{STATE_TABLE} WHERE pair_id = ?", [pid])
+    rows_table = _rows_table(pid)
+    label = partition_expr("duckdb", column, by)
+    if diffed:
+        con.execute(
+            f"CREATE {'TABLE IF NOT EXISTS' if plan['reused'] else 'OR REPLACE TABLE'} {rows_table} AS "
+            f"SELECT ''::VARCHAR AS _side, ''::VARCHAR AS _partition, * FROM {ONLY_IN_SOURCE_TABLE} LIMIT 0"
+        )
+    exists = con.execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE database_name = ? AND table_name = ?",
+        [STATE_ALIAS, "rows_" + pid]
+    ).fetchone()[0]
+    if exists:
+        con.execute(f"DELETE FROM {rows_table} WHERE NOT list_contains(?, _partition)", [plan["reused"]])
+        if diffed:
+            for side, table in (("Source", ONLY_IN_SOURCE_TABLE), ("Target", ONLY_IN_TARGET_TABLE)):
+                con.execute(f"INSERT INTO {rows_table} SELECT ?, {label}, * FROM {table}", [side])
+        for side, table in (("Source", ONLY_IN_SOURCE_TABLE), ("Target", ONLY_IN_TARGET_TABLE)):
+            con.execute(
+                f"CREATE OR REPLACE TEMP TABLE {table} AS "
+                f"SELECT * EXCLUDE (_side, _partition) FROM {rows_table} WHERE _side = ?", [side]
+            )
+
+    checked_at = datetime.now(timezone.utc)
+    state = []
+    for partition in plan["reused"] + plan["changed"]:
+        source_fp = source_fps.get(partition, (0, 0))
+        target_fp = target_fps.get(partition, (0, 0))
+        state.append([pid, partition, source_fp[0], str(source_fp[1]), target_fp[0], str(target_fp[1]), checked_at,
+                      settings])
+    if state:
+        con.executemany(
+            f"INSERT INTO {STATE_ALIAS}.{STATE_TABLE} (pair_id, partition, source_count, source_hash, target_count, "
+            "target_hash, checked_at, settings) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", state
+        )
+    return bool(exists)
@@ -0,0 +1,147 @@
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+import streamlit as st
+
+from compare_jobs import (ACTIVE_STATUSES, CANCELLED, DONE, FAILED, cancel_job, get_job, latest_scheduled_jobs,
+                          list_jobs, schedule_trend)
+from connections import duckdb_connection
+from result_export import SIDE_COLUMN
+from result_viewer import clear_result, save_relation_result, save_rows_result
+from sql_diff import fetch_columns, sql_literal
+
+# ---------- Configuration ----------
+JOB_QUERY_PARAM = "job"
+LOADED_JOB_KEY = "loaded_job"
+POLL_SECONDS = 2
+RECENT_JOBS = 10
+TREND_HEIGHT = 160
+
+# The attached job lives in the URL (?job=<id>), so it survives a browser refresh and
+# the link can be shared; the panel polls the job store while the job is active.
+
+# ---------- Functions ----------
+def attach_job(job_id):
+    st.query_params[JOB_QUERY_PARAM] = job_id
+    st.session_state.pop(LOADED_JOB_KEY, None)
+
+def detach_job():
+    st.query_params.pop(JOB_QUERY_PARAM, None)
+    st.session_state.pop(LOADED_JOB_KEY, None)
+
+def attached_job():
+    return st.query_params.get(JOB_QUERY_PARAM)
+
+def _pair_label(pair):
+    return f"{pair['source']} → {pair['target']} ({pair.get('mode', 'full')})"
+
+def _elapsed(job):
+    if job["started_at"] is None:
+        return "waiting for a worker"
+    end = job["finished_at"] or datetime.now(timezone.utc)
+    return f"{(end - job['started_at']).total_seconds():,.1f}s"
+
+def load_job_result(job):
+    """Put a finished job's differing rows into this session's result viewer, once per job."""
+    if st.session_state.get(LOADED_JOB_KEY) == job["job_id"]:
+        return
+    st.session_state[LOADED_JOB_KEY] = job["job_id"]
+    clear_result()
+    summary = job["summary"]
+    if job["status"] != DONE or "only_in_source" not in summary:
+        return
+    export = summary.get("export")
+    if export and os.path.exists(export["path"]):
+        rows = f"read_parquet({sql_literal(export['path'])})"
+        with duckdb_connection(":memory:") as con:
+            columns = [col for col in fetch_columns(con, rows) if col != SIDE_COLUMN]
+            side = lambda name: f"(SELECT * EXCLUDE ({SIDE_COLUMN}) FROM {rows} WHERE {SIDE_COLUMN} = '{name}')"
+            save_relation_result(con, columns, side("Source"), side("Target"), summary["counts"])
+    else:
+        # The result file was pruned: only the preview rows of the summary are left
+        save_rows_result(summary["target_columns"], summary["only_in_source"], summary["only_in_target"],
+                         summary["counts"])
+
+def _render_active_job(job_id):
+    job = get_job(job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        st.rerun()   # finished: rerun the whole page to show the result
+    stage = f" · {job['stage']}" if job["stage"] else ""
+    if job["stage_rows"] is not None:
+        stage += f" ({job['stage_rows']:,} rows)"
+    st.info(f"⏳ Job {job_id}: {_pair_label(job['pair'])} · {job['status']}{stage} · {_elapsed(job)}")
+    if job["cancel_requested"]:
+        st.caption("Cancelling: the job stops when its current stage finishes.")
+    else:
+        st.button("Cancel job", on_click=cancel_job, args=(job_id,))
+
+def render_job_panel():
+    """Status of the job attached to this page, polled while it runs.
+
+    Returns the job dict once it has finished (its rows are in the result viewer by
+    then), otherwise None.
+    """
+    job_id = attached_job()
+    if not job_id:
+        return None
+    job = get_job(job_id)
+    st.write("---")
+    if job is None:
+        st.warning(f"Job {job_id} is no longer in the job store.")
+        return None
+    if job["status"] in ACTIVE_STATUSES:
+        st.fragment(_render_active_job, run_every=POLL_SECONDS)(job_id)
+        return None
+
+    st.caption(f"Job {job_id}: {_pair_label(job['pair'])} · {job['status']} after {_elapsed(job)}")
+    if job["status"] == FAILED:
+        st.error(f"Job failed: {job['error']}")
+    elif job["status"] == CANCELLED:
+        st.warning("Job cancelled.")
+    load_job_result(job)
+    return job
+
+def render_recent_jobs():
+    """Sidebar list of recent background jobs of every session; a click attaches this page to one."""
+    jobs = list_jobs(RECENT_JOBS)
+    if not jobs:
+        return
+    with st.sidebar.expander("Background jobs"):
+        for job in jobs:
+            st.button(
+                f"{job['status']} · {_pair_label(job['pair'])}",
+                key=f"open_job_{job['job_id']}",
+                on_click=attach_job,
+                args=(job["job_id"],),
+                help=f"Job {job['job_id']}, submitted {job['submitted_at']:%Y-%m-%d %H:%M:%S}",
+                use_container_width=True
+            )
+
+def _schedule_outcome(job):
+    summary = job["summary"] or {}
+    if job["status"] != DONE:
+        return f"{job['status']}: {job['error'] or 'no result'}"
+    if "counts" not in summary or "only_in_source" not in summary["counts"]:
+        return summary.get("status", "done")
+    counts = summary["counts"]
+    return (f"{summary['status']} · only in source {counts['only_in_source']:,} · "
+            f"only in target {counts['only_in_target']:,}")
+
+def render_scheduled_results():
+    """Latest precomputed result of every scheduled reconciliation (see reconcile_scheduler),
+    with the trend of its difference counts; "Show result" opens the run in the result viewer."""
+    latest = latest_scheduled_jobs()
+    if not latest:
+        return
+    with st.expander("Scheduled reconciliations", expanded=True):
+        for name, job in sorted(latest.items()):
+            col1, col2 = st.columns([2, 3])
+            with col1:
+                st.markdown(f"**{name}** · {_pair_label(job['pair'])}")
+                st.caption(f"{_schedule_outcome(job)} · finished {job['finished_at'].astimezone():%Y-%m-%d %H:%M}")
+                st.button("Show result", key=f"open_schedule_{name}", on_click=attach_job, args=(job["job_id"],))
+            trend = schedule_trend(name)
+            if len(trend) > 1:
+                trend = pd.DataFrame(trend, columns=["finished_at", "Only in source", "Only in target"])
+                col2.line_chart(trend.set_index("finished_at"), height=TREND_HEIGHT)
@@ -0,0 +1,99 @@
+import pandas as pd
+
+from normalize_rules import tolerance_bound
+
+# ---------- Configuration ----------
+DUPLICATE_KEYS_SHOWN = 5
+
+# ---------- Functions ----------
+def _values_differ(source_values, target_values, tolerance=None):
+    """Element-wise "not equal" where two missing values count as equal and, with a
+    `tolerance`, numbers at most that far apart too."""
+    both_missing = source_values.isna() & target_values.isna()
+    try:
+        equal = source_values == target_values
+    except TypeError:
+        equal = source_values.astype(str) == target_values.astype(str)
+    equal = equal.fillna(False).astype(bool) | both_missing
+    if tolerance is not None:
+        gap = (pd.to_numeric(source_values, errors="coerce") - pd.to_numeric(target_values, errors="coerce")).abs()
+        equal |= gap <= tolerance_bound(tolerance)
+    return ~equal
+
+def _check_unique_keys(df, key_columns, side):
+    """Raise ValueError listing a few keys that occur more than once on one side."""
+    duplicated = df.duplicated(key_columns, keep=False)
+    if duplicated.any():
+        keys = df.loc[duplicated, key_columns].drop_duplicates()
+        shown = ", ".join(str(tuple(row)) for row in keys.head(DUPLICATE_KEYS_SHOWN).itertuples(index=False))
+        raise ValueError(f"{len(keys):,} key(s) occur more than once in the {side} (e.g. {shown}); "
+                         "the key columns must identify a row")
+
+def _align_key_dtypes(df_source, df_target, key_columns):
+    """Compare keys whose dtypes differ on the two sides (e.g. object vs int64) as text."""
+    mismatched = [col for col in key_columns if df_source[col].dtype != df_target[col].dtype]
+    if not mismatched:
+        return df_source, df_target
+    df_source, df_target = df_source.copy(), df_target.copy()
+    for col in mismatched:
+        df_source[col] = df_source[col].astype(str)
+        df_target[col] = df_target[col].astype(str)
+    return df_source, df_target
+
+def keyed_diff(df_source, df_target, key_columns, tolerances=None):
+    """Join two frames on `key_columns` and compare every other shared column vectorized.
+
+    Returns (differences, removed, added, counts). `differences` is a long-format
+    frame with the key columns followed by "column", "source_value" and
+    "target_value", one row per differing cell. `removed` / `added` hold the keys
+    found only in the source / only in the target, and `counts` the number of
+    added, removed and changed rows. Raises ValueError when a key occurs more than
+    once on either side. `tolerances` ({column: tolerance}, see
+    normalize_rules.column_tolerances) lets numeric values differ by up to that much.
+    """
+    tolerances = tolerances or {}
+    key_columns = list(key_columns)
+    _check_unique_keys(df_source, key_columns, "source")
+    _check_unique_keys(df_target, key_columns, "target")
+    df_source, df_target = _align_key_dtypes(df_source, df_target, key_columns)
+    value_columns = [col for col in df_source.columns if col in df_target.columns and col not in key_columns]
+
+    # Inner join for the value comparison keeps the original dtypes (an outer join would upcast ints to float)
+    both = df_source[key_columns + value_columns].merge(
+        df_target[key_columns + value_columns],
+        on=key_columns,
+        how="inner",
+        suffixes=("__source", "__target"),
+    )
+    presence = df_source[key_columns].merge(
+        df_target[key_columns], on=key_columns, how="outer", indicator=True
+    )
+
+    changed_mask = pd.Series(False, index=both.index)
+    parts = []
+    for col in value_columns:
+        source_values = both[f"{col}__source"]
+        target_values = both[f"{col}__target"]
+        differs = _values_differ(source_values, target_values, tolerances.get(col))
+        if not differs.any():
+            continue
+        changed_mask |= differs
+        part = both.loc[differs, key_columns].copy()
+        part["column"] = col
+        part["source_value"] = source_values[differs].astype(object)
+        part["target_value"] = target_values[differs].astype(object)
+        parts.append(part)
+
+    if parts:
+        differences = pd.concat(parts, ignore_index=True)
+    else:
+        differences = pd.DataFrame(columns=key_columns + ["column", "source_value", "target_value"])
+
+    removed = presence.loc[presence["_merge"] == "left_only", key_columns].reset_index(drop=True)
+    added = presence.loc[presence["_merge"] == "right_only", key_columns].reset_index(drop=True)
+    counts = {
+        "added": len(added),
+        "removed": len(removed),
+        "changed": int(changed_mask.sum()),
+    }
+    return differences, removed, added, counts
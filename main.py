@@ -1,10 +1,53 @@
+import pandas as pd
 import streamlit as st
-import snowflake.connector
-import duckdb
+
+from catalog import duckdb_catalog, format_table_option, render_catalog_controls, snowflake_catalog
+from checksum_diff import duckdb_executor
+from compare_engine import (checksum_compare, first_differences_compare, full_compare, incremental_compare,
+                            profile_compare, sample_compare, streaming_compare)
+from compare_jobs import DONE, submit_job
+from concurrent_fetch import fetch_sides_concurrently
+from connections import (duckdb_connection, duckdb_file_version, pool_metrics, snowflake_connection,
+                         snowflake_identity)
+from first_diff import DEFAULT_LIMIT as DEFAULT_FIRST_LIMIT, format_first_n_stats
+from job_panel import attach_job, detach_job, render_job_panel, render_recent_jobs, render_scheduled_results
+from profile_panel import profiled_run, render_profiler_option
+from pushdown import (NULL_OPERATORS, OPERATORS, column_map, count_rows, projected_relation, snowflake_scan_estimate,
+                      validate_conditions)
+from incremental_diff import DATE_UNITS, fingerprint_db
+from normalize_rules import RULE_KEYS, parse_rules, uses_tolerance
+from reconcile_scheduler import start_scheduler
+from result_viewer import clear_result, render_live_rows, render_result_viewer, save_relation_result, save_rows_result
+from sample_diff import DEFAULT_SAMPLE_RATE
+from staging_mirror import format_age, mirror_relation, mirror_status, refresh_mirror
+from sql_diff import ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, fetch_columns, fetch_diff_rows, quote_ident
+from streaming_diff import DEFAULT_MEMORY_BUDGET_MB
+from transfer import format_transfer_stats
 
 # ---------- Configuration ----------
 DUCKDB_FILE = "mydata.duckdb"
-INTERMEDIATE_DB = ":memory:"
+FULL_MODE = "Full (SQL diff)"
+CHECKSUM_MODE = "Checksum (bucketed)"
+STREAMING_MODE = "Streaming (bounded memory)"
+SAMPLE_MODE = "Sample (approximate)"
+PROFILE_MODE = "Profile (aggregates only)"
+INCREMENTAL_MODE = "Incremental (changed partitions)"
+FIRST_N_MODE = "First N differences"
+NO_SCAN_KEY = "(none: one query over both tables)"
+KEY_RANGE = "key range"
+MISMATCH_COLOR = "#FF0000"
+COMPARE_MODE_KEY = "compare_mode"
+SAMPLE_STATE_KEY = "sample_summary"
+ESCALATE_KEY = "escalate_to_full"
+RULES_KEY = "normalization_rules"
+BACKGROUND_KEY = "run_in_background"
+JOB_MODES = {FULL_MODE: "full", CHECKSUM_MODE: "checksum", STREAMING_MODE: "streaming", SAMPLE_MODE: "sample",
+             PROFILE_MODE: "profile", INCREMENTAL_MODE: "incremental", FIRST_N_MODE: "first_n"}   # run_compare modes
+MIRROR_FULL_RELOAD = "(none: reload the whole table)"
+MAX_FILTER_CONDITIONS = 5
+ESTIMATE_TTL_SECONDS = 60
+LIVE_PREVIEW_ROWS = 50    # differing rows per side shown while a streaming compare runs
+RULES_PLACEHOLDER = '{"*": {"null_values": ["", "NULL"]}, "amount": {"round_to": 0.01}, "created_at": {"truncate": "day"}}'
 
 def get_snowflake_config():
     return {
@@ -18,84 +61,350 @@ def get_snowflake_config():
     }
 
 # ---------- Functions ----------
-def get_snowflake_tables(conn_params):
+def get_snowflake_catalog(conn_params):
     try:
-        with snowflake.connector.connect(**conn_params) as conn:
-            with conn.cursor() as cur:
-                cur.execute("SHOW TABLES")
-                tables = [row[1] for row in cur.fetchall()]
-        return tables
+        return snowflake_catalog(conn_params)
     except Exception as e:
         st.error(f"Error fetching Snowflake tables: {e}")
-        return []
+        return {"tables": {}}
 
-def get_duckdb_tables(db_file):
+def get_duckdb_catalog(db_file):
     try:
-        with duckdb.connect(database=db_file) as con:
-            res = con.execute("SHOW TABLES").fetchall()
-        return [row[0] for row in res]
+        return duckdb_catalog(db_file)
     except Exception as e:
         st.error(f"Error fetching DuckDB tables: {e}")
-        return []
+        return {"tables": {}}
 
-def fetch_snowflake_to_duckdb(source_table, conn_params, intermediate_db, target_table_name):
-    try:
-        # Fetch data from Snowflake
-        with snowflake.connector.connect(**conn_params) as conn:
-            with conn.cursor() as cur:
-                cur.execute(f'SELECT * FROM "{source_table}"')
-                data = cur.fetchall()
-                columns = [desc[0] for desc in cur.description]
-
-        if not data:
-            st.warning("Source table has no data!")
-            return columns, []
-
-        # Create intermediate DuckDB table
-        with duckdb.connect(intermediate_db) as con:
-            con.execute(f'DROP TABLE IF EXISTS "{target_table_name}"')
-
-            # Create table schema
-            col_defs = ", ".join([f'"{col}" TEXT' for col in columns])  # Using TEXT for simplicity
-            con.execute(f'CREATE TABLE "{target_table_name}" ({col_defs})')
-
-            # Insert data using executemany
-            placeholders = ", ".join(["?"] * len(columns))
-            con.executemany(
-                f'INSERT INTO "{target_table_name}" VALUES ({placeholders})',
-                data
-            )
+def get_duckdb_columns(catalog, table):
+    info = catalog["tables"].get(table)
+    return [col for col, _ in info["columns"]] if info else []
+
+def show_streamed_rows(placeholder, con):
+    """Streaming compare progress: the first differing rows written so far, with the running count."""
+    return lambda only_in_source, only_in_target: render_live_rows(
+        placeholder, fetch_columns(con, ONLY_IN_SOURCE_TABLE), *fetch_diff_rows(con, limit=LIVE_PREVIEW_ROWS),
+        f"Differences found so far: {only_in_source + only_in_target:,}"
+    )
+
+def show_live_rows(placeholder, columns, limit):
+    return lambda only_in_source, only_in_target, scanned: render_live_rows(
+        placeholder, columns, only_in_source, only_in_target,
+        f"Differences found so far: {len(only_in_source) + len(only_in_target):,} of {limit:,} · "
+        f"key range scanned: {scanned:.1%}"
+    )
+
+def escalate_to_full():
+    """"Run full compare" button callback: switch the mode and start the compare on this rerun."""
+    st.session_state[COMPARE_MODE_KEY] = FULL_MODE
+    st.session_state[ESCALATE_KEY] = True
+
+def render_sample_summary():
+    """Mismatch rate of the last sample compare, with a button to confirm it with a full compare."""
+    stats = st.session_state.get(SAMPLE_STATE_KEY)
+    if stats is None:
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric(
+        "Mismatch rate (sampled keys)",
+        f"{stats['mismatch_rate']:.2%}",
+        help="Share of sampled keys with at least one differing row."
+    )
+    col2.metric("95% confidence interval", f"{stats['ci_low']:.2%} – {stats['ci_high']:.2%}")
+    col3.metric("Estimated mismatched keys", f"~{stats['estimated_mismatched_keys']:,}")
+    st.caption(
+        f"Sampled {stats['sampled_keys']:,} keys ({stats['sample_rate']:.4%} of ~{stats['estimated_keys']:,}); "
+        f"{stats['mismatched_keys']:,} differ."
+    )
+    st.button("Run full compare", on_click=escalate_to_full)
+
+def render_profile(result):
+    """Source and target column profiles side by side, mismatching statistics in red."""
+    profile = pd.DataFrame(result["profile"])
+    # Values mix ints, strings, dates and 128-bit hash sums, so show them as text
+    profile[["source", "target"]] = profile[["source", "target"]].map(lambda v: "" if v is None else str(v))
+    st.markdown(f"Mismatching statistics: **{result['mismatches']}** of {len(profile)}")
+    st.dataframe(
+        profile.style.apply(
+            lambda row: [f"color: {MISMATCH_COLOR}" if not row["match"] else ""] * len(row), axis=1
+        ),
+        hide_index=True,
+        use_container_width=True
+    )
+
+def render_pushdown_controls(columns):
+    """Columns to compare and filter conditions pushed into both sides' queries.
+
+    Returns (columns, conditions); columns is empty when all of them are kept.
+    """
+    with st.expander("Columns and filter"):
+        selected = st.multiselect(
+            "Columns to compare",
+            columns,
+            default=columns,
+            help="Only these columns are read and transferred from both sides."
+        )
+        condition_count = st.number_input(
+            "Filter conditions",
+            min_value=0,
+            max_value=MAX_FILTER_CONDITIONS,
+            value=0,
+            help="Conditions are ANDed and run by Snowflake and DuckDB themselves, before any row is transferred."
+        )
+        conditions = []
+        for i in range(int(condition_count)):
+            filter_col1, filter_col2, filter_col3 = st.columns([2, 1, 2])
+            column = filter_col1.selectbox("Column", columns, key=f"filter_column_{i}")
+            operator = filter_col2.selectbox("Operator", OPERATORS, key=f"filter_operator_{i}")
+            value = filter_col3.text_input("Value", key=f"filter_value_{i}", disabled=operator in NULL_OPERATORS)
+            conditions.append((column, operator, value))
+    return ([] if selected == columns else selected), conditions
 
-        return columns, data
+@st.cache_data(ttl=ESTIMATE_TTL_SECONDS, show_spinner=False)
+def estimate_duckdb_rows(relation, file_version):
+    with duckdb_connection(DUCKDB_FILE) as con:
+        return count_rows(duckdb_executor(con), relation)
+
+@st.cache_data(ttl=ESTIMATE_TTL_SECONDS, show_spinner=False)
+def estimate_snowflake_scan(relation, cache_key, _conn_params):
+    with snowflake_connection(_conn_params) as conn:
+        with conn.cursor() as cur:
+            return snowflake_scan_estimate(cur, relation)
+
+def render_scan_estimate(source_type, source_relation, target_relation, source_rows, conn_params):
+    """Caption with the rows each side would scan under the current columns and filter, before running."""
+    file_version = duckdb_file_version(DUCKDB_FILE)
+    try:
+        if source_type == "Snowflake":
+            scan = estimate_snowflake_scan(source_relation, snowflake_identity(conn_params), conn_params)
+            share = scan["partitions_assigned"] / scan["partitions_total"] if scan["partitions_total"] else 1.0
+            source = (f"source ~{(source_rows or 0) * share:,.0f} rows ({scan['partitions_assigned']:,} of "
+                      f"{scan['partitions_total']:,} micro-partitions, {scan['bytes_assigned'] / (1024 * 1024):,.1f} MB)")
+        else:
+            source = f"source {estimate_duckdb_rows(source_relation, file_version):,} rows"
+        target = f"target {estimate_duckdb_rows(target_relation, file_version):,} rows"
     except Exception as e:
-        st.error(f"Error transferring data from Snowflake to DuckDB: {e}")
-        return [], []
+        st.caption(f"Estimated rows scanned: unavailable ({e})")
+        return
+    st.caption(f"Estimated rows scanned · {source} · {target}")
+
+def render_mirror_controls(source_table, sf_tables, conn_params):
+    """Staleness and refresh settings of the local mirror of the Snowflake source table.
+
+    Returns True when the full compare should read the mirror instead of Snowflake.
+    """
+    with duckdb_connection(DUCKDB_FILE) as con:
+        status = mirror_status(con, source_table)
+    if status:
+        watermark = f" · {status['watermark_column']} up to {status['watermark']}" if status["watermark_column"] else ""
+        st.caption(
+            f"Local mirror of {source_table}: refreshed {format_age(status['age_seconds'])} ago "
+            f"({status['refresh_mode']}, {status['delta_rows']:,} rows fetched) · {status['rows']:,} rows{watermark}"
+        )
+    columns = [col for col, _ in sf_tables["tables"].get(source_table, {}).get("columns", [])]
+    with st.expander("Local mirror"):
+        use_mirror = st.checkbox(
+            "Compare against the local mirror",
+            value=status is not None,
+            disabled=status is None,
+            help="Reads the mirrored copy in the DuckDB file instead of downloading the Snowflake table."
+        )
+        previous_watermark = status["watermark_column"] if status else None
+        watermark_column = st.selectbox(
+            "Watermark column",
+            [MIRROR_FULL_RELOAD] + columns,
+            index=columns.index(previous_watermark) + 1 if previous_watermark in columns else 0,
+            help="A column that increases whenever a row is added or changed, e.g. UPDATED_AT."
+        )
+        key_columns = st.multiselect(
+            "Key columns",
+            columns,
+            default=[col for col in (status["key_columns"] if status else None) or [] if col in columns],
+            help="Fetched rows replace mirrored rows with the same key; without a key they are appended."
+        )
+        if st.button("Refresh mirror"):
+            try:
+                with st.spinner(f"Refreshing the mirror of {source_table}..."):
+                    with duckdb_connection(DUCKDB_FILE) as con:
+                        refresh_mirror(con, source_table, conn_params,
+                                       None if watermark_column == MIRROR_FULL_RELOAD else watermark_column,
+                                       key_columns)
+            except Exception as e:
+                st.error(f"Error refreshing the mirror of {source_table}: {e}")
+            else:
+                st.rerun()
+    return use_mirror and status is not None
+
+def pushed_down(source_relation, target_relation, pushdown):
+    if not pushdown:
+        return source_relation, target_relation
+    return (projected_relation(source_relation, pushdown["columns"], pushdown["conditions"], pushdown["names"]),
+            projected_relation(target_relation, pushdown["columns"], pushdown["conditions"]))
+
+def run_compare_mode(compare_mode, source_type, source_table, target_table, conn_params, key_columns, memory_budget_mb,
+                     sample_rate=DEFAULT_SAMPLE_RATE, rules=None, use_mirror=False, partition=None,
+                     first_limit=DEFAULT_FIRST_LIMIT, scan_column=None, pushdown=None):
+    """Run the selected engine compare and save its differing rows for the result viewer.
 
-def fetch_data_from_duckdb(table, db_file):
+    `pushdown` ({"columns", "conditions", "names"}, see pushdown.projected_relation)
+    narrows both sides' queries in the full and first-N modes.
+
+    Returns the engine result dict; errors are shown and stop the script run.
+    """
     try:
-        with duckdb.connect(database=db_file) as con:
-            res = con.execute(f'SELECT * FROM "{table}"')
-            cols = [desc[0] for desc in res.description]
-            rows = res.fetchall()
-        return cols, rows
+        if compare_mode == CHECKSUM_MODE:
+            result = checksum_compare(source_type, source_table, target_table, key_columns, conn_params, DUCKDB_FILE,
+                                      rules)
+            if result["columns_match"]:
+                stats = result["checksum"]
+                st.caption(
+                    f"Checksum levels: {stats['levels']} · Queries: {stats['queries']} · "
+                    f"Rows transferred: {stats['rows_transferred']:,} · Only in source: {stats['keys_only_in_source']:,} · "
+                    f"Only in target: {stats['keys_only_in_target']:,} · Changed: {stats['keys_changed']:,} · "
+                    f"Within tolerance: {stats['keys_within_tolerance']:,}"
+                )
+                save_rows_result(result["columns"], result["only_in_source"], result["only_in_target"])
+            return result
+
+        if compare_mode == STREAMING_MODE:
+            with duckdb_connection(DUCKDB_FILE) as con:
+                # Differing rows land in the diff temp tables batch by batch and show up as they do
+                live = st.empty()
+                result = streaming_compare(con, source_type, source_table, target_table, conn_params, DUCKDB_FILE,
+                                           memory_budget_mb, fetch_sides_concurrently, show_streamed_rows(live, con))
+                live.empty()
+                if result["columns_match"]:
+                    st.caption(
+                        f"Only in source: {result['counts']['only_in_source']:,} · "
+                        f"Only in target: {result['counts']['only_in_target']:,} (memory budget {memory_budget_mb} MB)"
+                    )
+                    save_relation_result(con, result["columns"], ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE,
+                                         result["counts"])
+            return result
+
+        if compare_mode == PROFILE_MODE:
+            result = profile_compare(source_type, source_table, target_table, conn_params, DUCKDB_FILE,
+                                     fetch_sides_concurrently)
+            render_profile(result)
+            return result
+
+        if compare_mode == FIRST_N_MODE:
+            with duckdb_connection(DUCKDB_FILE) as con:
+                # Rows found so far replace the placeholder after every key range
+                live = st.empty()
+                source_relation, target_relation = pushed_down(quote_ident(source_table), quote_ident(target_table),
+                                                               pushdown)
+                result = first_differences_compare(
+                    con, source_type, source_relation, target_relation, scan_column, first_limit,
+                    conn_params, rules, show_live_rows(live, fetch_columns(con, target_relation), first_limit)
+                )
+                live.empty()
+                if result["columns_match"]:
+                    st.caption(format_first_n_stats(result["first_n"]))
+                    save_rows_result(result["columns"], result["only_in_source"], result["only_in_target"])
+            return result
+
+        if compare_mode == INCREMENTAL_MODE:
+            with duckdb_connection(DUCKDB_FILE) as con:
+                result = incremental_compare(con, source_type, source_table, target_table, partition, conn_params,
+                                             DUCKDB_FILE, fetch_sides_concurrently, rules)
+                if result["columns_match"]:
+                    stats = result["incremental"]
+                    st.caption(
+                        f"Partitions: {stats['partitions']:,} · Equal: {stats['equal']:,} · "
+                        f"Unchanged since last run: {stats['reused']:,} · Re-diffed: {stats['rediffed']:,} · "
+                        f"Rows fetched: {stats['rows_fetched']:,} (fingerprints in {fingerprint_db(DUCKDB_FILE)})"
+                    )
+                    save_relation_result(con, result["columns"], ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE,
+                                         result["counts"])
+            return result
+
+        if compare_mode == SAMPLE_MODE:
+            with duckdb_connection(DUCKDB_FILE) as con:
+                result = sample_compare(con, source_type, source_table, target_table, key_columns, sample_rate,
+                                        conn_params, DUCKDB_FILE, fetch_sides_concurrently, rules)
+                if result["columns_match"]:
+                    st.session_state[SAMPLE_STATE_KEY] = result["sample"]
+                    save_relation_result(con, result["columns"], ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE,
+                                         result["counts"])
+            return result
+
+        source_relation = quote_ident(source_table)
+        if use_mirror:
+            source_type, source_relation = "DuckDB", mirror_relation(source_table)
+        source_relation, target_relation = pushed_down(source_relation, quote_ident(target_table), pushdown)
+        with duckdb_connection(DUCKDB_FILE) as con:
+            # Snowflake network I/O and the local DuckDB scan overlap
+            result = full_compare(con, source_type, source_relation, target_relation,
+                                  conn_params, DUCKDB_FILE, fetch_sides_concurrently, rules=rules)
+            if result["source"].get("transfer"):
+                st.caption(format_transfer_stats(result["source"]["transfer"]))
+            if not result["source"]["rows"]:
+                st.warning("Source table has no data!")
+            if result["columns_match"]:
+                save_relation_result(con, result["columns"], ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE,
+                                     result["counts"])
+            return result
     except Exception as e:
-        st.error(f"Error fetching data from DuckDB: {e}")
-        return [], []
+        st.error(f"Error running {compare_mode} compare: {e}")
+        st.stop()
 
-def compare_data(source_data, target_data):
-    source_set = set(map(tuple, source_data))
-    target_set = set(map(tuple, target_data))
-    in_source_not_target = list(source_set - target_set)
-    in_target_not_source = list(target_set - source_set)
-    return in_source_not_target, in_target_not_source
+def job_pair(compare_mode, source_type, source_table, target_table, key_columns, memory_budget_mb, sample_rate,
+             rules, use_mirror, partition, first_limit, scan_column, pushdown):
+    """The page's settings as a run_compare pair, for a background job."""
+    pair = {"source": source_table, "target": target_table, "source_type": source_type,
+            "mode": JOB_MODES[compare_mode], "key": key_columns}
+    if compare_mode == STREAMING_MODE:
+        pair["memory_budget_mb"] = memory_budget_mb
+    if compare_mode == SAMPLE_MODE:
+        pair["sample_rate"] = sample_rate
+    if compare_mode == INCREMENTAL_MODE:
+        pair["partition"] = partition
+    if compare_mode == FIRST_N_MODE:
+        pair["limit"] = first_limit
+        pair["key"] = [scan_column] if scan_column else []
+    if rules:
+        pair["rules"] = rules
+    if use_mirror:
+        pair["mirror"] = True
+    if pushdown and pushdown["columns"]:
+        pair["columns"] = pushdown["columns"]
+    if pushdown and pushdown["conditions"]:
+        pair["filter"] = [list(condition) for condition in pushdown["conditions"]]
+    return pair
 
-def normalize_columns(cols):
-    return [col.strip().lower() for col in cols]
+def render_job_summary(summary):
+    """Mode-specific part of a finished background job: mismatching columns, statistics, profiles."""
+    if summary["status"] == "column_mismatch":
+        st.error("⚠️ Column mismatch detected!")
+        st.write("Source columns:", summary["source_columns"])
+        st.write("Target columns:", summary["target_columns"])
+        return
+    if summary.get("transfer"):
+        st.caption(format_transfer_stats(summary["transfer"]))
+    if "first_n" in summary:
+        st.caption(format_first_n_stats(summary["first_n"]))
+    if "sample" in summary:
+        st.session_state[SAMPLE_STATE_KEY] = summary["sample"]
+    if "profile" in summary:
+        render_profile({"profile": summary["profile"],
+                        "mismatches": sum(not stat["match"] for stat in summary["profile"])})
 
 # ---------- UI ----------
 st.set_page_config(page_title="Data Comparison Tool - Differences Only", layout="wide")
 st.title("🔍 Data Comparison Tool - Show Differences Interleaved")
 
+# Scheduled reconciliations keep running in the server process between page loads; the
+# thread starts on the first page load after a server start (see reconcile_scheduler)
+start_scheduler(get_snowflake_config(), DUCKDB_FILE)
+render_scheduled_results()
+
+render_catalog_controls()
+with st.sidebar.expander("Connection pool"):
+    st.json(pool_metrics())
+render_recent_jobs()
+profiler = render_profiler_option()
+duckdb_tables = get_duckdb_catalog(DUCKDB_FILE)
+
 col1, col2 = st.columns(2)
 
 with col1:
@@ -103,74 +412,207 @@ with col1:
     source_type = st.selectbox("Source Type", ["Snowflake", "DuckDB"])
     if source_type == "Snowflake":
         sf_config = get_snowflake_config()
-        sf_tables = get_snowflake_tables(sf_config)
-        source_table = st.selectbox("Select Source Table", sf_tables)
+        sf_tables = get_snowflake_catalog(sf_config)
+        source_table = st.selectbox(
+            "Select Source Table",
+            list(sf_tables["tables"]),
+            format_func=lambda t: format_table_option(sf_tables, t)
+        )
     else:
-        duckdb_tables = get_duckdb_tables(DUCKDB_FILE)
-        source_table = st.selectbox("Select Source Table (DuckDB)", duckdb_tables)
+        source_table = st.selectbox(
+            "Select Source Table (DuckDB)",
+            list(duckdb_tables["tables"]),
+            format_func=lambda t: format_table_option(duckdb_tables, t)
+        )
 
 with col2:
     st.subheader("Target Table (DuckDB)")
-    duckdb_tables = get_duckdb_tables(DUCKDB_FILE)
-    target_table = st.selectbox("Select Target Table", duckdb_tables)
-
-if st.button("Show Differences Only"):
-    st.write("---")
+    target_table = st.selectbox(
+        "Select Target Table",
+        list(duckdb_tables["tables"]),
+        format_func=lambda t: format_table_option(duckdb_tables, t)
+    )
 
+compare_mode = st.radio(
+    "Compare Mode",
+    [FULL_MODE, CHECKSUM_MODE, STREAMING_MODE, SAMPLE_MODE, PROFILE_MODE, INCREMENTAL_MODE, FIRST_N_MODE],
+    horizontal=True,
+    key=COMPARE_MODE_KEY
+)
+key_columns = []
+memory_budget_mb = DEFAULT_MEMORY_BUDGET_MB
+sample_rate = DEFAULT_SAMPLE_RATE
+if compare_mode == STREAMING_MODE:
+    memory_budget_mb = st.number_input(
+        "Memory budget (MB)",
+        min_value=16,
+        value=DEFAULT_MEMORY_BUDGET_MB,
+        step=16,
+        help="Rows beyond this budget are sorted and spilled to temporary files on disk."
+    )
+if compare_mode in (CHECKSUM_MODE, SAMPLE_MODE):
+    key_columns = st.multiselect(
+        "Primary key column(s)",
+        get_duckdb_columns(duckdb_tables, target_table),
+        help="Must uniquely identify a row. Rows are bucketed (checksum) or sampled (sample) by a hash of these columns."
+    )
+if compare_mode == SAMPLE_MODE:
+    sample_rate = st.number_input(
+        "Sample rate (%)",
+        min_value=0.01,
+        max_value=100.0,
+        value=DEFAULT_SAMPLE_RATE * 100,
+        step=0.5,
+        help="Share of keys compared. The same keys are picked on both sides, filtered where the data lives."
+    ) / 100
+partition = None
+if compare_mode == INCREMENTAL_MODE:
+    part_col1, part_col2, part_col3 = st.columns(3)
+    partition_column = part_col1.selectbox("Partition column", get_duckdb_columns(duckdb_tables, target_table))
+    partition_by = part_col2.selectbox(
+        "Partition by",
+        list(DATE_UNITS) + [KEY_RANGE],
+        help="Date columns are split by day / week / month / year, numeric keys into fixed-size ranges."
+    )
+    if partition_by == KEY_RANGE:
+        partition_by = int(part_col3.number_input("Key range size", min_value=1, value=10_000, step=1_000))
+    partition = {"column": partition_column, "by": partition_by}
+first_limit = DEFAULT_FIRST_LIMIT
+scan_column = None
+if compare_mode == FIRST_N_MODE:
+    first_col1, first_col2 = st.columns(2)
+    first_limit = int(first_col1.number_input("Stop after N differences", min_value=1, value=DEFAULT_FIRST_LIMIT, step=10))
+    target_columns = get_duckdb_columns(duckdb_tables, target_table)
+    scan_column = first_col2.selectbox(
+        "Scan key column",
+        [NO_SCAN_KEY] + target_columns,
+        index=1 if target_columns else 0,
+        help="A numeric column (e.g. an id). Both tables are diffed range by range, smallest ranges first, "
+             "so the first differences show up without reading the whole tables."
+    )
+    if scan_column == NO_SCAN_KEY:
+        scan_column = None
+use_mirror = False
+if compare_mode == FULL_MODE and source_type == "Snowflake":
+    use_mirror = render_mirror_controls(source_table, sf_tables, sf_config)
+pushdown = None
+if compare_mode in (FULL_MODE, FIRST_N_MODE) and source_table and target_table:
+    target_columns = get_duckdb_columns(duckdb_tables, target_table)
     if source_type == "Snowflake":
-        sf_cols, sf_data = fetch_snowflake_to_duckdb(
-            source_table,
-            sf_config,
-            INTERMEDIATE_DB,
-            "intermediate_source"
-        )
-        source_db_file = INTERMEDIATE_DB
-        source_table_name = "intermediate_source"
+        source_info = sf_tables["tables"].get(source_table, {})
+        source_columns = [col for col, _ in source_info.get("columns", [])]
+    else:
+        source_info = duckdb_tables["tables"].get(source_table, {})
+        source_columns = get_duckdb_columns(duckdb_tables, source_table)
+    selected_columns, conditions = render_pushdown_controls(target_columns)
+    pushdown = {"columns": selected_columns, "conditions": conditions,
+                "names": column_map(source_columns, target_columns)}
+    try:
+        validate_conditions(conditions, target_columns)
+    except ValueError as e:
+        st.caption(f"Estimated rows scanned: {e}")
     else:
-        source_db_file = DUCKDB_FILE
-        source_table_name = source_table
-        sf_cols, sf_data = fetch_data_from_duckdb(source_table, DUCKDB_FILE)
+        estimate_source = mirror_relation(source_table) if use_mirror else quote_ident(source_table)
+        render_scan_estimate(
+            "DuckDB" if use_mirror else source_type,
+            *pushed_down(estimate_source, quote_ident(target_table), pushdown),
+            source_info.get("rows"),
+            sf_config if source_type == "Snowflake" else None
+        )
+rules_text = ""
+if compare_mode in (FULL_MODE, CHECKSUM_MODE, SAMPLE_MODE, INCREMENTAL_MODE, FIRST_N_MODE):
+    with st.expander("Normalization rules"):
+        rules_text = st.text_area(
+            "Per-column rules (JSON)",
+            key=RULES_KEY,
+            placeholder=RULES_PLACEHOLDER,
+            help=f"Keys are column names, or * for every column. Rules: {', '.join(RULE_KEYS)}. "
+                 "Both sides are normalized in DuckDB before the diff; round_to rounds to the nearest multiple, "
+                 "so values either side of a midpoint still differ. tolerance treats numbers at most that far "
+                 f"apart as equal and only applies in {CHECKSUM_MODE} mode, which ignores the other rules."
+        )
 
-    duckdb_cols, duckdb_data = fetch_data_from_duckdb(target_table, DUCKDB_FILE)
+run_in_background = st.checkbox(
+    "Run as a background job",
+    key=BACKGROUND_KEY,
+    help="The compare runs on the server's job pool: it keeps going when the page reruns or is reloaded, "
+         "and submitting the same compare again attaches to the running job instead of starting another."
+)
+# The "Run full compare" button of a sample result starts a compare on the rerun it triggers
+compare_clicked = st.button("Show Differences Only") or st.session_state.pop(ESCALATE_KEY, False)
+run_params = {
+    "source_type": source_type,
+    "source_table": source_table,
+    "target_table": target_table,
+    "mode": compare_mode,
+    "key_columns": key_columns,
+    "memory_budget_mb": memory_budget_mb,
+    "sample_rate": sample_rate,
+    "rules": rules_text,
+    "mirror": use_mirror,
+    "partition": partition,
+    "first_limit": first_limit,
+    "scan_column": scan_column,
+    "pushdown": pushdown,
+    "background": run_in_background,
+}
+with profiled_run("main.py", run_params, compare_clicked, profiler):
+    if compare_clicked:
+        st.write("---")
+        clear_result()
+        st.session_state.pop(SAMPLE_STATE_KEY, None)
 
-    sf_cols_normalized = normalize_columns(sf_cols)
-    duckdb_cols_normalized = normalize_columns(duckdb_cols)
+        if compare_mode in (CHECKSUM_MODE, SAMPLE_MODE) and not key_columns:
+            st.error(f"Select at least one primary key column for the {compare_mode} compare.")
+            st.stop()
+        try:
+            rules = parse_rules(rules_text)
+            if uses_tolerance(rules) and compare_mode != CHECKSUM_MODE:
+                raise ValueError(f"Tolerance rules need the {CHECKSUM_MODE} compare, where rows are matched by key; "
+                                 "use round_to instead")
+            if pushdown:
+                validate_conditions(pushdown["conditions"], get_duckdb_columns(duckdb_tables, target_table))
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
 
-    if sf_cols_normalized != duckdb_cols_normalized:
-        st.error("⚠️ Column mismatch detected!")
-        st.write("Source columns:", sf_cols)
-        st.write("Target columns:", duckdb_cols)
-    else:
-        only_in_source, only_in_target = compare_data(sf_data, duckdb_data)
-
-        if only_in_source or only_in_target:
-            st.write("### 🟢🔴 Differences Interleaved")
-            max_rows = max(len(only_in_source), len(only_in_target))
-            comparison_rows = []
-            for i in range(max_rows):
-                if i < len(only_in_source):
-                    comparison_rows.append(("Source", only_in_source[i]))
-                if i < len(only_in_target):
-                    comparison_rows.append(("Target", only_in_target[i]))
-
-            html_table = """
-            <table class='comparison-table' style='width:100%; border: 1px solid #444; text-align: center; border-collapse: collapse;'>
-                <tr>
-                    <th style='background-color:#333; color:#DDDDDD;'>Data Source</th>
-                    {}
-                </tr>
-            """.format(
-                "".join([f"<th style='background-color:#333; color:#DDDDDD;'>{col}</th>" for col in sf_cols])
+        if run_in_background:
+            job_id, attached = submit_job(
+                job_pair(compare_mode, source_type, source_table, target_table, key_columns, memory_budget_mb,
+                         sample_rate, rules, use_mirror, partition, first_limit, scan_column, pushdown),
+                sf_config if source_type == "Snowflake" else None,
+                DUCKDB_FILE
+            )
+            attach_job(job_id)
+            if attached:
+                st.info(f"The same compare is already running as job {job_id}; showing its progress.")
+        else:
+            detach_job()
+            result = run_compare_mode(
+                compare_mode,
+                source_type,
+                source_table,
+                target_table,
+                sf_config if source_type == "Snowflake" else None,
+                key_columns,
+                memory_budget_mb,
+                sample_rate,
+                rules,
+                use_mirror,
+                partition,
+                first_limit,
+                scan_column,
+                pushdown
             )
 
-            for source_or_target, values in comparison_rows:
-                color = '#00FF00' if source_or_target == 'Source' else '#FF0000'
-                html_table += "<tr>"
-                html_table += f"<td style='color:{color}; font-weight:bold;'>{source_or_target}</td>"
-                html_table += "".join([f"<td style='color:{color};'>{val}</td>" for val in values])
-                html_table += "</tr>"
+            if not result["columns_match"]:
+                st.error("⚠️ Column mismatch detected!")
+                st.write("Source columns:", result["source"]["columns"])
+                st.write("Target columns:", result["target"]["columns"])
 
-            html_table += "</table>"
-            st.markdown(html_table, unsafe_allow_html=True)
-        else:
-            st.success("🎉 No differences found! Source and Target are identical.")
+    # A rerun or reload picks the attached job up again instead of starting a new compare
+    job = render_job_panel()
+    if job is not None and job["status"] == DONE:
+        render_job_summary(job["summary"])
+    render_sample_summary()
+    render_result_viewer()
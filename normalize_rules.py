@@ -0,0 +1,110 @@
+import json
+import re
+
+from sql_diff import quote_ident, sql_literal
+
+# ---------- Configuration ----------
+# Rules are keyed by column name (case-insensitive); "*" applies to every column and
+# is overridden key by key by a column's own rule, e.g.
+#   {"*": {"trim": true, "null_values": ["", "N/A"]},
+#    "amount": {"round_to": 0.01}, "created_at": {"truncate": "day"}, "email": {"case": "lower"}}
+# "tolerance" is not a normalization: rows matched by key (keyed_diff, checksum mode)
+# count a numeric column as equal when |source - target| <= tolerance, e.g. {"price": {"tolerance": 0.005}}.
+ALL_COLUMNS = "*"
+RULE_KEYS = ("null_values", "cast", "trim", "case", "truncate", "round_to", "tolerance")
+TOLERANCE_SLACK = 1e-9   # relative; absorbs float error so that e.g. 1.01 - 1.00 is within 0.01
+CASE_FUNCTIONS = {"lower": "lower", "upper": "upper"}
+TRUNCATE_UNITS = ("year", "month", "day", "hour", "minute", "second", "millisecond")
+CAST_TYPE_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9_ ]*(\(\d+(,\s*\d+)?\))?")   # e.g. DOUBLE, DECIMAL(18, 2)
+
+# ---------- Functions ----------
+def validate_rules(rules):
+    """Check a rules dict and return it keyed by lower-cased column name; raises ValueError."""
+    if not isinstance(rules, dict):
+        raise ValueError("Normalization rules must be a JSON object keyed by column name")
+    validated = {}
+    for col, rule in rules.items():
+        if not isinstance(rule, dict):
+            raise ValueError(f"Rule for {col!r} must be an object")
+        unknown = set(rule) - set(RULE_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown rule(s) {', '.join(sorted(unknown))} for {col!r}; expected {', '.join(RULE_KEYS)}")
+        if "case" in rule and rule["case"] not in CASE_FUNCTIONS:
+            raise ValueError(f"case for {col!r} must be one of {', '.join(CASE_FUNCTIONS)}")
+        if "cast" in rule and not CAST_TYPE_PATTERN.fullmatch(str(rule["cast"])):
+            raise ValueError(f"cast for {col!r} must be a type name such as DOUBLE or DECIMAL(18, 2)")
+        if "truncate" in rule and rule["truncate"] not in TRUNCATE_UNITS:
+            raise ValueError(f"truncate for {col!r} must be one of {', '.join(TRUNCATE_UNITS)}")
+        for number_key in ("round_to", "tolerance"):
+            if number_key in rule and not (isinstance(rule[number_key], (int, float)) and rule[number_key] > 0):
+                raise ValueError(f"{number_key} for {col!r} must be a positive number")
+        if "null_values" in rule and not isinstance(rule["null_values"], list):
+            raise ValueError(f"null_values for {col!r} must be a list")
+        validated[col.strip().lower()] = dict(rule)
+    return validated
+
+def parse_rules(text):
+    """Rules from JSON text (empty text means no rules)."""
+    if not text or not text.strip():
+        return {}
+    try:
+        rules = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Normalization rules are not valid JSON: {e}") from e
+    return validate_rules(rules)
+
+def column_rule(rules, col):
+    rule = dict(rules.get(ALL_COLUMNS, {}))
+    rule.update(rules.get(col.strip().lower(), {}))
+    return rule
+
+def uses_tolerance(rules):
+    return any("tolerance" in rule for rule in rules.values())
+
+def column_tolerances(rules, columns):
+    """{column: tolerance} for the columns a tolerance rule applies to."""
+    tolerances = {}
+    for col in columns:
+        tolerance = column_rule(rules, col).get("tolerance")
+        if tolerance:
+            tolerances[col] = float(tolerance)
+    return tolerances
+
+def tolerance_bound(tolerance):
+    """Largest |source - target| accepted for `tolerance`, allowing for float error."""
+    return tolerance * (1 + TOLERANCE_SLACK)
+
+def column_expr(col, rule):
+    """DuckDB expression normalizing one column. Steps run in RULE_KEYS order:
+    NULL-equivalent values become NULL, then cast, trim, case folding, timestamp
+    truncation and rounding to the nearest multiple of round_to; tolerance is applied
+    when matched rows are compared, not here."""
+    expr = quote_ident(col)
+    if rule.get("null_values"):
+        values = ", ".join(sql_literal(str(v)) for v in rule["null_values"])
+        expr = f"CASE WHEN CAST({expr} AS VARCHAR) IN ({values}) THEN NULL ELSE {expr} END"
+    if rule.get("cast"):
+        expr = f"CAST({expr} AS {rule['cast']})"
+    if rule.get("trim"):
+        expr = f"trim(CAST({expr} AS VARCHAR))"
+    if rule.get("case"):
+        expr = f"{CASE_FUNCTIONS[rule['case']]}(CAST({expr} AS VARCHAR))"
+    if rule.get("truncate"):
+        expr = f"date_trunc('{rule['truncate']}', CAST({expr} AS TIMESTAMP))"
+    if rule.get("round_to"):
+        # Rounding, not a tolerance: values just either side of a midpoint still differ
+        step = float(rule["round_to"])
+        expr = f"round(CAST({expr} AS DOUBLE) / {step!r}) * {step!r}"
+    return expr
+
+def normalized_relation(relation, columns, rules):
+    """Wrap `relation` in a projection applying the rules, keeping column names and order.
+
+    Returns `relation` unchanged when no rule applies to any of its columns.
+    """
+    col_rules = [(col, column_rule(rules, col)) for col in columns]
+    if not any(rule for _, rule in col_rules):
+        return relation
+    exprs = ", ".join(f"{column_expr(col, rule)} AS {quote_ident(col)}" if rule else quote_ident(col)
+                      for col, rule in col_rules)
+    return f"(SELECT {exprs} FROM {relation})"
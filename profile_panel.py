@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+
+from run_profile import PROFILERS, RUN_LOG_FILE, profile_run
+
+# ---------- Configuration ----------
+PROFILE_STATE_KEY = "run_profile"
+PROFILER_STATE_KEY = "profiler_next_run"
+RESET_PROFILER_KEY = "profiler_reset"
+PROFILER_OFF = "Off"
+SPAN_COLUMNS = ["name", "thread", "start", "seconds", "rows", "bytes", "rss_mb", "peak_rss_mb"]
+
+# ---------- Functions ----------
+def render_profiler_option():
+    """Sidebar choice of a profiler for the next compare run; it switches back to Off after that run."""
+    if st.session_state.pop(RESET_PROFILER_KEY, False):
+        st.session_state[PROFILER_STATE_KEY] = PROFILER_OFF
+    choice = st.sidebar.selectbox(
+        "Profile next run",
+        [PROFILER_OFF] + PROFILERS,
+        key=PROFILER_STATE_KEY,
+        help="Profiles the script thread of one compare run (fetch worker threads are covered by the spans only). "
+             "pyinstrument must be installed separately."
+    )
+    return None if choice == PROFILER_OFF else choice
+
+def _keep_run_profile(profile):
+    """Remember the finished run so the panel survives reruns (e.g. paging through results)."""
+    st.session_state[PROFILE_STATE_KEY] = profile
+    if profile.get("profiler") or profile.get("profiler_error"):
+        st.session_state[RESET_PROFILER_KEY] = True
+
+@contextmanager
+def profiled_run(page, params, enabled, profiler=None):
+    """profile_run for a page: spans are collected only when `enabled` (the compare button
+    was clicked) and the "Run profile" panel is rendered afterwards. A run cut short by
+    st.stop() is still logged; its panel shows up on the next rerun."""
+    profile = None
+    try:
+        with profile_run(page, params, enabled, profiler) as profile:
+            yield profile
+    finally:
+        if profile is not None:
+            _keep_run_profile(profile)
+        render_run_profile()
+
+def render_run_profile():
+    """Collapsible "Run profile" panel for the last compare run of this session."""
+    profile = st.session_state.get(PROFILE_STATE_KEY)
+    if profile is None:
+        return
+    with st.expander("Run profile"):
+        st.caption(
+            f"Run {profile['run_id']} · {profile['seconds']:.2f}s · status {profile['status']} · "
+            f"peak RSS {profile['peak_rss_mb']} MB · logged to {RUN_LOG_FILE}"
+        )
+        if profile["spans"]:
+            spans = pd.DataFrame(profile["spans"]).reindex(columns=SPAN_COLUMNS).sort_values("start")
+            st.dataframe(spans, hide_index=True, use_container_width=True)
+        if profile.get("profiler_error"):
+            st.warning(profile["profiler_error"])
+        if profile.get("profiler"):
+            st.caption(f"{profile['profiler']} output saved to {profile['profiler_output']}")
+            st.code(profile["_profiler_report"])
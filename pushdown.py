@@ -0,0 +1,68 @@
+from sql_diff import quote_ident, sql_literal
+
+# ---------- Configuration ----------
+OPERATORS = ("=", "!=", "<", "<=", ">", ">=", "IS NULL", "IS NOT NULL")
+NULL_OPERATORS = ("IS NULL", "IS NOT NULL")
+
+# Conditions are (column, operator, value) triples ANDed together. Column names are
+# always quoted and values always rendered as string literals, which both DuckDB and
+# Snowflake cast to the column's type (e.g. '2024-01-01' against a DATE), so nothing
+# typed into the filter is ever spliced into the SQL as-is.
+
+# ---------- Functions ----------
+def validate_conditions(conditions, columns):
+    """Check (column, operator, value) conditions against `columns`; raises ValueError."""
+    for column, operator, value in conditions:
+        if column not in columns:
+            raise ValueError(f"Filter column {column} is not in the target table")
+        if operator not in OPERATORS:
+            raise ValueError(f"Filter operator must be one of {', '.join(OPERATORS)}")
+        if operator not in NULL_OPERATORS and (value is None or str(value) == ""):
+            raise ValueError(f"Filter on {column} needs a value")
+    return list(conditions)
+
+def column_map(source_columns, target_columns):
+    """Target column name -> source column name, matched by normalized name (e.g. Snowflake upper-case)."""
+    by_name = {col.strip().lower(): col for col in source_columns}
+    return {col: by_name.get(col.strip().lower(), col) for col in target_columns}
+
+def where_sql(conditions, names=None):
+    """AND of the conditions, with columns renamed through `names` (see column_map); "" when there are none."""
+    names = names or {}
+    parts = []
+    for column, operator, value in conditions:
+        ident = quote_ident(names.get(column, column))
+        parts.append(f"{ident} {operator}" if operator in NULL_OPERATORS else f"{ident} {operator} {sql_literal(str(value))}")
+    return " AND ".join(parts)
+
+def projected_relation(relation, columns=None, conditions=(), names=None):
+    """`relation` restricted to `columns` (target names, renamed through `names`) and the conditions.
+
+    Returns `relation` itself when neither restricts it, so an unfiltered compare
+    keeps reading the plain table.
+    """
+    names = names or {}
+    if not columns and not conditions:
+        return relation
+    select = ", ".join(quote_ident(names.get(col, col)) for col in columns) if columns else "*"
+    where = where_sql(conditions, names)
+    return f"(SELECT {select} FROM {relation}{' WHERE ' + where if where else ''})"
+
+def count_rows(execute, relation):
+    """Exact row count of a relation, e.g. a filtered DuckDB table (cheap in a columnar engine)."""
+    return execute(f"SELECT count(*) FROM {relation}")[0][0]
+
+def snowflake_scan_estimate(cur, relation):
+    """{"partitions_total", "partitions_assigned", "bytes_assigned"} of the table scans of
+    SELECT * FROM relation, from EXPLAIN: Snowflake compiles the query and prunes micro-partitions
+    by the filter without running it."""
+    cur.execute(f"EXPLAIN USING TABULAR SELECT * FROM {relation}")
+    fields = [desc[0].lower() for desc in cur.description]
+    estimate = {"partitions_total": 0, "partitions_assigned": 0, "bytes_assigned": 0}
+    for row in cur.fetchall():
+        step = dict(zip(fields, row))
+        if step.get("operation") == "TableScan":
+            estimate["partitions_total"] += int(step.get("partitionstotal") or 0)
+            estimate["partitions_assigned"] += int(step.get("partitionsassigned") or 0)
+            estimate["bytes_assigned"] += int(step.get("bytesassigned") or 0)
+    return estimate
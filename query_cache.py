@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from connections import snowflake_connection, snowflake_identity
+from sql_diff import sql_literal
+
+# ---------- Configuration ----------
+CACHE_DIR = os.environ.get("QUERY_CACHE_DIR", "query_cache")
+CACHE_MAX_MB = int(os.environ.get("QUERY_CACHE_MAX_MB", "1024"))   # least recently used entries are evicted beyond this
+EVICT_GRACE_SECONDS = 300    # entries used this recently are never evicted, so a running compare keeps its file
+TABLE_VERSION_TTL_SECONDS = int(os.environ.get("QUERY_CACHE_VERSION_TTL", "60"))   # how long Snowflake table versions are reused
+
+_lock = threading.Lock()
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_TOKEN = re.compile(r'"(?:[^"]|"")+"|[A-Za-z_][A-Za-z0-9_$]*|\S')
+_FROM_END_WORDS = {"WHERE", "GROUP", "HAVING", "QUALIFY", "ORDER", "LIMIT", "UNION", "EXCEPT", "MINUS",
+                   "INTERSECT", "OFFSET", "FETCH", "WINDOW"}
+_CLAUSE_WORDS = _FROM_END_WORDS | {"JOIN", "ON", "USING", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS",
+                                   "NATURAL", "SELECT", "AS"}
+_CTE_NAME = re.compile(r'("(?:[^"]|"")+"|[A-Za-z_][A-Za-z0-9_$]*)\s+AS\s*\(', re.I)
+# Functions and clauses whose result changes without any table changing
+_NONDETERMINISTIC = re.compile(
+    r"\b(?:CURRENT_\w+|LOCALTIME|LOCALTIMESTAMP|SYSDATE|SYSTIMESTAMP|GETDATE|NOW|RANDOM|RANDSTR|UNIFORM|NORMAL|ZIPF"
+    r"|UUID_STRING|SEQ[1248]|SAMPLE|TABLESAMPLE|AT|BEFORE|CHANGES|LATERAL|TABLE)\b", re.I
+)
+_table_versions = {}    # Snowflake identity -> (fetched at, {table_name: (table_type, last_altered)})
+
+# Entries are plain Parquet files named by the SHA-256 of (normalized SQL, connection,
+# table versions), so every session and process on the host shares them. A hit
+# touches the file; the file's mtime is its last use for the LRU eviction.
+
+# ---------- Functions ----------
+def normalize_sql(sql_query):
+    """Collapse whitespace outside string literals and drop a trailing semicolon."""
+    parts = _STRING_LITERAL.split(sql_query.strip().rstrip(";"))
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts)).strip()
+
+def cache_key(sql_query, connection_id, version):
+    payload = json.dumps([normalize_sql(sql_query), connection_id, version], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+def parquet_relation(path):
+    return f"read_parquet({sql_literal(path)})"
+
+def snowflake_table_versions(conn_params):
+    """{table_name: (table_type, last_altered)} of the current-schema tables and views.
+
+    information_schema needs a running warehouse, so the list is reused for
+    TABLE_VERSION_TTL_SECONDS per connection identity: a table changed within
+    that window can still be served from the cache until it expires.
+    """
+    identity = snowflake_identity(conn_params)
+    with _lock:
+        cached = _table_versions.get(identity)
+    if cached and time.monotonic() - cached[0] < TABLE_VERSION_TTL_SECONDS:
+        return cached[1]
+    with snowflake_connection(conn_params) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT table_name, table_type, last_altered FROM information_schema.tables "
+                "WHERE table_schema = CURRENT_SCHEMA()"
+            )
+            tables = {name: (table_type, altered) for name, table_type, altered in cur.fetchall()}
+    with _lock:
+        _table_versions[identity] = (time.monotonic(), tables)
+    return tables
+
+def _identifier_name(identifier):
+    """The name Snowflake stores for an identifier: quoted ones as written, others upper-cased."""
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier.upper()
+
+def _is_identifier(token):
+    return token[0] == '"' or token[0].isalpha() or token[0] == "_"
+
+def _skip_parens(tokens, i):
+    """Index just past the parenthesis group opening at tokens[i]."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        depth += {"(": 1, ")": -1}.get(tokens[j], 0)
+        if depth == 0:
+            return j + 1
+    return len(tokens)
+
+def _read_relation(tokens, j, names):
+    """Add the relation starting at tokens[j] to `names`; index past it and its alias, or None."""
+    if tokens[j] == "(":
+        j = _skip_parens(tokens, j)   # a subquery: its own FROM is read on its own
+    elif tokens[j] and _is_identifier(tokens[j]) and tokens[j + 1] not in (".", "("):
+        names.add(_identifier_name(tokens[j]))
+        j += 1
+    else:
+        return None
+    if tokens[j].upper() == "AS":
+        j += 1
+    if tokens[j] and _is_identifier(tokens[j]) and tokens[j].upper() not in _CLAUSE_WORDS:
+        j += 1
+        if tokens[j] == "(":
+            j = _skip_parens(tokens, j)   # column aliases
+    return j
+
+def referenced_relations(sql_query):
+    """Names of the relations a query reads, or None when that cannot be told for sure.
+
+    Unqualified names after FROM, JOIN or a comma of a FROM clause count; CTE names
+    are left out, subqueries are read through. A qualified name (another schema or
+    database), a table function or a non-deterministic function or clause
+    (CURRENT_DATE, RANDOM, SAMPLE, time travel, ...) gives None. Anything else after
+    FROM that is not understood (e.g. EXTRACT(... FROM col)) counts as a relation,
+    which then fails the base-table check.
+    """
+    text = _STRING_LITERAL.sub("''", _COMMENT.sub(" ", sql_query))
+    if _NONDETERMINISTIC.search(text):
+        return None
+    tokens = _TOKEN.findall(text) + [""]
+    ctes = {_identifier_name(name) for name in _CTE_NAME.findall(text)}
+    names = set()
+    for i, token in enumerate(tokens):
+        keyword = token.upper()
+        if keyword not in ("FROM", "JOIN"):
+            continue
+        if _read_relation(tokens, i + 1, names) is None:
+            return None
+        if keyword == "JOIN":
+            continue
+        # Every top-level comma up to the end of the FROM clause starts another relation
+        depth = 0
+        for k in range(i + 1, len(tokens)):
+            depth += {"(": 1, ")": -1}.get(tokens[k], 0)
+            if depth < 0 or not tokens[k] or (depth == 0 and tokens[k].upper() in _FROM_END_WORDS):
+                break
+            if depth == 0 and tokens[k] == "," and _read_relation(tokens, k + 1, names) is None:
+                return None
+    return names - ctes
+
+def snowflake_query_key(sql_query, conn_params):
+    """Cache key of a Snowflake query, versioned by LAST_ALTERED of the tables it reads.
+
+    None (do not cache) unless every relation the query reads is a BASE TABLE of the
+    current schema: a view's base tables, a table of another schema and a
+    non-deterministic query can all change without any LAST_ALTERED we look at.
+    """
+    names = referenced_relations(sql_query)
+    if not names:
+        return None
+    tables = snowflake_table_versions(conn_params)
+    if any(tables.get(name, (None,))[0] != "BASE TABLE" for name in names):
+        return None
+    versions = sorted((name, str(tables[name][1])) for name in names)
+    return cache_key(sql_query, ["snowflake", *snowflake_identity(conn_params)], versions)
+
+def lookup(key):
+    """Path of a cached result, marked as just used, or None on a miss."""
+    path = cache_path(key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+def store_relation(con, relation, key):
+    """Write a DuckDB relation to the cache as Parquet and return its path.
+
+    The file is written under a temporary name and renamed into place, so
+    concurrent readers never see a partial entry.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        con.execute(f"COPY (SELECT * FROM {relation}) TO {sql_literal(tmp_path)} (FORMAT PARQUET)")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    evict()
+    return path
+
+def _entries():
+    """(mtime, size, path) of every cache file, oldest use first."""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".parquet"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return sorted(entries)
+
+def evict(max_mb=CACHE_MAX_MB):
+    """Remove least recently used entries until the cache fits in `max_mb`; returns how many were removed."""
+    with _lock:
+        entries = _entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        cutoff = time.time() - EVICT_GRACE_SECONDS
+        for mtime, size, path in entries:
+            if total <= max_mb * 1024 * 1024 or mtime > cutoff:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+def cache_stats():
+    entries = _entries()
+    return {"entries": len(entries), "mb": round(sum(size for _, size, _ in entries) / (1024 * 1024), 1),
+            "max_mb": CACHE_MAX_MB}
+
+def clear_cache():
+    for _, _, path in _entries():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,175 @@
+"""Run configured table-pair compares at set times or intervals, without anyone opening the app.
+
+    python reconcile_scheduler.py reconcile_schedule.json --snowflake-config sf.json
+    python reconcile_scheduler.py reconcile_schedule.json --once
+
+The schedule is a compare_cli manifest whose entries also have a unique "name" and
+either "every" (an interval such as "15m", "6h" or "1d") or "at" (times of day in the
+server's local time, e.g. ["06:00", "13:30"]):
+{"name": "employees", "source": "EMPLOYEE", "target": "employee2", "key": ["id"], "at": ["06:00"]}.
+Each due entry is submitted as a background job (see compare_jobs), so its summary and
+differing rows are kept in the job store and the app shows the latest result of every
+schedule, with a trend of its difference counts, without running a compare.
+
+main.py starts the same scheduler in the app server process, but only when a page is first
+loaded: Streamlit runs no app code at server start, so after a restart nothing is scheduled
+until someone opens the app, and runs missed meanwhile are made up once then. To run
+unattended, run this script on its own instead (e.g. as a service), while the app is not
+running: both need the DuckDB files read-write.
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+from compare_cli import exit_status, load_manifest, load_snowflake_config
+from compare_engine import DUCKDB_FILE
+from compare_jobs import ACTIVE_STATUSES, get_job, last_scheduled_runs, submit_job
+
+# ---------- Configuration ----------
+SCHEDULE_FILE = os.environ.get("RECONCILE_SCHEDULE", "reconcile_schedule.json")
+TICK_SECONDS = int(os.environ.get("RECONCILE_TICK_SECONDS", "30"))      # how often due entries are checked
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_lock = threading.Lock()
+_thread = None
+_first_seen = {}        # name -> when this process first saw an "at" entry that never ran
+
+logger = logging.getLogger(__name__)
+
+# ---------- Functions ----------
+def parse_interval(every):
+    """Seconds from an interval like "90s", "15m", "6h", "1d" (or a number of seconds)."""
+    if isinstance(every, (int, float)) and not isinstance(every, bool) and every > 0:
+        return int(every)
+    text = str(every).strip().lower()
+    if text[-1:] in INTERVAL_UNITS and text[:-1].isdigit() and int(text[:-1]) > 0:
+        return int(text[:-1]) * INTERVAL_UNITS[text[-1]]
+    raise ValueError(f"Interval {every!r} must look like 90s, 15m, 6h or 1d")
+
+def parse_times(at):
+    """Sorted (hour, minute) pairs from "HH:MM" times of day."""
+    times = []
+    for value in [at] if isinstance(at, str) else at:
+        try:
+            parsed = datetime.strptime(value.strip(), "%H:%M")
+        except (AttributeError, ValueError):
+            raise ValueError(f"Time of day {value!r} must look like 06:00") from None
+        times.append((parsed.hour, parsed.minute))
+    if not times:
+        raise ValueError("'at' needs at least one time of day")
+    return sorted(times)
+
+def load_schedule(path):
+    """[{"name", "pair", "every" (seconds) or "at" ((hour, minute) list)}] from a schedule file."""
+    entries = []
+    for i, pair in enumerate(load_manifest(path)):
+        name = pair.pop("name", None)
+        every, at = pair.pop("every", None), pair.pop("at", None)
+        if not name:
+            raise ValueError(f"Schedule entry {i} needs a 'name'")
+        if name in (entry["name"] for entry in entries):
+            raise ValueError(f"Schedule entry name {name!r} is used twice")
+        if (every is None) == (at is None):
+            raise ValueError(f"Schedule entry {name!r} needs either 'every' or 'at'")
+        entries.append({
+            "name": name,
+            "pair": pair,
+            "every": parse_interval(every) if every is not None else None,
+            "at": parse_times(at) if at is not None else None,
+        })
+    return entries
+
+def next_due(entry, last_run):
+    """When an entry that last ran at `last_run` runs next: `every` after it, or at the first
+    of its `at` times after it. A run missed while the scheduler was down is made up once."""
+    if entry["every"]:
+        return last_run + timedelta(seconds=entry["every"])
+    local = last_run.astimezone()
+    for day in (0, 1):
+        for hour, minute in entry["at"]:
+            due = datetime.combine(local.date() + timedelta(days=day), dt_time(hour, minute), tzinfo=local.tzinfo)
+            if due > local:
+                return due
+
+def run_due(entries, conn_params=None, db_file=DUCKDB_FILE, now=None):
+    """Submit the entries that are due as background jobs; returns [(name, job_id, attached)].
+
+    An "every" entry that never ran is due at once, an "at" entry that never ran at
+    its first time of day after this process first saw it.
+    """
+    now = now or datetime.now(timezone.utc)
+    last_runs = last_scheduled_runs()
+    submitted = []
+    for entry in entries:
+        last_run = last_runs.get(entry["name"])
+        if last_run is None and entry["at"]:
+            last_run = _first_seen.setdefault(entry["name"], now)
+        if last_run is None or next_due(entry, last_run) <= now:
+            job_id, attached = submit_job(entry["pair"], conn_params, db_file, schedule=entry["name"])
+            submitted.append((entry["name"], job_id, attached))
+    return submitted
+
+def _loop(path, conn_params, db_file, tick_seconds):
+    while True:
+        try:
+            # Re-read every tick, so the schedule can be created or edited while running
+            if os.path.exists(path):
+                for name, job_id, attached in run_due(load_schedule(path), conn_params, db_file):
+                    logger.info("%s: %s job %s", name, "attached to running" if attached else "started", job_id)
+        except Exception:
+            logger.exception("%s: scheduling failed", path)
+        time.sleep(tick_seconds)
+
+def start_scheduler(conn_params=None, db_file=DUCKDB_FILE, path=SCHEDULE_FILE, tick_seconds=TICK_SECONDS):
+    """Start the scheduler thread of this process; calls after the first one do nothing."""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, args=(path, conn_params, db_file, tick_seconds),
+                                       name="reconcile-scheduler", daemon=True)
+            _thread.start()
+    return _thread
+
+def wait_for_jobs(job_ids, poll_seconds=1.0):
+    """Job dicts of `job_ids` once none of them is queued or running any more."""
+    while True:
+        jobs = [get_job(job_id) for job_id in job_ids]
+        if all(job["status"] not in ACTIVE_STATUSES for job in jobs):
+            return jobs
+        time.sleep(poll_seconds)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run scheduled table-pair compares.")
+    parser.add_argument("schedule", nargs="?", default=SCHEDULE_FILE,
+                        help=f"JSON schedule of named manifest entries (default: {SCHEDULE_FILE})")
+    parser.add_argument("--db", default=DUCKDB_FILE, help=f"DuckDB file holding the targets (default: {DUCKDB_FILE})")
+    parser.add_argument("--snowflake-config", help="JSON file with Snowflake connection parameters")
+    parser.add_argument("--once", action="store_true",
+                        help="run the entries that are due, wait for them and exit (an 'at' entry that never ran "
+                             "is not due yet)")
+    parser.add_argument("--tick", type=int, default=TICK_SECONDS, help="seconds between checks for due entries")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    entries = load_schedule(args.schedule)
+    conn_params = load_snowflake_config(args.snowflake_config)
+    if conn_params is None and any(entry["pair"].get("source_type", "Snowflake") == "Snowflake" for entry in entries):
+        parser.error("--snowflake-config is required when an entry has a Snowflake source")
+    if not args.once:
+        _loop(args.schedule, conn_params, args.db, args.tick)
+
+    submitted = run_due(entries, conn_params, args.db)
+    summaries = []
+    jobs = wait_for_jobs([job_id for _, job_id, _ in submitted])
+    for (name, job_id, _), job in zip(submitted, jobs):
+        summary = job["summary"] or {"status": "error", "error": job["error"]}
+        summaries.append(summary)
+        logger.info("%s: job %s %s (%s)", name, job_id, job["status"], summary["status"])
+    return exit_status(summaries)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+
+import duckdb
+import pandas as pd
+
+from sql_diff import quote_ident, sql_literal
+
+# ---------- Configuration ----------
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join("static", "exports"))
+EXPORT_MAX_AGE_SECONDS = int(os.environ.get("EXPORT_MAX_AGE_SECONDS", str(24 * 3600)))   # older exports are removed
+EXPORT_FORMATS = {
+    "parquet": "(FORMAT PARQUET, COMPRESSION ZSTD)",
+    "csv": "(FORMAT CSV, HEADER)",
+}
+SIDE_COLUMN = "data_source"
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# DuckDB's COPY writes the file as the query produces rows, row group by row group
+# (Parquet) or chunk by chunk (CSV), so an export never holds the differences in
+# Python. Files under STATIC_DIR can be served straight from disk by Streamlit's
+# static file serving (server.enableStaticServing); each export gets a directory
+# named by a full random UUID, so its URL cannot be guessed from the table names
+# and time.
+
+# ---------- Functions ----------
+def differences_query(columns, source_relation, target_relation):
+    """Both sides' differing rows in one relation: a data_source column ("Source" / "Target")
+    followed by the compared columns under their names."""
+    aliases = ", ".join(quote_ident(col) for col in columns)
+    return (
+        f"SELECT 'Source' AS {SIDE_COLUMN}, * FROM (SELECT * FROM {source_relation}) AS _source({aliases}) "
+        f"UNION ALL SELECT 'Target', * FROM (SELECT * FROM {target_relation}) AS _target({aliases})"
+    )
+
+def export_path(name, fmt, directory=None):
+    directory = os.path.join(directory or EXPORT_DIR, uuid.uuid4().hex)
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    safe_name = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in name)
+    return os.path.join(directory, f"{safe_name}_{stamp}.{fmt}")
+
+def export_differences(con, columns, source_relation, target_relation, fmt="parquet", path=None, name="differences"):
+    """COPY the differing rows of two DuckDB relations on `con` to a Parquet or CSV file.
+
+    The file is written under a temporary name and renamed into place, so a partial
+    export is never picked up. Returns {"path", "format", "rows", "bytes"}.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    path = path or export_path(name, fmt)
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        rows = con.execute(
+            f"COPY ({differences_query(columns, source_relation, target_relation)}) "
+            f"TO {sql_literal(tmp_path)} {EXPORT_FORMATS[fmt]}"
+        ).fetchone()[0]
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    prune_exports()
+    return {"path": path, "format": fmt, "rows": rows, "bytes": os.path.getsize(path)}
+
+def export_rows(columns, only_in_source, only_in_target, fmt="parquet", path=None, name="differences"):
+    """export_differences for differences that are already Python rows (checksum, streaming, ... compares)."""
+    names = [f"c{i}" for i in range(len(columns))]
+    with duckdb.connect(":memory:") as con:
+        con.register("_export_source", pd.DataFrame.from_records(only_in_source, columns=names))
+        con.register("_export_target", pd.DataFrame.from_records(only_in_target, columns=names))
+        return export_differences(con, columns, "_export_source", "_export_target", fmt, path, name)
+
+def export_tables(columns, only_in_source, only_in_target, fmt="parquet", path=None, name="differences"):
+    """export_differences for differences held as Arrow tables (hashed compare)."""
+    with duckdb.connect(":memory:") as con:
+        con.register("_export_source", only_in_source)
+        con.register("_export_target", only_in_target)
+        return export_differences(con, columns, "_export_source", "_export_target", fmt, path, name)
+
+def static_url(path):
+    """Relative URL of an export under STATIC_DIR (served with static serving on), else None."""
+    relative = os.path.relpath(os.path.abspath(path), STATIC_DIR)
+    if relative.startswith(os.pardir):
+        return None
+    return "app/static/" + relative.replace(os.sep, "/")
+
+def prune_exports(max_age_seconds=EXPORT_MAX_AGE_SECONDS):
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - max_age_seconds
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,156 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+import duckdb
+import pyarrow as pa
+
+from connections import duckdb_connection
+from sql_diff import quote_ident
+
+# ---------- Configuration ----------
+RUN_INDEX_TABLE = "diff_runs"
+SOURCE_HISTORY_TABLE = "only_in_source"
+TARGET_HISTORY_TABLE = "only_in_target"
+RETENTION_RUNS = int(os.environ.get("DIFF_RETENTION_RUNS", "50"))       # keep at most this many runs
+RETENTION_DAYS = int(os.environ.get("DIFF_RETENTION_DAYS", "30"))       # and none older than this (0 = no age limit)
+BATCH_VIEW = "_history_batch"
+
+logger = logging.getLogger(__name__)
+
+# ---------- Functions ----------
+def rows_to_arrow(columns, rows):
+    """Column-wise Arrow table from row tuples, keeping Python types (ints, decimals, dates, ...).
+
+    A column whose values Arrow cannot put under one type is stored as text, an
+    all-NULL column as a NULL text column, and decimals as DECIMAL(38, scale).
+    """
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    arrays = []
+    for col_values in values:
+        try:
+            arrays.append(pa.array(col_values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if v is None else str(v) for v in col_values], type=pa.string()))
+    return _widen_types(pa.Table.from_arrays(arrays, names=list(columns)))
+
+def _widen_types(table):
+    """NULL-typed columns as text and decimals as DECIMAL(38, scale): their precision
+    depends on the values (or the source), so runs would not share one column type."""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.string()))
+        elif pa.types.is_decimal(field.type) and field.type.precision != 38:
+            table = table.set_column(i, field.name, table.column(i).cast(pa.decimal128(38, field.type.scale)))
+    return table
+
+def _table_columns(con, table_name):
+    return dict(con.execute(
+        "SELECT column_name, data_type FROM duckdb_columns() "
+        "WHERE database_name = current_database() AND schema_name = current_schema() AND table_name = ?",
+        [table_name]
+    ).fetchall())
+
+def _ensure_index_table(con):
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {quote_ident(RUN_INDEX_TABLE)} ("
+        "run_id VARCHAR PRIMARY KEY, created_at TIMESTAMPTZ, page VARCHAR, source_type VARCHAR, "
+        "source_table VARCHAR, target_table VARCHAR, only_in_source BIGINT, only_in_target BIGINT)"
+    )
+
+def _ensure_history_table(con, table_name, relation):
+    """Create the history table from `relation`'s schema, or evolve it: add new columns and
+    widen columns whose type changed to VARCHAR. A pre-run_id table is kept as <name>_legacy."""
+    existing = _table_columns(con, table_name)
+    if existing and "run_id" not in existing:
+        con.execute(f"ALTER TABLE {quote_ident(table_name)} RENAME TO {quote_ident(table_name + '_legacy')}")
+        existing = {}
+    if not existing:
+        con.execute(
+            f"CREATE TABLE {quote_ident(table_name)} AS "
+            f"SELECT ''::VARCHAR AS run_id, now() AS created_at, * FROM {relation} LIMIT 0"
+        )
+        return
+    for col, data_type, *_ in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall():
+        if col not in existing:
+            con.execute(f"ALTER TABLE {quote_ident(table_name)} ADD COLUMN {quote_ident(col)} {data_type}")
+        elif existing[col] != data_type and existing[col] != "VARCHAR":
+            con.execute(f"ALTER TABLE {quote_ident(table_name)} ALTER {quote_ident(col)} TYPE VARCHAR")
+
+def append_relation(con, table_name, run_id, created_at, relation):
+    """Bulk-append the rows of a DuckDB relation (e.g. a SQL diff temp table) tagged with the run."""
+    _ensure_history_table(con, table_name, relation)
+    con.execute(
+        f"INSERT INTO {quote_ident(table_name)} BY NAME "
+        f"SELECT ? AS run_id, ? AS created_at, * FROM {relation}",
+        [run_id, created_at]
+    )
+
+def append_table(con, table_name, run_id, created_at, table):
+    """Bulk-append an Arrow table, with its own column types."""
+    con.register(BATCH_VIEW, _widen_types(table))
+    try:
+        append_relation(con, table_name, run_id, created_at, BATCH_VIEW)
+    finally:
+        con.unregister(BATCH_VIEW)
+
+def append_rows(con, table_name, run_id, created_at, columns, rows):
+    """Bulk-append Python rows as one Arrow table, with their original types."""
+    append_table(con, table_name, run_id, created_at, rows_to_arrow(columns, rows))
+
+def prune_runs(con, keep_runs=RETENTION_RUNS, max_age_days=RETENTION_DAYS):
+    """Drop runs beyond the newest `keep_runs` or older than `max_age_days` from the index
+    and the history tables; returns the pruned run ids. Checkpoints afterwards so the
+    freed space is reused; the prune has committed by then, so a failed checkpoint
+    is only reported."""
+    conditions = [f"run_id NOT IN (SELECT run_id FROM {quote_ident(RUN_INDEX_TABLE)} "
+                  f"ORDER BY created_at DESC LIMIT {int(keep_runs)})"]
+    params = []
+    if max_age_days:
+        conditions.append("created_at < ?")
+        params.append(datetime.now(timezone.utc) - timedelta(days=max_age_days))
+    pruned = [row[0] for row in con.execute(
+        f"SELECT run_id FROM {quote_ident(RUN_INDEX_TABLE)} WHERE {' OR '.join(conditions)}", params
+    ).fetchall()]
+    if not pruned:
+        return []
+
+    placeholders = ", ".join("?" for _ in pruned)
+    for table_name in (SOURCE_HISTORY_TABLE, TARGET_HISTORY_TABLE):
+        if _table_columns(con, table_name):
+            con.execute(f"DELETE FROM {quote_ident(table_name)} WHERE run_id IN ({placeholders})", pruned)
+    con.execute(f"DELETE FROM {quote_ident(RUN_INDEX_TABLE)} WHERE run_id IN ({placeholders})", pruned)
+    try:
+        con.execute("CHECKPOINT")
+    except duckdb.Error as e:
+        # e.g. another cursor on the pooled connection has a transaction open
+        logger.warning("CHECKPOINT skipped: %s", e)
+    return pruned
+
+def save_diff_run(db_file, run_id, info, source_diff, target_diff):
+    """Store one compare run: both sides' differing rows plus a diff_runs index row, in one transaction.
+
+    `source_diff` / `target_diff` are Arrow tables of the rows found only in the
+    source / only in the target, appended as they are (see rows_to_arrow for Python
+    rows); `info` holds page, source_type, source_table and target_table. Old runs
+    are pruned afterwards. Returns the run's created_at.
+    """
+    created_at = datetime.now(timezone.utc)
+    with duckdb_connection(db_file) as con:
+        con.begin()
+        try:
+            _ensure_index_table(con)
+            for table_name, table in ((SOURCE_HISTORY_TABLE, source_diff), (TARGET_HISTORY_TABLE, target_diff)):
+                if table.num_rows:
+                    append_table(con, table_name, run_id, created_at, table)
+            con.execute(
+                f"INSERT INTO {quote_ident(RUN_INDEX_TABLE)} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [run_id, created_at, info.get("page"), info.get("source_type"), info.get("source_table"),
+                 info.get("target_table"), source_diff.num_rows, target_diff.num_rows]
+            )
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        prune_runs(con)
+    return created_at
@@ -0,0 +1,211 @@
+import html
+import os
+
+import duckdb
+import pandas as pd
+import streamlit as st
+
+from result_export import EXPORT_FORMATS, export_differences, static_url
+from run_profile import span
+from sql_diff import fetch_columns, quote_ident
+from transfer import stream_arrow_batches_to_duckdb
+
+# ---------- Configuration ----------
+STORE_STATE_KEY = "diff_result_store"
+RESULT_STATE_KEY = "diff_result"
+PAGE_STATE_KEY = "result_page"
+EXPORT_STATE_KEY = "result_export"
+SOURCE_RESULT_TABLE = "result_only_in_source"
+TARGET_RESULT_TABLE = "result_only_in_target"
+PAGE_SIZES = [50, 100, 250, 500]
+SOURCE_COLOR = "#00FF00"
+TARGET_COLOR = "#FF0000"
+DOWNLOAD_MAX_MB = 200    # larger exports are only offered through static serving; the app would buffer them in memory
+
+# ---------- Functions ----------
+def get_result_store():
+    """Per-session in-memory DuckDB connection holding the current diff result."""
+    if STORE_STATE_KEY not in st.session_state:
+        st.session_state[STORE_STATE_KEY] = duckdb.connect(":memory:")
+    return st.session_state[STORE_STATE_KEY]
+
+def clear_result():
+    st.session_state.pop(RESULT_STATE_KEY, None)
+
+def _number_rows(store, table_name):
+    """Add a 1-based _seq column, in row order, so pages can be read with a range predicate.
+
+    Sorting both sides the same way keeps rows sharing a leading key next to each
+    other in the interleaved view.
+    """
+    order_by = ", ".join(quote_ident(col) for col in fetch_columns(store, quote_ident(table_name)))
+    store.execute(
+        f'CREATE OR REPLACE TABLE "{table_name}" AS '
+        f'SELECT row_number() OVER (ORDER BY {order_by}) AS _seq, * FROM "{table_name}"'
+    )
+
+def _store_rows(store, table_name, columns, rows):
+    df = pd.DataFrame.from_records(rows, columns=[f"c{i}" for i in range(len(columns))])
+    store.register("_result_rows", df)
+    try:
+        store.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM _result_rows')
+    finally:
+        store.unregister("_result_rows")
+    _number_rows(store, table_name)
+
+def _store_relation(store, table_name, con, relation):
+    reader = con.execute(f"SELECT * FROM {relation}").fetch_record_batch()
+    stream_arrow_batches_to_duckdb(reader, store, table_name, [f"c{i}" for i in range(len(reader.schema))])
+    _number_rows(store, table_name)
+
+def _save_meta(store, columns, counts):
+    counts = dict(counts or {})
+    counts["only_in_source"] = store.execute(f'SELECT count(*) FROM "{SOURCE_RESULT_TABLE}"').fetchone()[0]
+    counts["only_in_target"] = store.execute(f'SELECT count(*) FROM "{TARGET_RESULT_TABLE}"').fetchone()[0]
+    st.session_state[RESULT_STATE_KEY] = {"columns": list(columns), "counts": counts}
+    st.session_state.pop(PAGE_STATE_KEY, None)
+    st.session_state.pop(EXPORT_STATE_KEY, None)
+
+def save_rows_result(columns, only_in_source, only_in_target, counts=None):
+    """Keep Python-side differences (checksum / streaming compares) server-side for paging."""
+    store = get_result_store()
+    with span("store", rows=len(only_in_source) + len(only_in_target)):
+        _store_rows(store, SOURCE_RESULT_TABLE, columns, only_in_source)
+        _store_rows(store, TARGET_RESULT_TABLE, columns, only_in_target)
+        _save_meta(store, columns, counts)
+
+def save_arrow_result(columns, only_in_source, only_in_target, counts=None):
+    """Keep differences held as Arrow tables (hashed compare) server-side, batch by batch."""
+    store = get_result_store()
+    with span("store", rows=only_in_source.num_rows + only_in_target.num_rows):
+        for table_name, table in ((SOURCE_RESULT_TABLE, only_in_source), (TARGET_RESULT_TABLE, only_in_target)):
+            stream_arrow_batches_to_duckdb(table.to_batches(), store, table_name,
+                                           [f"c{i}" for i in range(table.num_columns)])
+            _number_rows(store, table_name)
+        _save_meta(store, columns, counts)
+
+def save_relation_result(con, columns, source_relation, target_relation, counts=None):
+    """Copy differing rows that live in DuckDB (e.g. the SQL diff temp tables) into the result store
+    as Arrow batches, without turning them into Python rows."""
+    store = get_result_store()
+    with span("store") as stored:
+        _store_relation(store, SOURCE_RESULT_TABLE, con, source_relation)
+        _store_relation(store, TARGET_RESULT_TABLE, con, target_relation)
+        _save_meta(store, columns, counts)
+        meta = st.session_state[RESULT_STATE_KEY]["counts"]
+        stored["rows"] = meta["only_in_source"] + meta["only_in_target"]
+
+def fetch_page(page, page_size):
+    """Interleaved (side, row) pairs for one page: source/target rows page*size+1 .. (page+1)*size."""
+    store = get_result_store()
+    low, high = page * page_size, (page + 1) * page_size
+    pages = {}
+    for side, table_name in (("Source", SOURCE_RESULT_TABLE), ("Target", TARGET_RESULT_TABLE)):
+        pages[side] = store.execute(
+            f'SELECT * EXCLUDE (_seq) FROM "{table_name}" WHERE _seq > ? AND _seq <= ? ORDER BY _seq',
+            [low, high]
+        ).fetchall()
+
+    return interleave(pages["Source"], pages["Target"])
+
+def interleave(only_in_source, only_in_target):
+    """(side, row) pairs alternating between the source and target rows."""
+    rows = []
+    for i in range(max(len(only_in_source), len(only_in_target))):
+        if i < len(only_in_source):
+            rows.append(("Source", only_in_source[i]))
+        if i < len(only_in_target):
+            rows.append(("Target", only_in_target[i]))
+    return rows
+
+def render_page_html(columns, rows):
+    parts = [
+        "<table class='comparison-table' style='width:100%; border: 1px solid #444; text-align: center; border-collapse: collapse;'>",
+        "<tr><th style='background-color:#333; color:#DDDDDD;'>Data Source</th>",
+    ]
+    parts.extend(f"<th style='background-color:#333; color:#DDDDDD;'>{html.escape(str(col))}</th>" for col in columns)
+    parts.append("</tr>")
+    for side, values in rows:
+        color = SOURCE_COLOR if side == "Source" else TARGET_COLOR
+        parts.append(f"<tr><td style='color:{color}; font-weight:bold;'>{side}</td>")
+        parts.extend(f"<td style='color:{color};'>{html.escape(str(val))}</td>" for val in values)
+        parts.append("</tr>")
+    parts.append("</table>")
+    return "".join(parts)
+
+def render_live_rows(placeholder, columns, only_in_source, only_in_target, caption):
+    """Replace the contents of an st.empty() placeholder with the rows found so far,
+    so results show up while a compare is still scanning."""
+    with placeholder.container():
+        st.caption(caption)
+        st.markdown(render_page_html(columns, interleave(only_in_source, only_in_target)), unsafe_allow_html=True)
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def render_export_controls(columns):
+    """Write the stored differences to a Parquet / CSV file with DuckDB COPY and offer it for download."""
+    with st.expander("Download differences"):
+        fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True, key="export_format", format_func=str.upper)
+        if st.button("Export"):
+            store = get_result_store()
+            with span("export", format=fmt) as export_span:
+                st.session_state[EXPORT_STATE_KEY] = export_differences(
+                    store, columns,
+                    f'(SELECT * EXCLUDE (_seq) FROM "{SOURCE_RESULT_TABLE}" ORDER BY _seq)',
+                    f'(SELECT * EXCLUDE (_seq) FROM "{TARGET_RESULT_TABLE}" ORDER BY _seq)',
+                    fmt
+                )
+                export_span.update(rows=st.session_state[EXPORT_STATE_KEY]["rows"],
+                                   bytes=st.session_state[EXPORT_STATE_KEY]["bytes"])
+
+        export = st.session_state.get(EXPORT_STATE_KEY)
+        if export is None:
+            return
+        name = os.path.basename(export["path"])
+        st.caption(f"{export['rows']:,} rows · {export['bytes'] / (1024 * 1024):,.1f} MB written to {export['path']}")
+        url = static_url(export["path"])
+        if url and st.get_option("server.enableStaticServing"):
+            # Served from disk by the web server, so file size doesn't matter
+            st.markdown(f'<a href="{html.escape(url)}" download="{html.escape(name)}">⬇️ Download {html.escape(name)}</a>',
+                        unsafe_allow_html=True)
+        elif export["bytes"] <= DOWNLOAD_MAX_MB * 1024 * 1024:
+            st.download_button(f"⬇️ Download {name}", data=lambda: _read_file(export["path"]), file_name=name,
+                               on_click="ignore")
+        else:
+            st.info(f"Exports over {DOWNLOAD_MAX_MB} MB are downloaded through static file serving: run with "
+                    "server.enableStaticServing = true, or copy the file from the server.")
+
+def render_result_viewer(title="### 🟢🔴 Differences Interleaved"):
+    """Summary header plus one page of the stored differences; only that page is read and sent."""
+    result = st.session_state.get(RESULT_STATE_KEY)
+    if result is None:
+        return
+
+    counts = result["counts"]
+    header = [f"Only in source: **{counts['only_in_source']:,}**", f"Only in target: **{counts['only_in_target']:,}**"]
+    if "source_rows" in counts:
+        header = [f"Source rows: **{counts['source_rows']:,}**", f"Target rows: **{counts['target_rows']:,}**"] + header
+    st.markdown(" · ".join(header))
+
+    total = max(counts["only_in_source"], counts["only_in_target"])
+    if not total:
+        st.success("🎉 No differences found! Source and Target are identical.")
+        return
+
+    st.write(title)
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key="result_page_size",
+                                 on_change=lambda: st.session_state.pop(PAGE_STATE_KEY, None))
+    page_count = (total + page_size - 1) // page_size
+    with col2:
+        page = st.number_input(f"Page (of {page_count:,})", min_value=1, max_value=page_count, value=1, key=PAGE_STATE_KEY)
+
+    with span("render") as render:
+        rows = fetch_page(min(page, page_count) - 1, page_size)
+        page_html = render_page_html(result["columns"], rows)
+        render.update(rows=len(rows), bytes=len(page_html))
+    st.markdown(page_html, unsafe_allow_html=True)
+    render_export_controls(result["columns"])
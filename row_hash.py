@@ -0,0 +1,75 @@
+import duckdb
+import numpy as np
+import pyarrow as pa
+
+from checksum_diff import NULL_MARKER
+from sql_diff import quote_ident
+
+# ---------- Configuration ----------
+HASH_BYTES = 8    # one uint64 per row
+BATCH_VIEW = "_hash_batch"
+
+# Rows stay in their Arrow batches; each row is reduced to a 64-bit hash of its
+# values' text, computed a batch at a time by DuckDB's vectorized hash() into a NumPy
+# array, and the differences are found by counting each hash on both sides, so
+# repeated rows are matched one-for-one as in EXCEPT ALL. Only the differing rows are
+# taken from the batches, still as Arrow. Values hash by their text so that e.g. a Snowflake
+# NUMBER and a DuckDB BIGINT holding the same number match.
+
+# ---------- Functions ----------
+def row_hash_sql(columns):
+    """DuckDB expression hashing a row's values as text; NULL hashes as NULL_MARKER."""
+    return "hash(" + ", ".join(
+        f"coalesce(CAST({quote_ident(col)} AS VARCHAR), '{NULL_MARKER}')" for col in columns
+    ) + ")"
+
+def hash_batch(con, batch, columns):
+    """uint64 hash of every row of an Arrow record batch over `columns`, in that order."""
+    con.register(BATCH_VIEW, batch)
+    try:
+        return con.execute(f"SELECT {row_hash_sql(columns)} AS h FROM {BATCH_VIEW}").fetchnumpy()["h"]
+    finally:
+        con.unregister(BATCH_VIEW)
+
+def hash_batches(batches, columns):
+    """(Arrow table, uint64 row hashes) of a stream of record batches, hashed on a scratch in-memory DuckDB."""
+    kept, hashes = [], []
+    with duckdb.connect(":memory:") as con:
+        for batch in batches:
+            if batch.num_rows:
+                kept.append(batch)
+                hashes.append(hash_batch(con, batch, columns))
+    table = pa.Table.from_batches(kept) if kept else None
+    return table, np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+
+def missing_rows(hashes, other_hashes):
+    """Sorted indices of the rows not matched one-for-one by a row of `other_hashes`.
+
+    Like EXCEPT ALL: a hash found n times here and m times there gives its first
+    n - m rows (none when m >= n).
+    """
+    order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+    distinct, first, counts = np.unique(sorted_hashes, return_index=True, return_counts=True)
+    other_distinct, other_counts = np.unique(other_hashes, return_counts=True)
+    matched = np.zeros(len(distinct), dtype=np.int64)
+    if len(other_distinct):
+        pos = np.minimum(np.searchsorted(other_distinct, distinct), len(other_distinct) - 1)
+        found = other_distinct[pos] == distinct
+        matched[found] = other_counts[pos[found]]
+    surplus = np.maximum(counts - matched, 0)
+    rank = np.arange(len(sorted_hashes)) - np.repeat(first, counts)
+    return np.sort(order[rank < np.repeat(surplus, counts)])
+
+def take_rows(table, indices, columns, names=None):
+    """Arrow table of the rows at `indices`, with `columns` in that order renamed to `names`."""
+    names = list(names or columns)
+    if table is None:
+        return pa.table({name: pa.array([], type=pa.string()) for name in names})
+    return table.take(pa.array(indices, type=pa.int64())).select(columns).rename_columns(names)
+
+def table_rows(table, limit=None):
+    """Value tuples of an Arrow table's first `limit` rows (all rows when None)."""
+    if limit is not None:
+        table = table.slice(0, limit)
+    return list(zip(*(column.to_pylist() for column in table.columns)))
@@ -0,0 +1,169 @@
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# ---------- Configuration ----------
+RUN_LOG_FILE = os.environ.get("RUN_LOG_FILE", "run_log.jsonl")
+PROFILE_DIR = os.environ.get("RUN_PROFILE_DIR", "run_profiles")
+PROFILERS = ["cProfile", "pyinstrument"]
+PROFILER_REPORT_LINES = 40
+
+_current = contextvars.ContextVar("run_profile", default=None)
+_lock = threading.Lock()
+
+# ---------- Functions ----------
+def peak_rss_mb():
+    """High-water resident set size of this process (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def rss_mb():
+    """Current resident set size (Linux /proc only, otherwise None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+def bind_run(fn):
+    """Wrap `fn` so it runs in a copy of the caller's context, keeping the active run
+    profile visible on worker threads. Wrap each submitted callable separately."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+@contextmanager
+def span(name, **fields):
+    """Time one stage of the active run.
+
+    Yields a dict the caller can fill in with "rows" / "bytes" (or anything else);
+    duration, thread and memory are added on exit. Outside a run this only yields
+    a scratch dict, so library code can be instrumented unconditionally.
+    """
+    profile = _current.get()
+    record = dict(fields)
+    if profile is None:
+        yield record
+        return
+    if profile.get("_on_progress"):
+        profile["_on_progress"](name)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.update(
+            name=name,
+            thread=threading.current_thread().name,
+            start=round(start - profile["_start"], 4),
+            seconds=round(time.perf_counter() - start, 4),
+            rss_mb=rss_mb(),
+            peak_rss_mb=peak_rss_mb(),
+        )
+        with _lock:
+            profile["spans"].append(record)
+
+def checkpoint(name, rows=None):
+    """Report progress inside a long stage (e.g. per fetched batch) to the active run's
+    `on_progress` hook, if any; nothing is recorded in the profile."""
+    profile = _current.get()
+    if profile is not None and profile.get("_on_progress"):
+        profile["_on_progress"](name, rows)
+
+def _start_profiler(profiler):
+    if profiler == "cProfile":
+        prof = cProfile.Profile()
+        prof.enable()
+        return prof
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler   # optional dependency, only needed when selected
+        prof = Profiler()
+        prof.start()
+        return prof
+    raise ValueError(f"Unknown profiler {profiler!r}; expected one of {', '.join(PROFILERS)}")
+
+def _stop_profiler(profiler, prof, run_id):
+    """Stop the profiler, save its full output under PROFILE_DIR and return (path, text summary)."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if profiler == "cProfile":
+        prof.disable()
+        path = os.path.join(PROFILE_DIR, f"{run_id}.prof")
+        prof.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(PROFILER_REPORT_LINES)
+        return path, out.getvalue()
+    prof.stop()
+    path = os.path.join(PROFILE_DIR, f"{run_id}.html")
+    with open(path, "w") as f:
+        f.write(prof.output_html())
+    return path, prof.output_text()
+
+def write_run_log(profile, log_file=RUN_LOG_FILE):
+    record = {k: v for k, v in profile.items() if not k.startswith("_")}
+    with _lock:
+        with open(log_file, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+@contextmanager
+def profile_run(page, params=None, enabled=True, profiler=None, log_file=RUN_LOG_FILE, on_progress=None):
+    """Collect the spans of one compare run and append them to the JSONL run log.
+
+    Yields the profile dict ({"run_id", "page", "params", "spans", ...}), or None when
+    not enabled. `profiler` ("cProfile" / "pyinstrument") additionally profiles the
+    calling thread for this run only; its report is kept next to the log. The
+    profile records status "error" if the run raised and "stopped" if it was
+    interrupted (e.g. st.stop()). `on_progress(name, rows=None)` is called as each span
+    starts and at each checkpoint, on whichever thread runs it; an exception it raises
+    aborts the stage.
+    """
+    if not enabled:
+        yield None
+        return
+    profile = {
+        "run_id": uuid.uuid4().hex[:12],
+        "page": page,
+        "params": params or {},
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "status": "ok",
+        "spans": [],
+        "_start": time.perf_counter(),
+        "_on_progress": on_progress,
+    }
+    prof = None
+    if profiler:
+        try:
+            prof = _start_profiler(profiler)
+        except (ImportError, ValueError) as e:
+            # e.g. pyinstrument not installed, or another session is already being profiled
+            profile["profiler_error"] = f"{profiler} could not be started: {e}"
+    token = _current.set(profile)
+    try:
+        yield profile
+    except Exception as e:
+        profile["status"] = "error"
+        profile["error"] = f"{type(e).__name__}: {e}"
+        raise
+    except BaseException:
+        profile["status"] = "stopped"
+        raise
+    finally:
+        _current.reset(token)
+        if prof is not None:
+            profile["profiler"] = profiler
+            profile["profiler_output"], profile["_profiler_report"] = _stop_profiler(profiler, prof, profile["run_id"])
+        profile["seconds"] = round(time.perf_counter() - profile["_start"], 4)
+        profile["peak_rss_mb"] = peak_rss_mb()
+        write_run_log(profile, log_file)
@@ -0,0 +1,69 @@
+import math
+
+from checksum_diff import hash_columns_sql
+from sql_diff import ONLY_IN_SOURCE_TABLE, ONLY_IN_TARGET_TABLE, quote_ident
+
+# ---------- Configuration ----------
+SAMPLE_MODULUS = 1_000_000    # sample rates resolve to 1 / SAMPLE_MODULUS
+DEFAULT_SAMPLE_RATE = 0.01
+CONFIDENCE_Z = 1.96           # 95% confidence
+
+# ---------- Functions ----------
+def sample_threshold(sample_rate):
+    return min(SAMPLE_MODULUS, max(1, round(sample_rate * SAMPLE_MODULUS)))
+
+def effective_rate(sample_rate):
+    """The rate actually sampled once rounded to the hash resolution."""
+    return sample_threshold(sample_rate) / SAMPLE_MODULUS
+
+def sample_query(dialect, relation, columns, key_columns, sample_rate, aliases=None, kinds=None):
+    """SELECT the rows of `relation` whose key hash falls in the sample.
+
+    The key hash is the same MD5-based value in DuckDB and Snowflake, so both sides
+    keep the same keys and the filter runs where the data lives. `aliases` renames
+    the output columns (e.g. Snowflake upper-case names to the target's names) and
+    `kinds` is checksum_diff.column_kinds of the key columns.
+    """
+    aliases = aliases or columns
+    select = ", ".join(f"{quote_ident(col)} AS {quote_ident(alias)}" for col, alias in zip(columns, aliases))
+    return (
+        f"SELECT {select} FROM {relation} "
+        f"WHERE {hash_columns_sql(dialect, key_columns, kinds)} % {SAMPLE_MODULUS} < {sample_threshold(sample_rate)}"
+    )
+
+def wilson_interval(mismatches, sampled, z=CONFIDENCE_Z):
+    """Wilson score interval for a mismatch proportion; (0, 1) when nothing was sampled."""
+    if not sampled:
+        return 0.0, 1.0
+    p = mismatches / sampled
+    denom = 1 + z * z / sampled
+    centre = (p + z * z / (2 * sampled)) / denom
+    half = z * math.sqrt(p * (1 - p) / sampled + z * z / (4 * sampled * sampled)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+def mismatch_stats(con, source_relation, target_relation, key_columns, sample_rate):
+    """Key-level mismatch rate of a sampled diff, read after sql_diff.diff_relations has run
+    on the two sample relations. A key counts as mismatched if any of its rows differ.
+
+    Returns sampled / mismatched key counts, the rate with its confidence interval and
+    the implied number of mismatched keys in the full tables.
+    """
+    keys = ", ".join(quote_ident(col) for col in key_columns)
+    sampled = con.execute(
+        f"SELECT count(*) FROM (SELECT {keys} FROM {source_relation} UNION SELECT {keys} FROM {target_relation})"
+    ).fetchone()[0]
+    mismatched = con.execute(
+        f"SELECT count(*) FROM (SELECT {keys} FROM {ONLY_IN_SOURCE_TABLE} UNION SELECT {keys} FROM {ONLY_IN_TARGET_TABLE})"
+    ).fetchone()[0]
+    low, high = wilson_interval(mismatched, sampled)
+    rate = effective_rate(sample_rate)
+    return {
+        "sample_rate": rate,
+        "sampled_keys": sampled,
+        "mismatched_keys": mismatched,
+        "mismatch_rate": mismatched / sampled if sampled else 0.0,
+        "ci_low": low,
+        "ci_high": high,
+        "estimated_keys": round(sampled / rate),
+        "estimated_mismatched_keys": round(mismatched / rate),
+    }
@@ -0,0 +1,77 @@
+import duckdb
+
+# ---------- Configuration ----------
+ONLY_IN_SOURCE_TABLE = "_only_in_source"
+ONLY_IN_TARGET_TABLE = "_only_in_target"
+
+# ---------- Functions ----------
+def quote_ident(name):
+    """Quote a DuckDB/Snowflake identifier, escaping embedded double quotes."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def sql_literal(value):
+    """Render a Python value as a SQL literal (NULL, number or escaped string)."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def qualified_name(*parts):
+    """Build a dotted, quoted relation name, e.g. qualified_name("db", "main", "t") -> "db"."main"."t"."""
+    return ".".join(quote_ident(part) for part in parts if part)
+
+def subquery(sql_query):
+    """Wrap a user SQL query so it can be used as a relation, e.g. in FROM or EXCEPT ALL."""
+    return "(" + sql_query.strip().rstrip(";") + ")"
+
+def fetch_columns(con, relation):
+    """Return the column names of a relation (quoted table name or parenthesised query) without reading rows."""
+    res = con.execute(f"SELECT * FROM {relation} LIMIT 0")
+    return [desc[0] for desc in res.description]
+
+def except_all_sql(left_relation, right_relation):
+    """Multiset difference: rows of left that are not matched one-for-one by rows of right."""
+    return f"SELECT * FROM {left_relation} EXCEPT ALL SELECT * FROM {right_relation}"
+
+def diff_relations(con, source_relation, target_relation, row_counts=None):
+    """Diff two relations inside DuckDB and keep the differing rows in temp tables on `con`.
+
+    Both sides are compared positionally with EXCEPT ALL, so duplicate rows are
+    counted rather than collapsed. Nothing is returned to Python except the counts;
+    use fetch_diff_rows to read the differing rows. Pass `row_counts` as
+    (source rows, target rows) when they are already known to skip counting them.
+    """
+    con.execute(
+        f"CREATE OR REPLACE TEMP TABLE {ONLY_IN_SOURCE_TABLE} AS "
+        + except_all_sql(source_relation, target_relation)
+    )
+    con.execute(
+        f"CREATE OR REPLACE TEMP TABLE {ONLY_IN_TARGET_TABLE} AS "
+        + except_all_sql(target_relation, source_relation)
+    )
+    if row_counts is None:
+        row_counts = (
+            con.execute(f"SELECT count(*) FROM {source_relation}").fetchone()[0],
+            con.execute(f"SELECT count(*) FROM {target_relation}").fetchone()[0],
+        )
+    return {
+        "source_rows": row_counts[0],
+        "target_rows": row_counts[1],
+        "only_in_source": con.execute(f"SELECT count(*) FROM {ONLY_IN_SOURCE_TABLE}").fetchone()[0],
+        "only_in_target": con.execute(f"SELECT count(*) FROM {ONLY_IN_TARGET_TABLE}").fetchone()[0],
+    }
+
+def fetch_diff_rows(con, limit=None, offset=0):
+    """Read the rows left behind by diff_relations as (only_in_source, only_in_target) lists of tuples."""
+    page = f" LIMIT {int(limit)} OFFSET {int(offset)}" if limit is not None else ""
+    only_in_source = con.execute(f"SELECT * FROM {ONLY_IN_SOURCE_TABLE}{page}").fetchall()
+    only_in_target = con.execute(f"SELECT * FROM {ONLY_IN_TARGET_TABLE}{page}").fetchall()
+    return only_in_source, only_in_target
+
+def diff_duckdb_tables(db_file, source_table, target_table):
+    """Convenience wrapper: diff two tables of the same DuckDB file and return the differing rows."""
+    with duckdb.connect(database=db_file, read_only=True) as con:
+        counts = diff_relations(con, quote_ident(source_table), quote_ident(target_table))
+        only_in_source, only_in_target = fetch_diff_rows(con)
+    return only_in_source, only_in_target, counts
@@ -0,0 +1,118 @@
+import os
+from datetime import datetime, timezone
+
+from connections import snowflake_connection
+from run_profile import span
+from sql_diff import qualified_name, quote_ident
+from transfer import stream_snowflake_cursor_to_duckdb
+
+# ---------- Configuration ----------
+MIRROR_SCHEMA = os.environ.get("MIRROR_SCHEMA", "snowflake_mirror")   # schema in the DuckDB file holding the mirrors
+MIRROR_INDEX_TABLE = "mirror_tables"
+DELTA_TABLE = "_mirror_delta"
+FULL_REFRESH = "full"
+INCREMENTAL_REFRESH = "incremental"
+
+# Mirrors are ordinary DuckDB tables, so compares scan them column by column from the
+# local file instead of downloading the Snowflake table on every run.
+
+# ---------- Functions ----------
+def mirror_relation(table):
+    return qualified_name(MIRROR_SCHEMA, table)
+
+def _ensure_mirror_schema(con):
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_ident(MIRROR_SCHEMA)}")
+    con.execute(
+        f"CREATE TABLE IF NOT EXISTS {mirror_relation(MIRROR_INDEX_TABLE)} ("
+        "table_name VARCHAR PRIMARY KEY, watermark_column VARCHAR, key_columns VARCHAR[], watermark VARCHAR, "
+        "rows BIGINT, delta_rows BIGINT, refresh_mode VARCHAR, refreshed_at TIMESTAMPTZ)"
+    )
+
+def mirror_status(con, table=None):
+    """Index rows of the mirrored tables (or of one table) as dicts, with "age_seconds" since the last refresh."""
+    exists = con.execute(
+        "SELECT count(*) FROM duckdb_tables() "
+        "WHERE database_name = current_database() AND schema_name = ? AND table_name = ?",
+        [MIRROR_SCHEMA, MIRROR_INDEX_TABLE]
+    ).fetchone()[0]
+    if not exists:
+        return [] if table is None else None
+    res = con.execute(
+        f"SELECT *, epoch(now() - refreshed_at) AS age_seconds FROM {mirror_relation(MIRROR_INDEX_TABLE)}"
+        + (" WHERE table_name = ?" if table is not None else " ORDER BY table_name"),
+        [table] if table is not None else []
+    )
+    fields = [desc[0] for desc in res.description]
+    rows = [dict(zip(fields, row)) for row in res.fetchall()]
+    if table is None:
+        return rows
+    return rows[0] if rows else None
+
+def refresh_mirror(con, table, conn_params, watermark_column=None, key_columns=None, full=False):
+    """Bring the local mirror of a Snowflake table up to date and return its index row.
+
+    With a `watermark_column` (e.g. an UPDATED_AT timestamp or increasing id) only
+    rows above the mirror's current maximum are fetched; rows whose `key_columns`
+    match a fetched row are replaced, the rest are appended. Without one, or with
+    `full`, the whole table is reloaded. Rows deleted in Snowflake are only dropped
+    by a full reload.
+    """
+    _ensure_mirror_schema(con)
+    previous = mirror_status(con, table)
+    if previous and watermark_column is None and key_columns is None:
+        watermark_column, key_columns = previous["watermark_column"], previous["key_columns"]
+    key_columns = list(key_columns or [])
+    target = mirror_relation(table)
+
+    last = None
+    if watermark_column and not full and previous and previous["watermark_column"] == watermark_column:
+        last = con.execute(f"SELECT max({quote_ident(watermark_column)}) FROM {target}").fetchone()[0]
+
+    sql_query = f"SELECT * FROM {quote_ident(table)}"
+    with snowflake_connection(conn_params) as conn:
+        with conn.cursor() as cur:
+            with span("snowflake_query", table=table):
+                if last is None:
+                    cur.execute(sql_query)
+                else:
+                    cur.execute(f"{sql_query} WHERE {quote_ident(watermark_column)} > %s", [last])
+            with span("fetch_and_stage", table=table) as stage:
+                _, stats = stream_snowflake_cursor_to_duckdb(cur, con, DELTA_TABLE, temporary=True)
+                stage.update(rows=stats["rows"], bytes=stats["bytes"])
+
+    mode = FULL_REFRESH if last is None else INCREMENTAL_REFRESH
+    with span("mirror_apply", table=table, mode=mode):
+        con.begin()
+        try:
+            if mode == FULL_REFRESH:
+                con.execute(f"CREATE OR REPLACE TABLE {target} AS SELECT * FROM {quote_ident(DELTA_TABLE)}")
+            else:
+                if key_columns:
+                    match = " AND ".join(f"{target}.{quote_ident(col)} = _delta.{quote_ident(col)}" for col in key_columns)
+                    con.execute(f"DELETE FROM {target} USING {quote_ident(DELTA_TABLE)} AS _delta WHERE {match}")
+                con.execute(f"INSERT INTO {target} BY NAME SELECT * FROM {quote_ident(DELTA_TABLE)}")
+            rows = con.execute(f"SELECT count(*) FROM {target}").fetchone()[0]
+            watermark = None
+            if watermark_column:
+                watermark = con.execute(f"SELECT max({quote_ident(watermark_column)}) FROM {target}").fetchone()[0]
+            con.execute(
+                f"INSERT OR REPLACE INTO {mirror_relation(MIRROR_INDEX_TABLE)} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [table, watermark_column, key_columns, None if watermark is None else str(watermark), rows,
+                 stats["rows"], mode, datetime.now(timezone.utc)]
+            )
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        finally:
+            con.execute(f"DROP TABLE IF EXISTS {quote_ident(DELTA_TABLE)}")
+    return mirror_status(con, table)
+
+def format_age(seconds):
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 36 * 3600:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} days"
@@ -0,0 +1,161 @@
+import heapq
+import os
+import pickle
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from numbers import Number
+
+from run_profile import checkpoint
+
+# ---------- Configuration ----------
+DEFAULT_MEMORY_BUDGET_MB = 256
+FETCH_CHUNK_ROWS = 10_000
+SPILL_BATCH_ROWS = 1_000
+SIZE_SAMPLE_ROWS = 100
+
+# ---------- Functions ----------
+def iter_cursor_rows(cur, chunk_rows=FETCH_CHUNK_ROWS):
+    """Yield rows from an executed Snowflake or DuckDB cursor, fetchmany() chunk by chunk."""
+    fetched = 0
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        fetched += len(rows)
+        checkpoint("fetch_rows", fetched)
+        yield from rows
+
+def row_sort_key(row):
+    """Total order over rows from either engine: NULLs first, values grouped by kind so
+    Decimal/int/float still compare with each other but never with strings or dates.
+    NaN compares unequal to everything, itself included, so it gets a fixed key of its
+    own (equal to any other NaN, as in DuckDB) that keeps the order total."""
+    return tuple(
+        (0, "", 0) if value is None
+        else (1, "nan", 0) if isinstance(value, Number) and value != value
+        else (1, "number", value) if isinstance(value, Number)
+        else (1, type(value).__name__, value)
+        for value in row
+    )
+
+def estimate_row_bytes(rows):
+    if not rows:
+        return 1
+    total = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in rows)
+    return max(1, total // len(rows))
+
+def _write_run(run, spill_dir):
+    run.sort(key=row_sort_key)
+    fd, path = tempfile.mkstemp(suffix=".run", dir=spill_dir)
+    with os.fdopen(fd, "wb") as f:
+        for i in range(0, len(run), SPILL_BATCH_ROWS):
+            pickle.dump(run[i:i + SPILL_BATCH_ROWS], f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+def external_sort(rows, memory_budget_bytes, spill_dir):
+    """Yield `rows` in row_sort_key order while holding at most ~memory_budget_bytes of rows.
+
+    Rows are collected into runs sized from a sample of the first rows; a run that fills
+    up is sorted and spilled to `spill_dir`, and the runs are merged lazily at the end.
+    Input that fits in a single run is sorted in memory without touching disk.
+    """
+    rows = iter(rows)
+    run = []
+    run_paths = []
+    rows_per_run = None
+
+    for row in rows:
+        run.append(row)
+        if rows_per_run is None and len(run) >= SIZE_SAMPLE_ROWS:
+            rows_per_run = max(SIZE_SAMPLE_ROWS, memory_budget_bytes // estimate_row_bytes(run))
+        if rows_per_run is not None and len(run) >= rows_per_run:
+            run_paths.append(_write_run(run, spill_dir))
+            run = []
+
+    if not run_paths:
+        run.sort(key=row_sort_key)
+        yield from run
+        return
+
+    if run:
+        run_paths.append(_write_run(run, spill_dir))
+        run = []
+    try:
+        yield from heapq.merge(*[_read_run(path) for path in run_paths], key=row_sort_key)
+    finally:
+        for path in run_paths:
+            os.remove(path)
+
+def merge_diff(sorted_source, sorted_target):
+    """Merge-join two row streams sorted by row_sort_key.
+
+    Yields ("Source", row) / ("Target", row) for rows not matched one-for-one on the
+    other side, so duplicates are handled like EXCEPT ALL.
+    """
+    source_iter = iter(sorted_source)
+    target_iter = iter(sorted_target)
+    source_row = next(source_iter, None)
+    target_row = next(target_iter, None)
+
+    while source_row is not None and target_row is not None:
+        source_key = row_sort_key(source_row)
+        target_key = row_sort_key(target_row)
+        if source_key < target_key:
+            yield "Source", source_row
+            source_row = next(source_iter, None)
+        elif target_key < source_key:
+            yield "Target", target_row
+            target_row = next(target_iter, None)
+        else:
+            source_row = next(source_iter, None)
+            target_row = next(target_iter, None)
+
+    while source_row is not None:
+        yield "Source", source_row
+        source_row = next(source_iter, None)
+    while target_row is not None:
+        yield "Target", target_row
+        target_row = next(target_iter, None)
+
+def sort_side(rows, memory_budget_bytes, spill_dir):
+    """Externally sort one side and return it as an iterator.
+
+    All input is read (and spilled) before this returns, so the two sides can be
+    sorted on separate threads and then merged.
+    """
+    sorted_rows = external_sort(rows, memory_budget_bytes, spill_dir)
+    first = next(sorted_rows, None)
+    return iter(()) if first is None else _prepend(first, sorted_rows)
+
+def side_budget_bytes(memory_budget_mb):
+    """Each side gets half of the budget, since both are sorted at the same time."""
+    return memory_budget_mb * 1024 * 1024 // 2
+
+def stream_diff(source_rows, target_rows, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, spill_dir=None):
+    """Bounded-memory diff of two unsorted row streams (e.g. iter_cursor_rows of two cursors).
+
+    Both sides are externally sorted concurrently, each within half of the memory
+    budget, and the sorted streams are merge-joined; differences are yielded as soon
+    as they are found.
+    """
+    budget = side_budget_bytes(memory_budget_mb)
+    with tempfile.TemporaryDirectory(prefix="stream_diff_", dir=spill_dir) as tmp_dir:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="stream-diff-sort") as pool:
+            source_future = pool.submit(sort_side, source_rows, budget, tmp_dir)
+            target_future = pool.submit(sort_side, target_rows, budget, tmp_dir)
+            sorted_source, sorted_target = source_future.result(), target_future.result()
+        yield from merge_diff(sorted_source, sorted_target)
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
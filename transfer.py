@@ -0,0 +1,56 @@
+import time
+
+from run_profile import checkpoint
+
+# ---------- Configuration ----------
+BATCH_VIEW = "_arrow_batch"
+
+# ---------- Functions ----------
+def stream_arrow_batches_to_duckdb(batches, con, target_table_name, columns=None, temporary=False):
+    """Append Arrow record batches into a DuckDB table, keeping the source column types.
+
+    The table is (re)created from the schema of the first batch; each batch is
+    registered as a view, appended with INSERT ... SELECT and released again,
+    so only one batch is held in memory at a time. With temporary=True the table
+    is a TEMP table private to `con`.
+    """
+    start = time.perf_counter()
+    rows = 0
+    nbytes = 0
+    created = False
+    create = "CREATE OR REPLACE TEMP TABLE" if temporary else "CREATE OR REPLACE TABLE"
+    for batch in batches:
+        con.register(BATCH_VIEW, batch)
+        try:
+            if not created:
+                con.execute(f'{create} "{target_table_name}" AS SELECT * FROM {BATCH_VIEW}')
+                created = True
+            else:
+                con.execute(f'INSERT INTO "{target_table_name}" SELECT * FROM {BATCH_VIEW}')
+        finally:
+            con.unregister(BATCH_VIEW)
+        rows += batch.num_rows
+        nbytes += batch.nbytes
+        checkpoint("stage_batches", rows)
+
+    if not created and columns:
+        # Empty result: no batch carried a schema, so fall back to TEXT columns
+        col_defs = ", ".join([f'"{col}" TEXT' for col in columns])
+        con.execute(f'{create} "{target_table_name}" ({col_defs})')
+
+    seconds = time.perf_counter() - start
+    return {
+        "rows": rows,
+        "bytes": nbytes,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds > 0 else 0.0,
+    }
+
+def stream_snowflake_cursor_to_duckdb(cur, con, target_table_name, temporary=False):
+    """Stage an executed Snowflake cursor into DuckDB via Arrow result batches."""
+    columns = [desc[0] for desc in cur.description]
+    stats = stream_arrow_batches_to_duckdb(cur.fetch_arrow_batches(), con, target_table_name, columns, temporary)
+    return columns, stats
+
+def format_transfer_stats(stats):
+    return f"Staged {stats['rows']:,} rows in {stats['seconds']:.2f}s ({stats['rows_per_second']:,.0f} rows/s)"